@@ -0,0 +1,60 @@
+"""Measure time and peak Python memory of the bulk listing export.
+
+Usage::
+
+    python -m benchmarks.bench_export --listings 100000
+
+Peak memory is taken from ``tracemalloc`` and compared with building the
+whole payload as a list of dicts and serializing it in one go.
+"""
+
+import argparse
+import json
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from otodombot.db.database import init_db
+from otodombot.export import iter_export_rows, iter_ndjson
+
+from .bench_listings import populate
+
+
+def measure(label: str, func) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} {elapsed:8.2f} s  peak {peak / 2**20:8.1f} MiB  {size / 2**20:8.1f} MiB out")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--listings", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+        init_db(engine)
+        populate(engine, args.listings)
+        Session = sessionmaker(bind=engine)
+
+        def streaming() -> int:
+            return sum(len(chunk) for chunk in iter_ndjson(iter_export_rows(Session)))
+
+        def in_memory() -> int:
+            rows = list(iter_export_rows(Session))
+            return len(json.dumps(rows).encode("utf-8"))
+
+        measure("streaming NDJSON", streaming)
+        measure("list of dicts + json.dumps", in_memory)
+
+
+if __name__ == "__main__":
+    main()
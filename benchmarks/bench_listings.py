@@ -0,0 +1,140 @@
+"""Benchmark the ``/listings`` query against a synthetic database.
+
+Usage::
+
+    python -m benchmarks.bench_listings --listings 100000
+
+The database is created in a temporary file with two commute times per
+listing. The current projected query is compared with the previous
+implementation that loaded full ORM rows and lazy-loaded commutes per row.
+"""
+
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from otodombot.backend import query_listings
+from otodombot.db.database import init_db
+from otodombot.db.models import CommuteTime, Listing
+
+POIS = ["Warsaw Spire", "ul. Dobra 54, Warszawa"]
+
+
+def populate(engine, count: int, seed: int = 1) -> None:
+    rnd = random.Random(seed)
+    description = "Przestronne mieszkanie z balkonem. " * 60
+    with engine.begin() as conn:
+        for start in range(0, count, 5000):
+            ids = range(start + 1, min(start + 5000, count) + 1)
+            storeys = {i: rnd.randint(0, 10) for i in ids}
+            conn.execute(
+                insert(Listing),
+                [
+                    {
+                        "id": i,
+                        "url": f"https://www.otodom.pl/pl/oferta/bench-ID{i}",
+                        "external_id": i,
+                        "title": f"Mieszkanie {i}",
+                        "description": description,
+                        "location": "Warszawa",
+                        "floor": f"{storeys[i]}/10",
+                        "storey": storeys[i],
+                        "price": rnd.randint(400_000, 1_500_000),
+                        "lat": 52.1 + rnd.random() * 0.25 if i % 20 else None,
+                        "lng": 20.85 + rnd.random() * 0.35 if i % 20 else None,
+                        "is_good": bool(i % 3),
+                        "notes": "",
+                    }
+                    for i in ids
+                ],
+            )
+            conn.execute(
+                insert(CommuteTime),
+                [
+                    {"listing_id": i, "destination": poi, "minutes": rnd.randint(10, 90)}
+                    for i in ids
+                    for poi in POIS
+                ],
+            )
+
+
+def legacy_listings(session) -> list[dict]:
+    listings = []
+    for l in session.query(Listing).all():
+        if l.lat is None or l.lng is None:
+            continue
+        commutes = {c.destination: c.minutes for c in l.commutes}
+        listings.append(
+            {
+                "id": l.id,
+                "title": l.title,
+                "floor": l.floor,
+                "lat": l.lat,
+                "lng": l.lng,
+                "price": l.price,
+                "url": l.url,
+                "commutes": commutes,
+            }
+        )
+    return listings
+
+
+def timed(label: str, func, repeat: int) -> float:
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<40} {best * 1000:10.1f} ms  ({len(result)} rows)")
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--listings", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+        init_db(engine)
+        start = time.perf_counter()
+        populate(engine, args.listings)
+        print(f"Populated {args.listings} listings in {time.perf_counter() - start:.1f} s")
+        Session = sessionmaker(bind=engine)
+
+        def run(**filters):
+            session = Session()
+            try:
+                return query_listings(session, **filters)
+            finally:
+                session.close()
+
+        if not args.skip_legacy:
+            def legacy():
+                session = Session()
+                try:
+                    return legacy_listings(session)
+                finally:
+                    session.close()
+
+            timed("legacy ORM + lazy commutes", legacy, 1)
+        timed("projected query, all rows", run, args.repeat)
+        timed("page of 500", lambda: run(limit=500, after_id=args.listings // 2), args.repeat)
+        timed(
+            "price + commute filter",
+            lambda: run(max_price=800_000, max_commute=[(POIS[0], 40)]),
+            args.repeat,
+        )
+        timed("is_good, page of 1000", lambda: run(is_good=True, limit=1000), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
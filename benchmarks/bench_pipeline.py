@@ -0,0 +1,424 @@
+"""End-to-end throughput of ``process_listings`` against local stand-ins.
+
+Usage::
+
+    python -m benchmarks.bench_pipeline --listings 120 --latency openai=0.8 --latency google=0.15
+
+A static server serves generated otodom search and listing pages, and
+stub servers answer the OpenAI, Google Maps and Telegram APIs after a
+configurable delay. The bot is pointed at them through ``OPENAI_BASE_URL``,
+``GOOGLE_MAPS_BASE_URL`` and ``TELEGRAM_API_URL``. It then runs one full
+scrape in a temporary directory and waits for the outbox to deliver
+every announcement.
+
+The run reports listings stored per minute and p50/p95 per-listing
+latency. Latency runs from discovery to the listing being stored and is
+read from the listing traces. Peak RSS is reported for this process and
+for its finished child processes (browsers). Every run is appended to
+``benchmarks/results/pipeline.jsonl`` (git-ignored; timings are only
+comparable on one machine) and compared with the previous run that used
+the same parameters.
+
+``--http-pages`` loads pages over plain HTTP instead of Playwright, for
+machines without browsers; it then measures everything except the
+browser.
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+RESULTS = Path(__file__).parent / "results" / "pipeline.jsonl"
+PER_PAGE = 36
+POIS = ["Warsaw Spire", "ul. Dobra 54, Warszawa"]
+SERVICES = ("pages", "openai", "google", "telegram")
+
+SEARCH_PAGE = """<!DOCTYPE html><html lang="pl"><head><title>Mieszkania na sprzedaż Warszawa</title></head>
+<body><main><div data-cy="search.listing.organic"><ul>{items}</ul></div></main></body></html>"""
+SEARCH_ITEM = """<li><article data-cy="listing-item"><a data-cy="listing-item-link" href="/pl/oferta/{slug}">
+<p data-cy="listing-item-title">Mieszkanie {i}</p></a><span>{price} zł</span></article></li>"""
+LISTING_PAGE = """<!DOCTYPE html><html lang="pl"><head>
+<title>Mieszkanie {i}, 3 pokoje, Mokotów - ID{ad_id} - Otodom</title>
+<meta property="og:title" content="Mieszkanie {i}, 3 pokoje">
+<meta property="og:price:amount" content="{price}">
+<meta property="og:url" content="https://www.otodom.pl/pl/oferta/{slug}">
+</head><body><main data-sentry-element="MainContent">
+<h1 data-cy="adPageAdTitle">Mieszkanie {i}, 3 pokoje, Mokotów</h1>
+<strong data-cy="adPageHeaderPrice">{price_text} zł</strong>
+<a href="#map">Warszawa, Mokotów, ul. Puławska {street_no}</a>
+<div><p>Powierzchnia</p><p>{area} m²</p></div>
+<div><p>Piętro</p><p>{floor}/6</p></div>
+<div><p>Rok budowy</p><p>{build_year}</p></div>
+<div data-cy="adPageAdDescription">{description}</div>
+</main>
+<script id="__NEXT_DATA__" type="application/json">{next_data}</script>
+</body></html>"""
+DESCRIPTION = "Przestronne, jasne mieszkanie z balkonem i piwnicą, blisko metra. " * 25
+
+
+def listing_page(i: int) -> str:
+    price = 600_000 + (i * 7919) % 500_000
+    slug = f"mieszkanie-bench-ID{4_000_000 + i}"
+    images = [
+        {"large": f"https://ireland.apollo.olxcdn.com/v1/files/bench-{i}-{n}/image;s=1280x1024"}
+        for n in range(6)
+    ]
+    return LISTING_PAGE.format(
+        i=i,
+        ad_id=4_000_000 + i,
+        slug=slug,
+        price=price,
+        price_text=f"{price:,}".replace(",", " "),
+        street_no=i % 300 + 1,
+        floor=i % 7,
+        area=f"{38 + (i * 37) % 60},{i % 10}",
+        build_year=1960 + (i * 13) % 64,
+        description=DESCRIPTION,
+        next_data=json.dumps({"props": {"pageProps": {"ad": {"images": images}}}}),
+    )
+
+
+def search_page(page: int, total: int) -> str:
+    first = (page - 1) * PER_PAGE
+    items = [
+        SEARCH_ITEM.format(i=i, slug=f"mieszkanie-bench-ID{4_000_000 + i}", price=600_000 + (i * 7919) % 500_000)
+        for i in range(first, min(first + PER_PAGE, total))
+    ]
+    return SEARCH_PAGE.format(items="".join(items))
+
+
+def chat_completion(prompt: str) -> dict:
+    content = "ul. Puławska 15, 02-515 Warszawa"
+    if "саммари" in prompt:
+        content = "Светлая квартира с балконом у метро, цена в рынке."
+    return {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "gpt-4o",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 1000, "completion_tokens": 20, "total_tokens": 1020},
+    }
+
+
+GEOCODE = {"status": "OK", "results": [{"geometry": {"location": {"lat": 52.1934, "lng": 21.0146}}}]}
+DIRECTIONS = {
+    "status": "OK",
+    "routes": [
+        {
+            "legs": [
+                {
+                    "duration": {"value": 1680},
+                    "steps": [
+                        {"travel_mode": "WALKING", "duration": {"value": 360}},
+                        {
+                            "travel_mode": "TRANSIT",
+                            "duration": {"value": 1320},
+                            "transit_details": {"line": {"short_name": "M1", "vehicle": {"type": "SUBWAY"}}},
+                        },
+                    ],
+                }
+            ]
+        }
+    ],
+}
+
+
+def telegram_message(message_id: int) -> dict:
+    return {"message_id": message_id, "date": int(time.time()), "chat": {"id": 1, "type": "private"}}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers one stand-in service after ``latency`` seconds."""
+
+    protocol_version = "HTTP/1.1"
+    service = ""
+    latency = 0.0
+    listings = 0
+    counter = iter(range(1, 10**9))
+
+    def _reply(self, status: int, body: str, content_type: str = "application/json") -> None:
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if self.latency:
+            time.sleep(self.latency)
+        path = self.path.split("?")[0]
+        if self.service == "pages":
+            if path.startswith("/pl/oferta/"):
+                match = re.search(r"ID(\d+)$", path)
+                i = int(match.group(1)) - 4_000_000 if match else -1
+                if 0 <= i < self.listings:
+                    self._reply(200, listing_page(i), "text/html; charset=utf-8")
+                    return
+            elif path.startswith("/pl/oferty/"):
+                page = re.search(r"[?&]page=(\d+)", self.path)
+                self._reply(200, search_page(int(page.group(1)) if page else 1, self.listings), "text/html; charset=utf-8")
+                return
+            self._reply(404, "", "text/html")
+        elif self.service == "openai":
+            prompt = json.loads(body or b"{}").get("messages", [{}])[-1].get("content", "")
+            self._reply(200, json.dumps(chat_completion(prompt)))
+        elif self.service == "google":
+            self._reply(200, json.dumps(GEOCODE if path.endswith("/geocode/json") else DIRECTIONS))
+        else:
+            method = path.rsplit("/", 1)[-1]
+            if method == "getMe":
+                result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+            elif method == "sendMediaGroup":
+                result = [telegram_message(next(self.counter))]
+            else:
+                result = telegram_message(next(self.counter))
+            self._reply(200, json.dumps({"ok": True, "result": result}))
+
+    do_GET = _handle
+    do_POST = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(service: str, latency: float, listings: int) -> ThreadingHTTPServer:
+    handler = type(f"{service.title()}Handler", (StubHandler,), {"service": service, "latency": latency, "listings": listings})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=f"stub-{service}", daemon=True).start()
+    return server
+
+
+def http_page_crawler():
+    from otodombot.scraper.crawler import OtodomCrawler, parse_search_card
+
+    class HttpPageCrawler(OtodomCrawler):
+        """Loads pages with urllib; the parsers are the real ones."""
+
+        def _search_page_cards(self, url: str) -> list:
+            with self.limiter, urllib.request.urlopen(url) as response:
+                html = response.read().decode("utf-8")
+            cards = []
+            for article in re.findall(r"<article[^>]*>(.*?)</article>", html, re.S):
+                href = re.search(r'href="([^"]+)"', article).group(1)
+                text = re.sub(r"<[^>]+>", "\n", article)
+                cards.append(parse_search_card(urllib.parse.urljoin(url, href), text))
+            return cards
+
+        def fetch_listing_details(self, url: str) -> str:
+            with self.limiter, urllib.request.urlopen(url) as response:
+                return response.read().decode("utf-8")
+
+    return HttpPageCrawler
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(int(round(q / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def trace_latencies(directory: Path) -> list[float]:
+    latencies = []
+    for path in directory.glob("*.json"):
+        events = [e for e in json.loads(path.read_text())["traceEvents"] if e["ph"] == "X"]
+        if events:
+            latencies.append(max(e["ts"] + e["dur"] for e in events) / 1e6)
+    return latencies
+
+
+def peak_rss_mib(who: int) -> float:
+    peak = resource.getrusage(who).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def git_revision() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=Path(__file__).parent, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def parse_latencies(values: list[str]) -> dict[str, float]:
+    latencies = {"pages": 0.05, "openai": 0.8, "google": 0.15, "telegram": 0.1}
+    for value in values:
+        service, sep, seconds = value.partition("=")
+        if not sep or service not in SERVICES:
+            raise SystemExit(f"--latency expects SERVICE=SECONDS with SERVICE in {SERVICES}, got {value}")
+        latencies[service] = float(seconds)
+    return latencies
+
+
+def run(args, latencies: dict[str, float], workdir: Path) -> dict:
+    stubs = {service: start_stub(service, latencies[service], args.listings) for service in SERVICES}
+    url = {service: f"http://127.0.0.1:{server.server_address[1]}" for service, server in stubs.items()}
+    os.environ.update(
+        {
+            "OTODOMBOT_DB_URL": f"sqlite:///{workdir / 'bench.db'}",
+            "OPENAI_API_KEY": "sk-bench",
+            "OPENAI_BASE_URL": url["openai"] + "/v1",
+            "GOOGLE_API_KEY": "AIza-bench",
+            "GOOGLE_MAPS_BASE_URL": url["google"],
+            "TELEGRAM_TOKEN": "123456:bench",
+            "TELEGRAM_API_URL": url["telegram"] + "/bot",
+            "TELEGRAM_CHAT_ID": ",".join(str(1000 + n) for n in range(args.chats)),
+        }
+    )
+    trace_dir = workdir / "traces"
+    pages = -(-args.listings // PER_PAGE)
+    config = {
+        "search": {"sorts": ["DEFAULT"]},
+        "base_url": url["pages"] + "/pl/oferty/sprzedaz/mieszkanie/warszawa",
+        "max_pages": pages,
+        "max_browsers": args.max_browsers,
+        "commute": {"pois": POIS, "thresholds": {poi: 90 for poi in POIS}},
+        "notifications": {"mode": "instant"},
+        "pipeline": {"fetch_workers": args.fetch_workers, "enrich_workers": args.enrich_workers},
+        "metrics": {"port": 0, "trace_dir": str(trace_dir)},
+    }
+    (workdir / "config.json").write_text(json.dumps(config))
+    os.chdir(workdir)
+
+    # imported only now: the database URL and config path are read at import and call time
+    from otodombot.config import load_config
+    from otodombot.db.database import SessionLocal, init_db
+    from otodombot.db.models import Listing, NotificationOutbox
+    from otodombot.notifications.outbox import start_outbox_worker, stop_outbox_worker
+    from otodombot.notifications.telegram_bot import get_notifier, shutdown_notifiers
+    from otodombot.scheduler import tasks
+
+    if args.http_pages:
+        tasks.OtodomCrawler = http_page_crawler()
+    init_db()
+    start_outbox_worker(get_notifier(os.environ["TELEGRAM_TOKEN"]), settings=load_config().notifications)
+
+    start = time.perf_counter()
+    stats = tasks.process_listings()
+    scrape_seconds = time.perf_counter() - start
+    session = SessionLocal()
+    try:
+        while session.query(NotificationOutbox).filter_by(status="pending").count():
+            time.sleep(0.2)
+            session.rollback()
+        delivered_seconds = time.perf_counter() - start
+        stored = session.query(Listing).count()
+        sent = session.query(NotificationOutbox).filter_by(status="sent").count()
+    finally:
+        session.close()
+    stop_outbox_worker()
+    shutdown_notifiers()
+    for server in stubs.values():
+        server.shutdown()
+
+    latencies = trace_latencies(trace_dir)
+    return {
+        "stored": stored,
+        "messages_sent": sent,
+        "scrape_seconds": round(scrape_seconds, 2),
+        "delivered_seconds": round(delivered_seconds, 2),
+        "listings_per_minute": round(stored / scrape_seconds * 60, 1) if scrape_seconds else None,
+        "latency_p50": round(percentile(latencies, 50), 3) if latencies else None,
+        "latency_p95": round(percentile(latencies, 95), 3) if latencies else None,
+        "peak_rss_mib": round(peak_rss_mib(resource.RUSAGE_SELF), 1),
+        "peak_child_rss_mib": round(peak_rss_mib(resource.RUSAGE_CHILDREN), 1),
+        "bottleneck": max(
+            (s for stage_stats in stats.values() for s in stage_stats), key=lambda s: s["utilization"], default={}
+        ).get("name"),
+    }
+
+
+def previous_result(params: dict) -> dict | None:
+    if not RESULTS.exists():
+        return None
+    previous = None
+    for line in RESULTS.read_text().splitlines():
+        entry = json.loads(line)
+        if entry.get("params") == params:
+            previous = entry
+    return previous
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--listings", type=int, default=120)
+    parser.add_argument("--chats", type=int, default=2)
+    parser.add_argument(
+        "--latency", action="append", default=[], metavar="SERVICE=SECONDS",
+        help=f"response delay of a stand-in, SERVICE one of {', '.join(SERVICES)}",
+    )
+    parser.add_argument("--fetch-workers", type=int, default=2)
+    parser.add_argument("--enrich-workers", type=int, default=4)
+    parser.add_argument("--max-browsers", type=int, default=2)
+    parser.add_argument("--http-pages", action="store_true", help="load pages with urllib instead of Playwright")
+    parser.add_argument("--no-save", action="store_true", help=f"do not append the result to {RESULTS.name}")
+    args = parser.parse_args()
+    latencies = parse_latencies(args.latency)
+    params = {
+        "listings": args.listings,
+        "chats": args.chats,
+        "latency": latencies,
+        "fetch_workers": args.fetch_workers,
+        "enrich_workers": args.enrich_workers,
+        "max_browsers": args.max_browsers,
+        "http_pages": args.http_pages,
+    }
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            result = run(args, latencies, Path(tmp))
+        finally:
+            os.chdir(cwd)
+
+    print(f"stored {result['stored']} listings in {result['scrape_seconds']} s, "
+          f"{result['messages_sent']} messages delivered after {result['delivered_seconds']} s")
+    print(f"listings/min   {result['listings_per_minute']}")
+    print(f"latency p50    {result['latency_p50']} s")
+    print(f"latency p95    {result['latency_p95']} s")
+    print(f"peak RSS       {result['peak_rss_mib']} MiB (children {result['peak_child_rss_mib']} MiB)")
+    print(f"bottleneck     {result['bottleneck']}")
+
+    previous = previous_result(params)
+    if previous and previous["result"].get("listings_per_minute"):
+        before = previous["result"]["listings_per_minute"]
+        change = (result["listings_per_minute"] - before) / before * 100
+        print(f"vs {previous.get('revision') or 'previous run'}: {before} listings/min ({change:+.1f}%)")
+    if not args.no_save:
+        RESULTS.parent.mkdir(exist_ok=True)
+        entry = {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(), "name": socket.gethostname()},
+            "params": params,
+            "result": result,
+        }
+        with RESULTS.open("a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Benchmark full-text search latency on a synthetic database.
+
+Usage::
+
+    python -m benchmarks.bench_search --listings 100000
+"""
+
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from otodombot.db.database import init_db
+from otodombot.db.models import Listing
+from otodombot.db.search import ensure_search_index, search_listings
+
+# (word, share of listings mentioning it)
+FEATURES = [
+    ("balkon", 0.45),
+    ("garaż", 0.15),
+    ("piwnica", 0.3),
+    ("winda", 0.4),
+    ("metro", 0.25),
+    ("taras", 0.08),
+    ("ogród", 0.05),
+    ("Marszałkowska", 0.01),
+    ("Żółkiewskiego", 0.002),
+    ("Puławska", 0.02),
+]
+QUERIES = ["balkon", "garaz", "zolkiewskiego", "metro balkon", "marszałk", "taras ogród winda"]
+
+
+def _filler_vocabulary(rnd: random.Random, size: int = 20000) -> list[str]:
+    syllables = ["ka", "mie", "sz", "ra", "no", "wy", "po", "dla", "ście", "ło", "ją", "ce", "ty", "ko"]
+    return ["".join(rnd.choices(syllables, k=rnd.randint(2, 4))) for _ in range(size)]
+
+
+def populate(engine, count: int, seed: int = 1) -> None:
+    rnd = random.Random(seed)
+    filler = _filler_vocabulary(rnd)
+    # Zipf-like weights so a few filler words are very common, as in real text
+    weights = [1 / (rank + 1) for rank in range(len(filler))]
+
+    def text_of(length: int) -> str:
+        words = rnd.choices(filler, weights=weights, k=length)
+        for word, share in FEATURES:
+            if rnd.random() < share:
+                words.insert(rnd.randrange(len(words) + 1), word)
+        return " ".join(words)
+
+    with engine.begin() as conn:
+        for start in range(0, count, 5000):
+            conn.execute(
+                insert(Listing),
+                [
+                    {
+                        "id": i,
+                        "url": f"https://www.otodom.pl/pl/oferta/bench-ID{i}",
+                        "title": " ".join(rnd.choices(filler, weights=weights, k=6)),
+                        "description": text_of(150),
+                        "notes": text_of(20),
+                        "price": rnd.randint(400_000, 1_500_000),
+                    }
+                    for i in range(start + 1, min(start + 5000, count) + 1)
+                ],
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--listings", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+        init_db(engine)
+        populate(engine, args.listings)
+        start = time.perf_counter()
+        ensure_search_index(engine)
+        print(f"Indexed {args.listings} listings in {time.perf_counter() - start:.1f} s")
+        session = sessionmaker(bind=engine)()
+        for query in QUERIES:
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                results = search_listings(session, query, limit=20)
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            print(
+                f"{query!r:<24} p50 {timings[len(timings) // 2] * 1000:7.2f} ms  "
+                f"max {timings[-1] * 1000:7.2f} ms  ({len(results)} results)"
+            )
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
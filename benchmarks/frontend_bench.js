@@ -0,0 +1,101 @@
+// Browser-free benchmark for the sidebar sort and render logic.
+//
+// Usage: node benchmarks/frontend_bench.js [listings]
+//
+// Compares the previous approach (copy and re-sort the whole array, then
+// build one card per listing) with frontend/listing_view.js (cached per-POI
+// order and a rendered window of visible rows only).
+const { ListingStore, visibleRange, windowRows } = require('../frontend/listing_view.js');
+
+const COUNT = parseInt(process.argv[2] || '20000', 10);
+const POIS = ['Warsaw Spire', 'ul. Dobra 54, Warszawa'];
+const ROW_HEIGHT = 80;
+const VIEWPORT = 900;
+
+let seed = 1;
+function random() {
+  seed = (seed * 16807) % 2147483647;
+  return seed / 2147483647;
+}
+
+function makeListing(id) {
+  const commutes = {};
+  POIS.forEach(p => {
+    commutes[p] = random() < 0.05 ? null : Math.floor(10 + random() * 80);
+  });
+  return {
+    id,
+    title: `Mieszkanie ${id}`,
+    price: Math.floor(400000 + random() * 1000000),
+    lat: 52.1 + random() * 0.25,
+    lng: 20.85 + random() * 0.35,
+    url: `https://www.otodom.pl/pl/oferta/bench-ID${id}`,
+    commutes,
+  };
+}
+
+function legacyRender(listings, dest) {
+  const arr = listings.slice();
+  if (dest) {
+    arr.sort((a, b) => {
+      const av = a.commutes && a.commutes[dest] !== undefined && a.commutes[dest] !== null ? a.commutes[dest] : Infinity;
+      const bv = b.commutes && b.commutes[dest] !== undefined && b.commutes[dest] !== null ? b.commutes[dest] : Infinity;
+      return av - bv;
+    });
+  }
+  // stand-in for creating one DOM card per listing
+  return arr.map(l => ({ id: l.id, title: l.title, text: `${l.price}` }));
+}
+
+function windowedRender(store, dest, scrollTop) {
+  const range = visibleRange(scrollTop, VIEWPORT, ROW_HEIGHT, store.size);
+  return windowRows(store, dest, range, ROW_HEIGHT);
+}
+
+function time(label, fn, repeat = 20) {
+  fn();
+  const samples = [];
+  for (let i = 0; i < repeat; i++) {
+    const start = process.hrtime.bigint();
+    fn();
+    samples.push(Number(process.hrtime.bigint() - start) / 1e6);
+  }
+  samples.sort((a, b) => a - b);
+  const p50 = samples[Math.floor(samples.length / 2)];
+  console.log(`${label.padEnd(44)} p50 ${p50.toFixed(3).padStart(9)} ms  max ${samples[samples.length - 1].toFixed(3).padStart(9)} ms`);
+}
+
+const listings = Array.from({ length: COUNT }, (_, i) => makeListing(i + 1));
+console.log(`${COUNT} listings`);
+
+time('legacy: sort change (copy + sort + cards)', () => legacyRender(listings, POIS[0]));
+time('new: build store', () => new ListingStore(listings), 5);
+time('new: first sort for a POI', () => new ListingStore(listings).order(POIS[0]), 5);
+
+const store = new ListingStore(listings);
+POIS.forEach(p => store.order(p));
+let flip = 0;
+time('new: sort change (cached order + window)', () => windowedRender(store, POIS[flip++ % 2], 0));
+time('new: scroll to middle', () => windowedRender(store, POIS[0], (COUNT / 2) * ROW_HEIGHT));
+
+let nextId = COUNT + 1;
+time('legacy: apply 50 upserts (re-render)', () => {
+  for (let i = 0; i < 50; i++) {
+    listings.push(makeListing(nextId++));
+  }
+  legacyRender(listings, POIS[0]);
+});
+time('new: apply 50 upserts (patch + window)', () => {
+  for (let i = 0; i < 50; i++) {
+    store.upsert(makeListing(nextId++));
+  }
+  windowedRender(store, POIS[0], 0);
+});
+
+// sanity check: incremental order matches a fresh sort
+const fresh = new ListingStore(Array.from(store.byId.values())).order(POIS[0]);
+const patched = store.order(POIS[0]);
+if (fresh.length !== patched.length || fresh.some((id, i) => id !== patched[i])) {
+  console.error('incremental order diverged from full sort');
+  process.exit(1);
+}
@@ -0,0 +1,143 @@
+// Data and layout logic for the listing sidebar, kept free of DOM access so
+// it can be benchmarked in Node (see benchmarks/frontend_bench.js).
+(function (root) {
+  function commuteKey(listing, dest) {
+    const value = listing.commutes ? listing.commutes[dest] : undefined;
+    return value === undefined || value === null ? Infinity : value;
+  }
+
+  // Holds listings by id and keeps one sorted id order per destination.
+  // Sort keys are computed once per listing and destination; upserts and
+  // removals patch the cached orders with a binary search instead of
+  // re-sorting the whole array.
+  class ListingStore {
+    constructor(listings) {
+      this.byId = new Map();
+      this.insertion = [];
+      this.orders = new Map();
+      (listings || []).forEach(l => {
+        this.byId.set(l.id, l);
+        this.insertion.push(l.id);
+      });
+    }
+
+    get size() {
+      return this.byId.size;
+    }
+
+    destinations() {
+      const dests = new Set();
+      this.byId.forEach(l => {
+        if (l.commutes) {
+          Object.keys(l.commutes).forEach(d => dests.add(d));
+        }
+      });
+      return Array.from(dests);
+    }
+
+    // Sorted array of ids for `dest`, or insertion order when no dest.
+    order(dest) {
+      if (!dest) {
+        return this.insertion;
+      }
+      let cached = this.orders.get(dest);
+      if (!cached) {
+        const pairs = this.insertion.map(id => [commuteKey(this.byId.get(id), dest), id]);
+        pairs.sort((a, b) => a[0] - b[0] || a[1] - b[1]);
+        const keys = new Map();
+        pairs.forEach(p => keys.set(p[1], p[0]));
+        cached = { ids: pairs.map(p => p[1]), keys };
+        this.orders.set(dest, cached);
+      }
+      return cached.ids;
+    }
+
+    _position(cached, id, key) {
+      let lo = 0;
+      let hi = cached.ids.length;
+      while (lo < hi) {
+        const mid = (lo + hi) >> 1;
+        const other = cached.ids[mid];
+        const otherKey = cached.keys.get(other);
+        if (otherKey < key || (otherKey === key && other < id)) {
+          lo = mid + 1;
+        } else {
+          hi = mid;
+        }
+      }
+      return lo;
+    }
+
+    upsert(listing) {
+      const isNew = !this.byId.has(listing.id);
+      if (!isNew) {
+        this._detach(listing.id);
+      } else {
+        this.insertion.push(listing.id);
+      }
+      this.byId.set(listing.id, listing);
+      this.orders.forEach((cached, dest) => {
+        const key = commuteKey(listing, dest);
+        cached.keys.set(listing.id, key);
+        cached.ids.splice(this._position(cached, listing.id, key), 0, listing.id);
+      });
+      return isNew;
+    }
+
+    remove(id) {
+      if (!this.byId.has(id)) {
+        return false;
+      }
+      this._detach(id);
+      this.byId.delete(id);
+      const idx = this.insertion.indexOf(id);
+      if (idx >= 0) {
+        this.insertion.splice(idx, 1);
+      }
+      return true;
+    }
+
+    _detach(id) {
+      this.orders.forEach(cached => {
+        const key = cached.keys.get(id);
+        const idx = this._position(cached, id, key);
+        if (cached.ids[idx] === id) {
+          cached.ids.splice(idx, 1);
+        }
+        cached.keys.delete(id);
+      });
+    }
+  }
+
+  // Index range [start, end) of rows to render for a scroll position.
+  function visibleRange(scrollTop, viewportHeight, rowHeight, total, overscan) {
+    const extra = overscan === undefined ? 5 : overscan;
+    const first = Math.floor(scrollTop / rowHeight);
+    const start = Math.max(0, first - extra);
+    const end = Math.min(total, Math.ceil((scrollTop + viewportHeight) / rowHeight) + extra);
+    return { start, end: Math.max(start, end) };
+  }
+
+  // Description of the cards to show: listing, its offset and the label text.
+  function windowRows(store, dest, range, rowHeight) {
+    const ids = store.order(dest);
+    const rows = [];
+    for (let i = range.start; i < range.end && i < ids.length; i++) {
+      const l = store.byId.get(ids[i]);
+      let label = `${l.price}`;
+      const minutes = dest ? commuteKey(l, dest) : Infinity;
+      if (minutes !== Infinity) {
+        label += ` (${minutes} min)`;
+      }
+      rows.push({ listing: l, top: i * rowHeight, label });
+    }
+    return rows;
+  }
+
+  const api = { ListingStore, visibleRange, windowRows, commuteKey };
+  if (typeof module !== 'undefined' && module.exports) {
+    module.exports = api;
+  } else {
+    root.ListingView = api;
+  }
+})(typeof self !== 'undefined' ? self : this);
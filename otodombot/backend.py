@@ -1,10 +1,26 @@
-from fastapi import FastAPI
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import exists, select
+from typing import Literal
+import asyncio
+import json
 import logging
+import math
+import threading
+import time
 import uvicorn
 
+from . import metrics
 from .db.database import init_db, SessionLocal
-from .db.models import Listing, CommuteTime
+from .db.models import Listing, CommuteTime, ListingTombstone, SearchRun, parse_storey
+from .db.search import search_listings
+from .db.versioning import current_version
+from .export import EXPORT_COLUMNS, iter_csv, iter_export_rows, iter_ndjson
+from .spatial import GridIndex, MapPoint
 
 app = FastAPI(title="Otodom Listings API")
 
@@ -13,38 +29,353 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Last-Modified", "X-Data-Version"],
 )
 
+REQUEST_SECONDS = metrics.histogram(
+    "otodombot_http_request_seconds", "API request latency by route", ("method", "route", "status")
+)
+
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - start,
+        method=request.method,
+        # the route template keeps listing ids out of the label values
+        route=getattr(route, "path", "unmatched"),
+        status=str(response.status_code),
+    )
+    return response
+
 @app.on_event("startup")
 def on_startup():
     logging.info("Initializing database")
     init_db()
 
+def _parse_max_commute(values: list[str] | None) -> list[tuple[str, int]]:
+    """Parse ``POI:minutes`` query values."""
+    limits = []
+    for value in values or []:
+        poi, sep, minutes = value.rpartition(":")
+        if not sep or not poi or not minutes.strip().isdigit():
+            raise HTTPException(status_code=400, detail=f"Invalid max_commute value: {value}")
+        limits.append((poi, int(minutes)))
+    return limits
+
+
+def _parse_floors(values: list[str] | None) -> list[int] | None:
+    """Parse ``floor`` query values such as ``3``, ``3/6`` or ``parter`` into storeys."""
+    if not values:
+        return None
+    storeys = []
+    for value in values:
+        storey = parse_storey(value)
+        if storey is None:
+            raise HTTPException(status_code=400, detail=f"Invalid floor value: {value}")
+        storeys.append(storey)
+    return storeys
+
+
+def query_listings(
+    session,
+    min_price: int | None = None,
+    max_price: int | None = None,
+    floors: list[int] | None = None,
+    max_commute: list[tuple[str, int]] | None = None,
+    is_good: bool | None = None,
+    after_id: int | None = None,
+    limit: int | None = None,
+    since_version: int | None = None,
+    sort: str = "id",
+) -> list[dict]:
+    """Return map listings matching the filters, ordered by id or best score first.
+
+    Only the columns needed by the map are selected and commutes are joined
+    in the same statement, so a page costs one query regardless of its size.
+    """
+    stmt = select(
+        Listing.id,
+        Listing.title,
+        Listing.floor,
+        Listing.lat,
+        Listing.lng,
+        Listing.price,
+        Listing.price_per_m2,
+        Listing.score,
+        Listing.url,
+    ).where(Listing.lat.isnot(None), Listing.lng.isnot(None))
+    if since_version is not None:
+        stmt = stmt.where(Listing.version > since_version)
+    if min_price is not None:
+        stmt = stmt.where(Listing.price >= min_price)
+    if max_price is not None:
+        stmt = stmt.where(Listing.price <= max_price)
+    if floors:
+        stmt = stmt.where(Listing.storey.in_(floors))
+    if is_good is not None:
+        stmt = stmt.where(Listing.is_good == is_good)
+    for poi, minutes in max_commute or []:
+        stmt = stmt.where(
+            exists().where(
+                CommuteTime.listing_id == Listing.id,
+                CommuteTime.destination == poi,
+                CommuteTime.minutes <= minutes,
+            )
+        )
+    if after_id is not None:
+        stmt = stmt.where(Listing.id > after_id)
+    if sort == "score":
+        stmt = stmt.order_by(Listing.score.desc().nulls_last(), Listing.id)
+    else:
+        stmt = stmt.order_by(Listing.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    page = stmt.subquery()
+    joined = select(page, CommuteTime.destination, CommuteTime.minutes).outerjoin(
+        CommuteTime, CommuteTime.listing_id == page.c.id
+    )
+    if sort == "score":
+        joined = joined.order_by(page.c.score.desc().nulls_last(), page.c.id)
+    else:
+        joined = joined.order_by(page.c.id)
+    listings: list[dict] = []
+    current = None
+    for row in session.execute(joined):
+        if current is None or current["id"] != row.id:
+            current = {
+                "id": row.id,
+                "title": row.title,
+                "floor": row.floor,
+                "lat": row.lat,
+                "lng": row.lng,
+                "price": row.price,
+                "price_per_m2": row.price_per_m2,
+                "score": row.score,
+                "url": row.url,
+                "commutes": {},
+            }
+            listings.append(current)
+        if row.destination is not None:
+            current["commutes"][row.destination] = row.minutes
+    return listings
+
+
+def _validators(version: int, updated_at: datetime | None) -> dict[str, str]:
+    headers = {
+        "ETag": f'W/"{version}"',
+        "X-Data-Version": str(version),
+        "Cache-Control": "no-cache",
+    }
+    if updated_at is not None:
+        headers["Last-Modified"] = format_datetime(updated_at.replace(microsecond=0, tzinfo=timezone.utc), usegmt=True)
+    return headers
+
+
+def _not_modified(request: Request, headers: dict[str, str]) -> bool:
+    """Return True if the client's cached copy matches the current data version."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {t.strip() for t in if_none_match.split(",")}
+        return "*" in tags or headers["ETag"] in tags or headers["ETag"][2:] in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    last_modified = headers.get("Last-Modified")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
 @app.get("/listings")
-def get_listings():
+def get_listings(
+    request: Request,
+    response: Response,
+    min_price: int | None = None,
+    max_price: int | None = None,
+    floor: list[str] | None = Query(None),
+    max_commute: list[str] | None = Query(None),
+    is_good: bool | None = None,
+    after_id: int | None = None,
+    limit: int | None = Query(None, ge=1, le=10000),
+    sort: Literal["id", "score"] = "id",
+):
     logging.info("Fetching listings from database")
+    commute_limits = _parse_max_commute(max_commute)
+    storeys = _parse_floors(floor)
+    if sort == "score" and after_id is not None:
+        raise HTTPException(status_code=400, detail="after_id paging is only available with sort=id")
     session = SessionLocal()
-    listings = []
-    for l in session.query(Listing).all():
-        if l.lat is None or l.lng is None:
-            continue
-        commutes = {c.destination: c.minutes for c in l.commutes}
-        listings.append(
-            {
-                "id": l.id,
-                "title": l.title,
-                "floor": l.floor,
-                "lat": l.lat,
-                "lng": l.lng,
-                "price": l.price,
-                "url": l.url,
-                "commutes": commutes,
-            }
+    try:
+        headers = _validators(*current_version(session))
+        if _not_modified(request, headers):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        listings = query_listings(
+            session,
+            min_price=min_price,
+            max_price=max_price,
+            floors=storeys,
+            max_commute=commute_limits,
+            is_good=is_good,
+            after_id=after_id,
+            limit=limit,
+            sort=sort,
         )
-    session.close()
+    finally:
+        session.close()
+    if sort == "id" and limit is not None and len(listings) == limit:
+        response.headers["X-Next-Cursor"] = str(listings[-1]["id"])
     logging.info("Returned %d listings", len(listings))
     return listings
 
+
+def listing_changes(session, since: int, version: int) -> dict:
+    """Return listings upserted or removed between ``since`` and ``version``."""
+    if since >= version:
+        return {"version": version, "upserted": [], "removed": []}
+    upserted = query_listings(session, since_version=since)
+    removed = [
+        listing_id
+        for (listing_id,) in session.execute(
+            select(ListingTombstone.listing_id).where(ListingTombstone.version > since)
+        )
+    ]
+    return {"version": version, "upserted": upserted, "removed": removed}
+
+
+@app.get("/listings/changes")
+def get_listing_changes(request: Request, response: Response, since: int = Query(..., ge=0)):
+    """Return listings inserted, updated or removed after data version ``since``."""
+    logging.info("Fetching listing changes since version %s", since)
+    session = SessionLocal()
+    try:
+        version, updated_at = current_version(session)
+        headers = _validators(version, updated_at)
+        if _not_modified(request, headers):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return listing_changes(session, since, version)
+    finally:
+        session.close()
+
+
+def _poll_changes(since: int | None) -> tuple[int, dict | None]:
+    session = SessionLocal()
+    try:
+        version, _ = current_version(session)
+        if since is None or version <= since:
+            return version, None
+        return version, listing_changes(session, since, version)
+    finally:
+        session.close()
+
+
+async def listing_events(
+    since: int | None,
+    is_disconnected,
+    poll_interval: float = 2.0,
+    heartbeat: float = 15.0,
+):
+    """Yield Server-Sent Events with listing changes after version ``since``.
+
+    The scraper runs in another process, so commits are detected by polling
+    the data version row, which costs a single primary key lookup. Each event
+    carries the new data version as its ID so that a reconnecting client
+    resumes from where it stopped. Without ``since`` streaming starts at the
+    current version.
+    """
+    yield f"retry: {int(poll_interval * 2000)}\n\n"
+    idle = 0.0
+    while not await is_disconnected():
+        version, changes = await run_in_threadpool(_poll_changes, since)
+        if since is None:
+            since = version
+        if changes is not None:
+            since = version
+            idle = 0.0
+            logging.info(
+                "Pushing %d upserted and %d removed listings at version %d",
+                len(changes["upserted"]),
+                len(changes["removed"]),
+                version,
+            )
+            yield f"id: {version}\nevent: changes\ndata: {json.dumps(changes)}\n\n"
+        elif idle >= heartbeat:
+            idle = 0.0
+            yield ": keep-alive\n\n"
+        await asyncio.sleep(poll_interval)
+        idle += poll_interval
+
+
+@app.get("/listings/stream")
+async def stream_listings(
+    request: Request,
+    since: int | None = Query(None, ge=0),
+    last_event_id: str | None = Header(None),
+):
+    """Push inserted, updated and removed listings as Server-Sent Events."""
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    logging.info("Client subscribed to listing stream from version %s", since)
+    return StreamingResponse(
+        listing_events(since, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+_spatial_index: tuple[int, GridIndex] | None = None
+_spatial_lock = threading.Lock()
+
+
+def spatial_index(session, version: int) -> GridIndex:
+    """Return the grid index for ``version``, rebuilding it when data changed."""
+    global _spatial_index
+    with _spatial_lock:
+        if _spatial_index is None or _spatial_index[0] != version:
+            points = [
+                MapPoint(l["id"], l["lat"], l["lng"], l["price"], l["commutes"])
+                for l in query_listings(session)
+            ]
+            _spatial_index = (version, GridIndex(points))
+            logging.info("Built spatial index with %d listings at version %d", len(points), version)
+        return _spatial_index[1]
+
+
+@app.get("/listings/clusters")
+def get_listing_clusters(
+    request: Request,
+    response: Response,
+    bbox: str = Query(..., description="west,south,east,north"),
+    zoom: int = Query(..., ge=0, le=22),
+):
+    """Return pre-aggregated listing clusters for the visible map area."""
+    try:
+        west, south, east, north = (float(v) for v in bbox.split(","))
+        if not all(math.isfinite(v) for v in (west, south, east, north)):
+            raise ValueError(bbox)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid bbox: {bbox}")
+    session = SessionLocal()
+    try:
+        version, updated_at = current_version(session)
+        headers = _validators(version, updated_at)
+        if _not_modified(request, headers):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        index = spatial_index(session, version)
+    finally:
+        session.close()
+    clusters = index.clusters(south, west, north, east, zoom)
+    logging.info("Returned %d clusters for zoom %d", len(clusters), zoom)
+    return clusters
+
+
 @app.get("/listings/{listing_id}")
 def get_listing(listing_id: int):
     logging.info("Fetching listing %s", listing_id)
@@ -61,6 +392,10 @@ def get_listing(listing_id: int):
         "location": listing.location,
         "floor": listing.floor,
         "price": listing.price,
+        "area": listing.area,
+        "build_year": listing.build_year,
+        "price_per_m2": listing.price_per_m2,
+        "score": listing.score,
         "lat": listing.lat,
         "lng": listing.lng,
         "notes": listing.notes,
@@ -68,6 +403,80 @@ def get_listing(listing_id: int):
         "commutes": {c.destination: c.minutes for c in listing.commutes},
     }
 
+@app.get("/search")
+def search(q: str = Query(..., min_length=1), limit: int = Query(20, ge=1, le=200)):
+    """Full-text search over listing titles, descriptions and notes."""
+    logging.info("Searching listings for %r", q)
+    session = SessionLocal()
+    try:
+        results = search_listings(session, q, limit=limit)
+    finally:
+        session.close()
+    logging.info("Search for %r returned %d listings", q, len(results))
+    return results
+
+
+@app.get("/searches/runs")
+def get_search_runs(search: str | None = None, limit: int = Query(50, ge=1, le=1000)):
+    """Recent scheduled search runs with their duration and chosen next interval."""
+    session = SessionLocal()
+    try:
+        query = session.query(SearchRun)
+        if search:
+            query = query.filter(SearchRun.search == search)
+        runs = query.order_by(SearchRun.started_at.desc()).limit(limit).all()
+        return [
+            {
+                "search": r.search,
+                "started_at": r.started_at.isoformat() if r.started_at else None,
+                "finished_at": r.finished_at.isoformat() if r.finished_at else None,
+                "duration_seconds": r.duration_seconds,
+                "seen_listings": r.seen_listings,
+                "new_listings": r.new_listings,
+                "arrival_rate": r.arrival_rate,
+                "next_interval_minutes": r.next_interval_minutes,
+                "error": r.error,
+            }
+            for r in runs
+        ]
+    finally:
+        session.close()
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Prometheus metrics of this process in the text exposition format."""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/export")
+def export_listings(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    include_description: bool = False,
+):
+    """Stream every listing with price and commutes as NDJSON or CSV."""
+    logging.info("Exporting listings as %s", format)
+    rows = iter_export_rows(SessionLocal, include_description=include_description)
+    if format == "csv":
+        session = SessionLocal()
+        try:
+            destinations = [
+                d
+                for (d,) in session.execute(
+                    select(CommuteTime.destination).distinct().order_by(CommuteTime.destination)
+                )
+            ]
+        finally:
+            session.close()
+        columns = EXPORT_COLUMNS + (["description"] if include_description else [])
+        return StreamingResponse(
+            iter_csv(rows, columns, destinations),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="listings.csv"'},
+        )
+    return StreamingResponse(iter_ndjson(rows), media_type="application/x-ndjson")
+
+
 def main():
     logging.basicConfig(
         level=logging.INFO,
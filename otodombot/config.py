@@ -6,6 +6,41 @@ import json
 
 DEFAULT_BASE_URL = "https://www.otodom.pl/pl/oferty/sprzedaz/mieszkanie,rynek-wtorny/warszawa"
 
+# values of otodom's ``floors`` filter, lowest first
+FLOOR_FILTERS = (
+    "CELLAR",
+    "GROUND",
+    "FIRST",
+    "SECOND",
+    "THIRD",
+    "FOURTH",
+    "FIFTH",
+    "SIXTH",
+    "SEVENTH",
+    "EIGHTH",
+    "NINTH",
+    "TENTH",
+    "ABOVE_TENTH",
+    "GARRET",
+)
+FLOOR_ALIASES = {"suterena": "CELLAR", "parter": "GROUND", "poddasze": "GARRET"}
+
+
+def floor_filter(value) -> str:
+    """Map a storey number, Polish floor name or otodom value to otodom's ``floors`` value."""
+    if isinstance(value, int) or (isinstance(value, str) and value.strip().lstrip("-").isdigit()):
+        storey = int(value)
+        if storey < 0:
+            return "CELLAR"
+        return FLOOR_FILTERS[min(storey, 11) + 1]
+    text = str(value).strip()
+    if text.lower() in FLOOR_ALIASES:
+        return FLOOR_ALIASES[text.lower()]
+    if text.upper() in FLOOR_FILTERS:
+        return text.upper()
+    raise ValueError(f"Unknown floor filter: {value!r}")
+
+
 @dataclass
 class SearchConditions:
     max_price: Optional[int] = None
@@ -14,6 +49,41 @@ class SearchConditions:
     sorts: List[str] = field(default_factory=lambda: ["DEFAULT"])
     build_year_min: Optional[int] = None
     ignore_floors: List[str] = field(default_factory=list)
+    min_price: Optional[int] = None
+    max_area: Optional[int] = None
+    min_price_per_m2: Optional[int] = None
+    max_price_per_m2: Optional[int] = None
+    build_year_max: Optional[int] = None
+    # otodom ``floors`` values, see FLOOR_FILTERS
+    floors: Optional[List[str]] = None
+    # district names matched against the address on search cards
+    districts: List[str] = field(default_factory=list)
+
+    def ignored_floor_filters(self) -> set[str]:
+        """The ``floors`` values ``ignore_floors`` rules out as whole storeys.
+
+        Values otodom cannot express, such as ``"3/6"``, are left to the
+        check after the detail page is parsed.
+        """
+        ignored = set()
+        for value in self.ignore_floors:
+            try:
+                name = floor_filter(value)
+            except ValueError:
+                continue
+            # "11" must not rule out every storey above the tenth
+            if name != "ABOVE_TENTH" or value.upper() == name:
+                ignored.add(name)
+        return ignored
+
+    def floor_filters(self) -> Optional[List[str]]:
+        """The ``floors`` values to request; without ``floors`` all but the ignored ones."""
+        if self.floors:
+            return self.floors
+        ignored = self.ignored_floor_filters()
+        if not ignored:
+            return None
+        return [value for value in FLOOR_FILTERS if value not in ignored]
 
 
 @dataclass
@@ -24,6 +94,80 @@ class CommuteSettings:
     thresholds: dict[str, int] = field(default_factory=dict)
 
 
+@dataclass
+class NotificationSettings:
+    mode: str = "instant"
+    digest_window_minutes: int = 30
+    digest_top_photos: int = 3
+    digest_order: str = "commute"
+    chat_order: dict[str, str] = field(default_factory=dict)
+
+    def order_for(self, chat_id: str) -> str:
+        return self.chat_order.get(str(chat_id), self.digest_order)
+
+
+@dataclass
+class PipelineSettings:
+    fetch_workers: int = 2
+    parse_workers: int = 1
+    enrich_workers: int = 4
+    persist_workers: int = 1
+    notify_workers: int = 1
+    queue_size: int = 20
+    report_interval: int = 30
+
+
+@dataclass
+class ScheduleSettings:
+    min_interval_minutes: int = 10
+    max_interval_minutes: int = 240
+    target_new_per_run: float = 2.0
+    ewma_alpha: float = 0.3
+    night_start: int = 23
+    night_end: int = 6
+    night_factor: float = 3.0
+    timezone: str = "Europe/Warsaw"
+
+
+@dataclass
+class QueueSettings:
+    mode: str = "local"
+    lease_seconds: int = 300
+    max_attempts: int = 3
+    batch_size: int = 4
+    poll_interval: float = 5.0
+    retry_delay_seconds: int = 60
+
+
+@dataclass
+class MetricsSettings:
+    port: int = 9100
+    trace_dir: Optional[str] = None
+
+
+SCORE_COMPONENTS = ("price_per_m2", "price", "area", "commute", "build_year", "floor")
+
+
+@dataclass
+class ScoringSettings:
+    weights: dict[str, float] = field(
+        default_factory=lambda: {"price_per_m2": 0.5, "commute": 0.3, "build_year": 0.1, "floor": 0.1}
+    )
+    cell_size: float = 0.02
+    min_comparables: int = 5
+    good_score: float = 60.0
+    tolerance: float = 0.5
+
+
+@dataclass
+class SearchProfile:
+    name: str = "default"
+    search: SearchConditions = field(default_factory=SearchConditions)
+    base_url: str = DEFAULT_BASE_URL
+    max_pages: int = 5
+    interval_minutes: int = 60
+
+
 @dataclass
 class Config:
     search: SearchConditions = field(default_factory=SearchConditions)
@@ -32,21 +176,34 @@ class Config:
     commute: CommuteSettings = field(default_factory=CommuteSettings)
     reparse_after_days: int = 7
     max_pages: int = 5
+    notifications: NotificationSettings = field(default_factory=NotificationSettings)
+    pipeline: PipelineSettings = field(default_factory=PipelineSettings)
+    searches: List[SearchProfile] = field(default_factory=list)
+    max_browsers: int = 2
+    schedule: ScheduleSettings = field(default_factory=ScheduleSettings)
+    queue: QueueSettings = field(default_factory=QueueSettings)
+    metrics: MetricsSettings = field(default_factory=MetricsSettings)
+    scoring: ScoringSettings = field(default_factory=ScoringSettings)
 
+    def __post_init__(self):
+        if not self.searches:
+            self.searches = [
+                SearchProfile(
+                    name="default",
+                    search=self.search,
+                    base_url=self.base_url,
+                    max_pages=self.max_pages,
+                )
+            ]
 
-def load_config(path: str | Path = "config.json") -> Config:
-    path = Path(path)
-    if not path.exists():
-        return Config()
-    with path.open() as f:
-        data = json.load(f)
-    search = data.get("search", {})
-    headless = data.get("headless", True)
-    base_url = data.get("base_url", DEFAULT_BASE_URL)
-    reparse_after_days = int(data.get("reparse_after_days", 7))
-    max_pages = int(data.get("max_pages", 5))
-    commute_data = data.get("commute", {})
+    def get_search(self, name: str) -> SearchProfile | None:
+        for profile in self.searches:
+            if profile.name == name:
+                return profile
+        return None
 
+
+def _parse_search(search: dict) -> SearchConditions:
     rooms_value = search.get("rooms")
     rooms: Optional[List[int]]
     if isinstance(rooms_value, list):
@@ -61,13 +218,6 @@ def load_config(path: str | Path = "config.json") -> Config:
     else:
         rooms = None
 
-    commute = CommuteSettings(
-        pois=commute_data.get("pois", []),
-        day=commute_data.get("day", "Tuesday"),
-        time=commute_data.get("time", "09:00"),
-        thresholds={k: int(v) for k, v in commute_data.get("thresholds", {}).items() if isinstance(v, (int, str)) and str(v).isdigit()},
-    )
-
     ignore_floors_value = search.get("ignore_floors", [])
     if isinstance(ignore_floors_value, list):
         ignore_floors = [str(f).lower() for f in ignore_floors_value]
@@ -86,18 +236,154 @@ def load_config(path: str | Path = "config.json") -> Config:
     else:
         sorts = ["DEFAULT"]
 
+    floors_value = search.get("floors")
+    if floors_value is not None and not isinstance(floors_value, list):
+        floors_value = [floors_value]
+    floors = list(dict.fromkeys(floor_filter(f) for f in floors_value)) if floors_value else None
+
+    districts_value = search.get("districts", [])
+    if isinstance(districts_value, list):
+        districts = [str(d) for d in districts_value if str(d).strip()]
+    elif districts_value:
+        districts = [str(districts_value)]
+    else:
+        districts = []
+
+    return SearchConditions(
+        max_price=search.get("max_price"),
+        rooms=rooms,
+        min_area=search.get("min_area"),
+        sorts=sorts,
+        build_year_min=search.get("build_year_min"),
+        ignore_floors=ignore_floors,
+        min_price=search.get("min_price"),
+        max_area=search.get("max_area"),
+        min_price_per_m2=search.get("min_price_per_m2"),
+        max_price_per_m2=search.get("max_price_per_m2"),
+        build_year_max=search.get("build_year_max"),
+        floors=floors,
+        districts=districts,
+    )
+
+
+def load_config(path: str | Path = "config.json") -> Config:
+    path = Path(path)
+    if not path.exists():
+        return Config()
+    with path.open() as f:
+        data = json.load(f)
+    search = data.get("search", {})
+    headless = data.get("headless", True)
+    base_url = data.get("base_url", DEFAULT_BASE_URL)
+    reparse_after_days = int(data.get("reparse_after_days", 7))
+    max_pages = int(data.get("max_pages", 5))
+    commute_data = data.get("commute", {})
+    notifications_data = data.get("notifications", {})
+    pipeline_data = data.get("pipeline", {})
+    schedule_data = data.get("schedule", {})
+    queue_data = data.get("queue", {})
+    metrics_data = data.get("metrics", {})
+    scoring_data = data.get("scoring", {})
+
+    commute = CommuteSettings(
+        pois=commute_data.get("pois", []),
+        day=commute_data.get("day", "Tuesday"),
+        time=commute_data.get("time", "09:00"),
+        thresholds={k: int(v) for k, v in commute_data.get("thresholds", {}).items() if isinstance(v, (int, str)) and str(v).isdigit()},
+    )
+
+    notifications = NotificationSettings(
+        mode=str(notifications_data.get("mode", "instant")).lower(),
+        digest_window_minutes=int(notifications_data.get("digest_window_minutes", 30)),
+        digest_top_photos=int(notifications_data.get("digest_top_photos", 3)),
+        digest_order=str(notifications_data.get("digest_order", "commute")).lower(),
+        chat_order={str(k): str(v).lower() for k, v in notifications_data.get("chat_order", {}).items()},
+    )
+
+    pipeline = PipelineSettings(
+        fetch_workers=max(int(pipeline_data.get("fetch_workers", 2)), 1),
+        parse_workers=max(int(pipeline_data.get("parse_workers", 1)), 1),
+        enrich_workers=max(int(pipeline_data.get("enrich_workers", 4)), 1),
+        persist_workers=max(int(pipeline_data.get("persist_workers", 1)), 1),
+        notify_workers=max(int(pipeline_data.get("notify_workers", 1)), 1),
+        queue_size=max(int(pipeline_data.get("queue_size", 20)), 1),
+        report_interval=max(int(pipeline_data.get("report_interval", 30)), 1),
+    )
+
+    min_interval = max(int(schedule_data.get("min_interval_minutes", 10)), 1)
+    schedule = ScheduleSettings(
+        min_interval_minutes=min_interval,
+        max_interval_minutes=max(int(schedule_data.get("max_interval_minutes", 240)), min_interval),
+        target_new_per_run=float(schedule_data.get("target_new_per_run", 2.0)),
+        ewma_alpha=min(max(float(schedule_data.get("ewma_alpha", 0.3)), 0.01), 1.0),
+        night_start=int(schedule_data.get("night_start", 23)) % 24,
+        night_end=int(schedule_data.get("night_end", 6)) % 24,
+        night_factor=max(float(schedule_data.get("night_factor", 3.0)), 1.0),
+        timezone=str(schedule_data.get("timezone", "Europe/Warsaw")),
+    )
+
+    queue = QueueSettings(
+        mode=str(queue_data.get("mode", "local")).lower(),
+        lease_seconds=max(int(queue_data.get("lease_seconds", 300)), 10),
+        max_attempts=max(int(queue_data.get("max_attempts", 3)), 1),
+        batch_size=max(int(queue_data.get("batch_size", 4)), 1),
+        poll_interval=max(float(queue_data.get("poll_interval", 5.0)), 0.1),
+        retry_delay_seconds=max(int(queue_data.get("retry_delay_seconds", 60)), 0),
+    )
+
+    metrics = MetricsSettings(
+        port=max(int(metrics_data.get("port", 9100)), 0),
+        trace_dir=metrics_data.get("trace_dir") or None,
+    )
+
+    weights = ScoringSettings().weights
+    if "weights" in scoring_data:
+        weights = {}
+        for name, value in scoring_data["weights"].items():
+            if name not in SCORE_COMPONENTS:
+                raise ValueError(f"Unknown scoring component {name}; expected one of {SCORE_COMPONENTS}")
+            if float(value) > 0:
+                weights[name] = float(value)
+    scoring = ScoringSettings(
+        weights=weights,
+        cell_size=max(float(scoring_data.get("cell_size", 0.02)), 0.001),
+        min_comparables=max(int(scoring_data.get("min_comparables", 5)), 2),
+        good_score=float(scoring_data.get("good_score", 60.0)),
+        tolerance=max(float(scoring_data.get("tolerance", 0.5)), 0.0),
+    )
+
+    default_search = _parse_search(search)
+    searches = []
+    for index, entry in enumerate(data.get("searches", [])):
+        if not isinstance(entry, dict):
+            continue
+        searches.append(
+            SearchProfile(
+                name=str(entry.get("name") or f"search-{index + 1}"),
+                search=_parse_search(entry.get("search", search)),
+                base_url=entry.get("base_url", base_url),
+                max_pages=int(entry.get("max_pages", max_pages)),
+                interval_minutes=max(int(entry.get("interval_minutes", 60)), 1),
+            )
+        )
+    if searches:
+        names = [profile.name for profile in searches]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Search names must be unique: {names}")
+
     return Config(
-        search=SearchConditions(
-            max_price=search.get("max_price"),
-            rooms=rooms,
-            min_area=search.get("min_area"),
-            sorts=sorts,
-            build_year_min=search.get("build_year_min"),
-            ignore_floors=ignore_floors,
-        ),
+        search=default_search,
         headless=headless,
         base_url=base_url,
         commute=commute,
         reparse_after_days=reparse_after_days,
         max_pages=max_pages,
+        notifications=notifications,
+        pipeline=pipeline,
+        searches=searches,
+        max_browsers=max(int(data.get("max_browsers", 2)), 1),
+        schedule=schedule,
+        queue=queue,
+        metrics=metrics,
+        scoring=scoring,
     )
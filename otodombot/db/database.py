@@ -1,23 +1,115 @@
-from sqlalchemy import create_engine
+from sqlalchemy import bindparam, create_engine, event, inspect, select, text, update
 from sqlalchemy.orm import sessionmaker
 import logging
+import os
+import time
 
-from .models import Base
+from .. import metrics
+from .models import Base, Listing, parse_storey
+from . import versioning  # also registers the data version hook
+from .search import ensure_search_index
 
-engine = create_engine("sqlite:///otodom.db")
+DATABASE_URL = os.getenv("OTODOMBOT_DB_URL", "sqlite:///otodom.db")
+
+QUERY_SECONDS = metrics.histogram(
+    "otodombot_db_query_seconds",
+    "Database statement latency by statement type",
+    ("operation",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+_OPERATIONS = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+
+def instrument_engine(bind) -> None:
+    """Time every statement executed through ``bind``."""
+
+    # the start time lives on the execution context, which is discarded
+    # with the statement, so a statement that raises leaves nothing behind
+    @event.listens_for(bind, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._otodom_start = time.perf_counter()
+
+    @event.listens_for(bind, "after_cursor_execute")
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_otodom_start", None)
+        if start is None:
+            return
+        word = statement.lstrip()[:6].upper()
+        QUERY_SECONDS.observe(time.perf_counter() - start, operation=word if word in _OPERATIONS else "OTHER")
+
+
+def make_engine(url: str = DATABASE_URL):
+    """Create the engine; SQLite files get WAL and a busy timeout so that
+    several processes can share one database file."""
+    if not url.startswith("sqlite"):
+        new_engine = create_engine(url, pool_pre_ping=True)
+        instrument_engine(new_engine)
+        return new_engine
+    new_engine = create_engine(url, connect_args={"timeout": 30})
+    instrument_engine(new_engine)
+    if url not in ("sqlite://", "sqlite:///:memory:"):
+
+        @event.listens_for(new_engine, "connect")
+        def _set_wal(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.close()
+
+    return new_engine
+
+
+engine = make_engine()
 SessionLocal = sessionmaker(bind=engine)
 
 
-def init_db():
+def _add_missing_columns(bind) -> None:
+    """Add columns declared on the models but missing from existing tables."""
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in present:
+                continue
+            col_type = column.type.compile(dialect=bind.dialect)
+            logging.info("Adding column %s.%s", table.name, column.name)
+            with bind.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"))
+
+
+def _backfill_storeys(bind) -> None:
+    """Parse the storey of listings stored before the ``storey`` column existed."""
+    with bind.begin() as conn:
+        rows = conn.execute(
+            select(Listing.id, Listing.floor).where(Listing.storey.is_(None), Listing.floor.isnot(None))
+        ).all()
+        updates = [
+            {"listing_id": row.id, "storey": storey}
+            for row in rows
+            if (storey := parse_storey(row.floor)) is not None
+        ]
+        if updates:
+            conn.execute(
+                update(Listing.__table__)
+                .where(Listing.__table__.c.id == bindparam("listing_id"))
+                .values(storey=bindparam("storey")),
+                updates,
+            )
+            logging.info("Parsed the storey of %d existing listings", len(updates))
+
+
+def init_db(bind=None):
+    bind = bind or engine
     logging.debug("Initializing database schema")
-    Base.metadata.create_all(bind=engine)
-    # add new columns on existing databases if missing
-    with engine.begin() as conn:
-        try:
-            conn.execute("ALTER TABLE listings ADD COLUMN floor TEXT")
-        except Exception:
-            pass
-        try:
-            conn.execute("ALTER TABLE commute_times ADD COLUMN details TEXT")
-        except Exception:
-            pass
+    Base.metadata.create_all(bind=bind)
+    # add new columns and indexes on existing databases if missing
+    _add_missing_columns(bind)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+    ensure_search_index(bind)
+    _backfill_storeys(bind)
+    versioning.backfill_versions(bind)
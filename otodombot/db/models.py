@@ -1,10 +1,24 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Float
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Float, Index, LargeBinary, UniqueConstraint
+from sqlalchemy.orm import declarative_base, relationship, validates
 from datetime import datetime
+import re
 
 Base = declarative_base()
 
 
+def parse_storey(value: str | None) -> int | None:
+    """Return the storey of a floor string such as ``"3/6"`` or ``"parter"``; None if unknown."""
+    if not value:
+        return None
+    text = value.strip().lower()
+    if text.startswith("parter"):
+        return 0
+    if text.startswith("suterena"):
+        return -1
+    m = re.search(r"-?\d+", text)
+    return int(m.group(0)) if m else None
+
+
 class Listing(Base):
     __tablename__ = "listings"
 
@@ -15,16 +29,30 @@ class Listing(Base):
     description = Column(String)
     location = Column(String)
     floor = Column(String)
-    price = Column(Integer)
+    # storey parsed from ``floor``, kept in step by ``_set_storey``
+    storey = Column(Integer, index=True)
+    price = Column(Integer, index=True)
+    area = Column(Float)
+    build_year = Column(Integer)
+    price_per_m2 = Column(Float)
+    score = Column(Float, index=True)
     lat = Column(Float)
     lng = Column(Float)
     is_good = Column(Boolean, default=False)
     notes = Column(String)
     last_parsed = Column(DateTime, default=datetime.utcnow)
+    version = Column(Integer, index=True)
 
     photos = relationship("Photo", back_populates="listing", cascade="all, delete-orphan")
     commutes = relationship("CommuteTime", back_populates="listing", cascade="all, delete-orphan")
 
+    __table_args__ = (Index("ix_listings_lat_lng", "lat", "lng"),)
+
+    @validates("floor")
+    def _set_storey(self, key, value):
+        self.storey = parse_storey(value)
+        return value
+
 
 class Photo(Base):
     __tablename__ = "photos"
@@ -47,3 +75,123 @@ class CommuteTime(Base):
     details = Column(String)
 
     listing = relationship("Listing", back_populates="commutes")
+
+    __table_args__ = (Index("ix_commute_times_listing_destination", "listing_id", "destination", "minutes"),)
+
+
+class DataVersion(Base):
+    """Single-row counter bumped on every flush that changes listing data."""
+
+    __tablename__ = "data_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ListingTombstone(Base):
+    """Records the data version at which a listing was deleted."""
+
+    __tablename__ = "listing_tombstones"
+
+    listing_id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, index=True)
+    removed_at = Column(DateTime, default=datetime.utcnow)
+
+
+class NotificationOutbox(Base):
+    """Pending Telegram message, written in the same transaction as its listing."""
+
+    __tablename__ = "notification_outbox"
+
+    id = Column(Integer, primary_key=True)
+    listing_id = Column(Integer, ForeignKey("listings.id"), nullable=False)
+    chat_id = Column(String, nullable=False)
+    idempotency_key = Column(String, unique=True, nullable=False)
+    text = Column(String, nullable=False)
+    photos = Column(String)
+    status = Column(String, default="pending", nullable=False, index=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+    # a failed row is not retried before this time
+    available_at = Column(DateTime)
+
+    listing = relationship("Listing")
+
+
+class SearchRun(Base):
+    """One scheduled run of a named search and the interval chosen after it."""
+
+    __tablename__ = "search_runs"
+
+    id = Column(Integer, primary_key=True)
+    search = Column(String, nullable=False, index=True)
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime)
+    duration_seconds = Column(Float)
+    seen_listings = Column(Integer, default=0)
+    new_listings = Column(Integer, default=0)
+    arrival_rate = Column(Float)
+    next_interval_minutes = Column(Float)
+    error = Column(String)
+
+
+class Job(Base):
+    """Unit of work shared between scraper processes through the database.
+
+    A worker leases a job for a limited time and keeps extending the lease
+    with heartbeats; if it dies the lease expires and the job becomes
+    visible to other workers again.
+    """
+
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False, index=True)
+    key = Column(String, unique=True, nullable=False)
+    payload = Column(String)
+    status = Column(String, default="pending", nullable=False, index=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=3, nullable=False)
+    available_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    lease_owner = Column(String)
+    lease_expires_at = Column(DateTime, index=True)
+    heartbeat_at = Column(DateTime)
+    last_error = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ScrapeRun(Base):
+    """One run of a named search, kept so a restarted process can resume it."""
+
+    __tablename__ = "scrape_runs"
+
+    id = Column(Integer, primary_key=True)
+    search = Column(String, nullable=False, index=True)
+    status = Column(String, default="running", nullable=False, index=True)
+    sorts_done = Column(String, default="[]")
+    started_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime)
+
+
+class ScrapeRunUrl(Base):
+    """A listing URL discovered by a run and the last stage it completed."""
+
+    __tablename__ = "scrape_run_urls"
+
+    id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, ForeignKey("scrape_runs.id", ondelete="CASCADE"), nullable=False)
+    url = Column(String, nullable=False)
+    state = Column(String, default="pending", nullable=False)
+    payload = Column(String)
+    html = Column(LargeBinary)
+    error = Column(String)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("run_id", "url", name="uq_scrape_run_urls_run_url"),
+        Index("ix_scrape_run_urls_run_state", "run_id", "state"),
+    )
@@ -0,0 +1,181 @@
+from typing import Iterable
+import logging
+import re
+import unicodedata
+
+from sqlalchemy import func, or_, select, text
+
+from .models import Listing
+
+FTS_TABLE = "listings_fts"
+# unicode61 folds most Polish diacritics (ą, ę, ó, ś, ż, ...) but "ł" has no
+# Unicode decomposition, so it is folded explicitly before indexing and search.
+_FOLD = str.maketrans({"ł": "l", "Ł": "L"})
+
+
+def fold_polish(value: str | None) -> str:
+    """Fold characters the FTS tokenizer does not strip diacritics from."""
+    return (value or "").translate(_FOLD)
+
+
+def _is_sqlite(bind) -> bool:
+    return bind.dialect.name == "sqlite"
+
+
+def ensure_search_index(bind) -> None:
+    """Create the FTS5 index on SQLite and fill it if it is out of sync."""
+    if not _is_sqlite(bind):
+        return
+    with bind.begin() as conn:
+        conn.execute(
+            text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                "title, description, notes, tokenize='unicode61 remove_diacritics 2')"
+            )
+        )
+        indexed = conn.execute(text(f"SELECT count(*) FROM {FTS_TABLE}")).scalar_one()
+        total = conn.execute(select(func.count()).select_from(Listing)).scalar_one()
+        if indexed == total:
+            return
+        logging.info("Rebuilding search index for %d listings", total)
+        conn.execute(text(f"DELETE FROM {FTS_TABLE}"))
+        rows = conn.execute(select(Listing.id, Listing.title, Listing.description, Listing.notes))
+        while batch := rows.fetchmany(1000):
+            conn.execute(
+                text(
+                    f"INSERT INTO {FTS_TABLE}(rowid, title, description, notes) "
+                    "VALUES (:id, :title, :description, :notes)"
+                ),
+                [
+                    {
+                        "id": r.id,
+                        "title": fold_polish(r.title),
+                        "description": fold_polish(r.description),
+                        "notes": fold_polish(r.notes),
+                    }
+                    for r in batch
+                ],
+            )
+
+
+def index_listings(session, listings: Iterable[Listing]) -> None:
+    """Update the search index for ``listings`` in the session's transaction."""
+    if not _is_sqlite(session.get_bind()):
+        return
+    session.flush()
+    for listing in listings:
+        params = {"id": listing.id}
+        session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), params)
+        session.execute(
+            text(
+                f"INSERT INTO {FTS_TABLE}(rowid, title, description, notes) "
+                "VALUES (:id, :title, :description, :notes)"
+            ),
+            {
+                **params,
+                "title": fold_polish(listing.title),
+                "description": fold_polish(listing.description),
+                "notes": fold_polish(listing.notes),
+            },
+        )
+
+
+def _build_match_table() -> dict[int, str]:
+    table = {}
+    for code in range(0x41, 0x250):
+        char = chr(code)
+        base = unicodedata.normalize("NFKD", fold_polish(char).lower())[:1]
+        if base and base != char:
+            table[code] = base
+    return table
+
+
+# one-to-one character map (case and diacritics folded) so that positions in
+# the folded text match the original text when building snippets
+_MATCH_TABLE = _build_match_table()
+
+
+def _fold_for_match(value: str) -> str:
+    return value.translate(_MATCH_TABLE)
+
+
+def _match_expression(tokens: list[str]) -> str:
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def make_snippet(value: str | None, tokens: list[str], width: int = 120) -> str | None:
+    """Return a window of ``value`` around the first query token, highlighted."""
+    if not value:
+        return None
+    folded = _fold_for_match(value)
+    folded_tokens = [_fold_for_match(t) for t in tokens]
+    positions = [folded.find(t) for t in folded_tokens if t]
+    positions = [p for p in positions if p >= 0]
+    if not positions:
+        return None
+    start = max(min(positions) - width // 3, 0)
+    end = min(start + width, len(value))
+    window = value[start:end]
+    folded_window = folded[start:end]
+    pattern = re.compile("|".join(re.escape(t) for t in folded_tokens if t))
+    parts = []
+    last = 0
+    for m in pattern.finditer(folded_window):
+        word_end = m.end()
+        while word_end < len(window) and window[word_end].isalnum():
+            word_end += 1
+        parts.append(window[last:m.start()])
+        parts.append(f"<b>{window[m.start():word_end]}</b>")
+        last = word_end
+    parts.append(window[last:])
+    return ("…" if start else "") + "".join(parts) + ("…" if end < len(value) else "")
+
+
+def search_listings(session, query: str, limit: int = 20, candidates: int = 2000) -> list[dict]:
+    """Return listings matching ``query`` ranked by relevance.
+
+    Every word must match as a prefix; titles weigh three times more than
+    description and notes. To keep latency bounded for very common words,
+    only the newest ``candidates`` matches are ranked. Databases without
+    FTS5 fall back to an unranked case-insensitive substring search.
+    """
+    tokens = re.findall(r"\w+", fold_polish(query))
+    if not tokens:
+        return []
+    if not _is_sqlite(session.get_bind()):
+        stmt = select(Listing.id, Listing.title, Listing.price, Listing.url, Listing.description)
+        for token in re.findall(r"\w+", query):
+            pattern = f"%{token}%"
+            stmt = stmt.where(
+                or_(
+                    Listing.title.ilike(pattern),
+                    Listing.description.ilike(pattern),
+                    Listing.notes.ilike(pattern),
+                )
+            )
+        rows = session.execute(stmt.order_by(Listing.id.desc()).limit(limit))
+    else:
+        rows = session.execute(
+            text(
+                f"SELECT l.id, l.title, l.price, l.url, l.description, f.rank "
+                f"FROM (SELECT rowid AS id, bm25({FTS_TABLE}, 3.0, 1.0, 1.0) AS rank "
+                f"      FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :expression "
+                f"      AND rowid >= (SELECT coalesce(min(rowid), 0) FROM ("
+                f"          SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :expression "
+                f"          ORDER BY rowid DESC LIMIT :candidates)) "
+                f"      ORDER BY rank LIMIT :limit) f "
+                f"JOIN listings l ON l.id = f.id ORDER BY f.rank"
+            ),
+            {"expression": _match_expression(tokens), "limit": limit, "candidates": candidates},
+        )
+    return [
+        {
+            "id": r.id,
+            "title": r.title,
+            "price": r.price,
+            "url": r.url,
+            "snippet": make_snippet(r.description, tokens),
+            "rank": getattr(r, "rank", None),
+        }
+        for r in rows
+    ]
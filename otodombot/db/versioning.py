@@ -0,0 +1,88 @@
+from datetime import datetime
+import logging
+
+from sqlalchemy import event, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from .models import CommuteTime, DataVersion, Listing, ListingTombstone
+
+VERSION_ROW_ID = 1
+
+
+def current_version(session) -> tuple[int, datetime | None]:
+    """Return ``(version, updated_at)`` of the listing data."""
+    row = session.execute(
+        select(DataVersion.version, DataVersion.updated_at).where(DataVersion.id == VERSION_ROW_ID)
+    ).first()
+    if row is None:
+        return 0, None
+    return row.version, row.updated_at
+
+
+def bump_version(session) -> int:
+    """Increment the data version inside the current transaction and return it."""
+    conn = session.connection()
+    now = datetime.utcnow()
+    result = conn.execute(
+        update(DataVersion)
+        .where(DataVersion.id == VERSION_ROW_ID)
+        .values(version=DataVersion.version + 1, updated_at=now)
+    )
+    if result.rowcount == 0:
+        conn.execute(insert(DataVersion).values(id=VERSION_ROW_ID, version=1, updated_at=now))
+    return conn.execute(
+        select(DataVersion.version).where(DataVersion.id == VERSION_ROW_ID)
+    ).scalar_one()
+
+
+def backfill_versions(bind) -> int:
+    """Stamp listings stored before versioning existed with a new data version.
+
+    Without a version they never show up in ``/listings/changes``, so an
+    incremental client would not see them. Returns the rows stamped.
+    """
+    with Session(bind) as session:
+        missing = session.execute(
+            select(func.count()).select_from(Listing).where(Listing.version.is_(None))
+        ).scalar_one()
+        if not missing:
+            return 0
+        version = bump_version(session)
+        session.execute(update(Listing).where(Listing.version.is_(None)).values(version=version))
+        session.commit()
+    logging.info("Stamped %d existing listings with data version %d", missing, version)
+    return missing
+
+
+def _changed_listings(session) -> tuple[set, list]:
+    listings = set()
+    deleted = []
+    for obj in session.new:
+        if isinstance(obj, Listing):
+            listings.add(obj)
+    for obj in session.dirty:
+        if isinstance(obj, Listing) and session.is_modified(obj):
+            listings.add(obj)
+    for obj in session.deleted:
+        if isinstance(obj, Listing):
+            deleted.append(obj.id)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, CommuteTime) and obj.listing_id is not None:
+            listing = obj.listing or session.get(Listing, obj.listing_id)
+            if listing is not None and listing not in session.deleted:
+                listings.add(listing)
+    return listings, deleted
+
+
+@event.listens_for(Session, "before_flush")
+def _stamp_versions(session, flush_context, instances) -> None:
+    """Stamp changed listings with a new data version and record deletions."""
+    listings, deleted = _changed_listings(session)
+    if not listings and not deleted:
+        return
+    version = bump_version(session)
+    for listing in listings:
+        listing.version = version
+    for listing_id in deleted:
+        session.merge(ListingTombstone(listing_id=listing_id, version=version))
+    logging.debug("Data version %d: %d changed, %d removed", version, len(listings), len(deleted))
@@ -2,14 +2,18 @@ import logging
 from openai import OpenAI
 from bs4 import BeautifulSoup
 
+from .. import metrics
+from ..metrics import EXTERNAL_SECONDS
+
 
 def rate_listing(text: str, api_key: str) -> str:
     logging.debug("Requesting listing summary from ChatGPT")
     client = OpenAI(api_key=api_key)
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "user", "content": "Дай очень короткое саммари по объявлению на русском языке для последующего оценочного анализа. Очень коротко!! НЕ более 400 символов, но надо короче!!! Сам текст объявления: " +  text}],
-    )
+    with metrics.timed(EXTERNAL_SECONDS, "openai.rate_listing", service="openai", call="rate_listing"):
+        response = client.chat.completions.create(
+            model="gpt-4o",
+            messages=[{"role": "user", "content": "Дай очень короткое саммари по объявлению на русском языке для последующего оценочного анализа. Очень коротко!! НЕ более 400 символов, но надо короче!!! Сам текст объявления: " +  text}],
+        )
     summary = response.choices[0].message.content.strip()
     logging.debug("Received summary: %s", summary)
     return summary
@@ -56,10 +60,11 @@ def extract_address(
         "unsure.\n\n"
         f"Description:\n{description}\n\nListing content:\n{trimmed_block}"
     )
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "user", "content": prompt}],
-    )
+    with metrics.timed(EXTERNAL_SECONDS, "openai.extract_address", service="openai", call="extract_address"):
+        response = client.chat.completions.create(
+            model="gpt-4o",
+            messages=[{"role": "user", "content": prompt}],
+        )
     address = response.choices[0].message.content.strip()
     logging.debug("Extracted address: %s", address)
     return address
@@ -1,8 +1,18 @@
 import logging
+import os
 import googlemaps
 from datetime import datetime
 from typing import List, Dict, Tuple, Optional
 
+from .. import metrics
+from ..metrics import EXTERNAL_ERRORS, EXTERNAL_SECONDS
+
+
+def _maps_client(api_key: str) -> googlemaps.Client:
+    # GOOGLE_MAPS_BASE_URL points the client at a stand-in server (benchmarks)
+    base_url = os.getenv("GOOGLE_MAPS_BASE_URL", "https://maps.googleapis.com")
+    return googlemaps.Client(key=api_key, base_url=base_url)
+
 
 def _summarize_transit_steps(steps: List[dict]) -> Dict[str, Optional[int | List[str]]]:
     """Return summary info for a leg's steps."""
@@ -33,10 +43,12 @@ def _summarize_transit_steps(steps: List[dict]) -> Dict[str, Optional[int | List
 def geocode_address(address: str, api_key: str) -> Optional[Tuple[float, float]]:
     """Return (lat, lng) for a given address using Google Maps Geocoding API."""
     logging.debug("Geocoding address %s", address)
-    client = googlemaps.Client(key=api_key)
+    client = _maps_client(api_key)
     try:
-        results = client.geocode(address)
+        with metrics.timed(EXTERNAL_SECONDS, "google.geocode", service="google", call="geocode"):
+            results = client.geocode(address)
     except Exception as exc:  # pragma: no cover - network errors
+        EXTERNAL_ERRORS.inc(service="google", call="geocode")
         logging.error("Geocoding failed for %s: %s", address, exc, exc_info=True)
         return None
     if not results:
@@ -57,15 +69,17 @@ def transit_routes(
 ) -> List[dict]:
     """Return up to two best transit routes with summary info."""
     logging.debug("Requesting transit routes from %s to %s", origin, destination)
-    client = googlemaps.Client(key=api_key)
+    client = _maps_client(api_key)
     try:
-        routes = client.directions(
-            origin=origin,
-            destination=destination,
-            mode="transit",
-            departure_time=departure,
-        )
+        with metrics.timed(EXTERNAL_SECONDS, "google.directions", service="google", call="directions"):
+            routes = client.directions(
+                origin=origin,
+                destination=destination,
+                mode="transit",
+                departure_time=departure,
+            )
     except Exception as exc:  # pragma: no cover - network errors
+        EXTERNAL_ERRORS.inc(service="google", call="directions")
         logging.error(
             "Failed to get directions from %s to %s: %s", origin, destination, exc, exc_info=True
         )
@@ -0,0 +1,221 @@
+from dataclasses import dataclass
+import logging
+import math
+
+import numpy as np
+from sqlalchemy import select, update
+
+from ..config import ScoringSettings
+from ..db.models import CommuteTime, Listing, parse_storey
+from ..db.versioning import bump_version
+
+# components where a smaller value makes a better deal
+LOWER_IS_BETTER = {"price_per_m2", "price", "commute"}
+
+
+def floor_number(value: str | None) -> float:
+    """Return the storey of a floor string such as ``"3/6"`` or ``"parter"``; NaN if unknown."""
+    storey = parse_storey(value)
+    return math.nan if storey is None else float(storey)
+
+
+@dataclass
+class ListingColumns:
+    """All listings as parallel NumPy columns, NaN where a value is unknown."""
+
+    ids: np.ndarray
+    price: np.ndarray
+    area: np.ndarray
+    price_per_m2: np.ndarray
+    floor: np.ndarray
+    build_year: np.ndarray
+    lat: np.ndarray
+    lng: np.ndarray
+    # minutes to each POI, shape (listings, len(pois))
+    commutes: np.ndarray
+    pois: list[str]
+    score: np.ndarray
+    is_good: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def _float_column(values) -> np.ndarray:
+    return np.array([math.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def load_columns(session, pois: list[str]) -> ListingColumns:
+    """Read every listing and its commutes to ``pois`` into columns with two queries."""
+    rows = session.execute(
+        select(
+            Listing.id,
+            Listing.price,
+            Listing.area,
+            Listing.price_per_m2,
+            Listing.floor,
+            Listing.build_year,
+            Listing.lat,
+            Listing.lng,
+            Listing.score,
+            Listing.is_good,
+        ).order_by(Listing.id)
+    ).all()
+    ids = np.array([r.id for r in rows], dtype=np.int64)
+    price = _float_column(r.price for r in rows)
+    area = _float_column(r.area for r in rows)
+    price_per_m2 = _float_column(r.price_per_m2 for r in rows)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # rows stored before price_per_m2 existed
+        price_per_m2 = np.where(np.isnan(price_per_m2) & (area > 0), price / area, price_per_m2)
+    commutes = np.full((len(rows), len(pois)), np.nan)
+    if pois and len(rows):
+        column_of = {poi: j for j, poi in enumerate(pois)}
+        for listing_id, destination, minutes in session.execute(
+            select(CommuteTime.listing_id, CommuteTime.destination, CommuteTime.minutes).where(
+                CommuteTime.destination.in_(pois), CommuteTime.minutes.isnot(None)
+            )
+        ):
+            i = np.searchsorted(ids, listing_id)
+            if i < len(ids) and ids[i] == listing_id:
+                commutes[i, column_of[destination]] = minutes
+    return ListingColumns(
+        ids=ids,
+        price=price,
+        area=area,
+        price_per_m2=price_per_m2,
+        floor=np.array([floor_number(r.floor) for r in rows], dtype=np.float64),
+        build_year=_float_column(r.build_year for r in rows),
+        lat=_float_column(r.lat for r in rows),
+        lng=_float_column(r.lng for r in rows),
+        commutes=commutes,
+        pois=list(pois),
+        score=_float_column(r.score for r in rows),
+        is_good=np.array([bool(r.is_good) for r in rows], dtype=bool),
+    )
+
+
+def cell_ids(lat: np.ndarray, lng: np.ndarray, cell_size: float) -> np.ndarray:
+    """Number the square grid cells the coordinates fall in; -1 without coordinates."""
+    cells = np.full(len(lat), -1, dtype=np.int64)
+    known = ~(np.isnan(lat) | np.isnan(lng))
+    if known.any():
+        grid = np.stack([np.floor(lat[known] / cell_size), np.floor(lng[known] / cell_size)], axis=1)
+        _, inverse = np.unique(grid, axis=0, return_inverse=True)
+        cells[known] = inverse.ravel()
+    return cells
+
+
+def percentile_ranks(values: np.ndarray, groups: np.ndarray | None = None) -> np.ndarray:
+    """Return the mid-rank percentile (0..1) of each value within its group.
+
+    Ties share the average of their ranks, a value alone in its group
+    gets 0.5 and NaN values stay NaN.
+    """
+    ranks = np.full(len(values), np.nan)
+    idx = np.flatnonzero(~np.isnan(values))
+    if idx.size == 0:
+        return ranks
+    v = values[idx]
+    g = np.zeros(idx.size, dtype=np.int64) if groups is None else groups[idx]
+    order = np.lexsort((v, g))
+    v, g = v[order], g[order]
+    new_group = np.ones(idx.size, dtype=bool)
+    new_group[1:] = g[1:] != g[:-1]
+    new_run = new_group.copy()
+    new_run[1:] |= v[1:] != v[:-1]
+    pos = np.arange(idx.size)
+    group_start = np.maximum.accumulate(np.where(new_group, pos, 0))
+    run_start = np.maximum.accumulate(np.where(new_run, pos, 0))
+    group_id = np.cumsum(new_group) - 1
+    run_id = np.cumsum(new_run) - 1
+    group_len = np.bincount(group_id)[group_id]
+    run_len = np.bincount(run_id)[run_id]
+    mid = (run_start - group_start) + (run_len - 1) / 2
+    ranks[idx[order]] = np.where(group_len > 1, mid / np.maximum(group_len - 1, 1), 0.5)
+    return ranks
+
+
+def _group_sizes(values: np.ndarray, groups: np.ndarray) -> np.ndarray:
+    """Number of non-NaN values in each element's group."""
+    _, inverse = np.unique(groups, return_inverse=True)
+    counts = np.bincount(inverse, weights=~np.isnan(values))
+    return counts[inverse]
+
+
+def component_ranks(columns: ListingColumns, settings: ScoringSettings) -> dict[str, np.ndarray]:
+    """Percentile of every weighted component, oriented so that 1 is the best deal.
+
+    Flat attributes are ranked against comparable flats in the same grid
+    cell, or city-wide when the cell has fewer than ``min_comparables``.
+    Commutes are ranked city-wide, since flats in one cell share them.
+    """
+    cells = cell_ids(columns.lat, columns.lng, settings.cell_size)
+    ranks = {}
+    for name in settings.weights:
+        if name == "commute":
+            if not columns.pois:
+                continue
+            per_poi = np.stack([percentile_ranks(columns.commutes[:, j]) for j in range(len(columns.pois))])
+            known = (~np.isnan(per_poi)).sum(axis=0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                component = np.where(known > 0, np.nansum(per_poi, axis=0) / known, np.nan)
+        else:
+            values = getattr(columns, name)
+            local = percentile_ranks(values, cells)
+            enough = (cells >= 0) & (_group_sizes(values, cells) >= settings.min_comparables)
+            component = np.where(enough, local, percentile_ranks(values))
+        ranks[name] = 1 - component if name in LOWER_IS_BETTER else component
+    return ranks
+
+
+def compute_scores(columns: ListingColumns, settings: ScoringSettings) -> np.ndarray:
+    """Weighted score from 0 to 100; components a listing lacks are left out of its weights."""
+    total = np.zeros(len(columns))
+    weight = np.zeros(len(columns))
+    for name, ranks in component_ranks(columns, settings).items():
+        known = ~np.isnan(ranks)
+        total[known] += settings.weights[name] * ranks[known]
+        weight[known] += settings.weights[name]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(weight > 0, 100 * total / weight, np.nan)
+
+
+def update_scores(session, settings: ScoringSettings, pois: list[str]) -> int:
+    """Score all listings in bulk and store the scores that changed.
+
+    Listings without a score are always written; scored ones only when
+    their score moved by more than ``tolerance`` points or their
+    ``is_good`` flag no longer matches ``good_score``, so a run that adds
+    a few listings writes a few rows. Returns the rows written.
+    """
+    columns = load_columns(session, pois)
+    if not len(columns):
+        return 0
+    scores = compute_scores(columns, settings)
+    stored = columns.score
+    changed = np.isnan(stored) != np.isnan(scores)
+    both = ~(np.isnan(stored) | np.isnan(scores))
+    changed[both] = np.abs(stored[both] - scores[both]) > settings.tolerance
+    with np.errstate(invalid="ignore"):
+        good = scores >= settings.good_score
+    changed |= good != columns.is_good
+    rows = np.flatnonzero(changed)
+    if rows.size == 0:
+        return 0
+    version = bump_version(session)
+    session.execute(
+        update(Listing),
+        [
+            {
+                "id": int(columns.ids[i]),
+                "score": None if np.isnan(scores[i]) else round(float(scores[i]), 2),
+                "is_good": bool(good[i]),
+                "version": version,
+            }
+            for i in rows
+        ],
+    )
+    session.commit()
+    logging.info("Stored scores of %d of %d listings", rows.size, len(columns))
+    return int(rows.size)
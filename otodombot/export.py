@@ -0,0 +1,120 @@
+from datetime import datetime
+from typing import Iterator
+import csv
+import io
+import json
+import logging
+
+from sqlalchemy import select
+
+from .db.models import CommuteTime, Listing
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - installed from requirements.txt
+    orjson = None
+
+EXPORT_COLUMNS = [
+    "id",
+    "url",
+    "external_id",
+    "title",
+    "location",
+    "floor",
+    "price",
+    "area",
+    "build_year",
+    "price_per_m2",
+    "score",
+    "lat",
+    "lng",
+    "is_good",
+    "last_parsed",
+]
+
+
+def dumps_line(obj: dict) -> bytes:
+    """Serialize ``obj`` as one NDJSON line, using orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(obj) + b"\n"
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def iter_export_rows(
+    session_factory,
+    include_description: bool = False,
+    batch_size: int = 1000,
+) -> Iterator[dict]:
+    """Yield every listing with its commutes, streaming rows from the database.
+
+    Listings and commutes are read in one ordered join with ``yield_per`` so
+    only ``batch_size`` rows are buffered at a time; on PostgreSQL this uses a
+    server-side cursor.
+    """
+    columns = [getattr(Listing, name) for name in EXPORT_COLUMNS]
+    if include_description:
+        columns.append(Listing.description)
+    stmt = (
+        select(*columns, CommuteTime.destination, CommuteTime.minutes)
+        .outerjoin(CommuteTime, CommuteTime.listing_id == Listing.id)
+        .order_by(Listing.id)
+        .execution_options(yield_per=batch_size, stream_results=True)
+    )
+    session = session_factory()
+    try:
+        current = None
+        exported = 0
+        for row in session.execute(stmt):
+            if current is None or current["id"] != row.id:
+                if current is not None:
+                    exported += 1
+                    yield current
+                current = {}
+                for name, value in row._mapping.items():
+                    if name in ("destination", "minutes"):
+                        continue
+                    current[name] = value.isoformat() if isinstance(value, datetime) else value
+                current["commutes"] = {}
+            if row.destination is not None:
+                current["commutes"][row.destination] = row.minutes
+        if current is not None:
+            exported += 1
+            yield current
+        logging.info("Exported %d listings", exported)
+    finally:
+        session.close()
+
+
+def iter_ndjson(rows: Iterator[dict], chunk_rows: int = 500) -> Iterator[bytes]:
+    """Encode rows as NDJSON, yielding a chunk every ``chunk_rows`` rows."""
+    buffer: list[bytes] = []
+    for row in rows:
+        buffer.append(dumps_line(row))
+        if len(buffer) >= chunk_rows:
+            yield b"".join(buffer)
+            buffer.clear()
+    if buffer:
+        yield b"".join(buffer)
+
+
+def iter_csv(
+    rows: Iterator[dict],
+    columns: list[str],
+    destinations: list[str],
+    chunk_rows: int = 500,
+) -> Iterator[str]:
+    """Encode rows as CSV with one ``commute:<destination>`` column per POI."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(columns + [f"commute:{d}" for d in destinations])
+    count = 0
+    for row in rows:
+        commutes = row["commutes"]
+        writer.writerow([row.get(c) for c in columns] + [commutes.get(d) for d in destinations])
+        count += 1
+        if count % chunk_rows == 0:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+    if out.tell():
+        yield out.getvalue()
@@ -1,11 +1,54 @@
+import argparse
 import logging
+import os
 from dotenv import load_dotenv
 
+from . import metrics
+from .config import load_config
 from .db.database import init_db
-from .scheduler.tasks import start_scheduler
+from .scheduler.tasks import enqueue_commute_refresh, start_queue_worker, start_scheduler
+from .notifications.telegram_bot import get_notifier, shutdown_notifiers
+from .notifications.outbox import start_outbox_worker, stop_outbox_worker
 
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Otodom listings bot")
+    parser.add_argument(
+        "--role",
+        choices=["all", "scheduler", "worker"],
+        default="all",
+        help=(
+            "with queue mode 'db': 'scheduler' only discovers and queues URLs, "
+            "'worker' only processes queued jobs, 'all' does both"
+        ),
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="port of the Prometheus endpoint, overriding metrics.port; 0 turns it off",
+    )
+    parser.add_argument(
+        "--refresh-commutes",
+        action="store_true",
+        help="queue commute refresh jobs for listings missing commute times and exit",
+    )
+    return parser.parse_args(argv)
+
+
+def start_metrics_server(port: int):
+    """Serve metrics on ``port`` unless it is 0; a port in use only costs the endpoint."""
+    if not port:
+        return None
+    try:
+        return metrics.start_http_server(port)
+    except OSError as exc:
+        # e.g. a scheduler and a worker on one host with the same port
+        logging.warning("Metrics endpoint disabled, cannot listen on port %d: %s", port, exc)
+        return None
+
+
+def main(argv=None):
+    args = parse_args(argv)
     load_dotenv()
     logging.basicConfig(
         level=logging.INFO,
@@ -16,8 +59,31 @@ def main():
         ],
     )
     init_db()
-    start_scheduler()
+    config = load_config()
+    if args.refresh_commutes:
+        enqueue_commute_refresh(config)
+        return
+    start_metrics_server(config.metrics.port if args.metrics_port is None else args.metrics_port)
+    distributed = config.queue.mode == "db"
+    if args.role != "all" and not distributed:
+        logging.warning("--role %s needs \"queue\": {\"mode\": \"db\"}; running everything", args.role)
+        args.role = "all"
+    telegram_token = os.getenv("TELEGRAM_TOKEN")
+    # the outbox has no leases, so only the scheduler process sends messages;
+    # workers just write outbox rows
+    if telegram_token and args.role in ("all", "scheduler"):
+        start_outbox_worker(
+            get_notifier(telegram_token), settings=config.notifications
+        )
+    scheduler = start_scheduler() if args.role in ("all", "scheduler") else None
+    worker = start_queue_worker(config) if distributed and args.role in ("all", "worker") else None
     input("Scheduler started. Press Enter to exit...\n")
+    if scheduler:
+        scheduler.shutdown()
+    if worker:
+        worker.stop()
+    stop_outbox_worker()
+    shutdown_notifiers()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,319 @@
+from concurrent.futures import Future, wait
+from datetime import datetime, timedelta
+from typing import Iterable
+import json
+import logging
+import threading
+
+from sqlalchemy import func, or_
+
+from .. import metrics
+from ..config import NotificationSettings
+from ..db.database import SessionLocal
+from ..db.models import CommuteTime, Listing, NotificationOutbox
+from .telegram_bot import DigestEntry, TelegramNotifier, digest_messages
+
+DELIVERY_SECONDS = metrics.histogram(
+    "otodombot_notification_delivery_seconds",
+    "Time from writing an outbox row to Telegram confirming it",
+    buckets=(1, 5, 15, 30, 60, 300, 900, 1800, 3600, 7200),
+)
+OUTBOX_RESULTS = metrics.counter(
+    "otodombot_outbox_results_total", "Outbox delivery attempts by result", ("result",)
+)
+
+
+def idempotency_key(listing_id: int, chat_id: str) -> str:
+    """Return the key identifying one announcement of a listing in one chat."""
+    return f"listing:{listing_id}:chat:{chat_id}"
+
+
+def enqueue_notification(
+    session,
+    listing_id: int,
+    chat_ids: Iterable[str],
+    text: str,
+    photos: Iterable[str] | None = None,
+) -> int:
+    """Add outbox rows for ``listing_id`` to ``session`` without committing.
+
+    Call this inside the transaction that writes the listing so that the
+    announcement is stored atomically with it. Chats that already have a row
+    for this listing are skipped. Returns the number of rows added.
+    """
+    photo_json = json.dumps(list(photos or []))
+    added = 0
+    for cid in chat_ids:
+        key = idempotency_key(listing_id, str(cid))
+        if session.query(NotificationOutbox.id).filter_by(idempotency_key=key).first():
+            continue
+        session.add(
+            NotificationOutbox(
+                listing_id=listing_id,
+                chat_id=str(cid),
+                idempotency_key=key,
+                text=text,
+                photos=photo_json,
+            )
+        )
+        added += 1
+    return added
+
+
+class OutboxWorker:
+    """Background thread delivering pending outbox rows in batches.
+
+    Rows are marked as sent only after Telegram confirmed delivery, so a
+    crash between sending and committing leads to a repeated message rather
+    than a lost one (at-least-once delivery). A row whose message is still
+    on its way is not sent again; its result is recorded whenever it
+    arrives. Failed rows wait ``retry_backoff`` seconds, doubling with each
+    attempt, and rows failing ``max_attempts`` times are marked ``failed``
+    and left for inspection.
+
+    In ``digest`` mode rows of a chat are held back until the oldest one is
+    ``digest_window_minutes`` old and are then sent as one ranked digest.
+    """
+
+    def __init__(
+        self,
+        notifier: TelegramNotifier,
+        session_factory=SessionLocal,
+        batch_size: int = 20,
+        poll_interval: float = 10.0,
+        max_attempts: int = 5,
+        send_timeout: float = 30.0,
+        settings: NotificationSettings | None = None,
+        retry_backoff: float = 30.0,
+        max_backoff: float = 3600.0,
+    ):
+        self.notifier = notifier
+        self.settings = settings or NotificationSettings()
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        # how long one drain waits for the batch it sent; later results are
+        # picked up by the next drain
+        self.send_timeout = send_timeout
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        # send futures by idempotency key, only touched by the draining thread
+        self._in_flight: dict[str, list[Future]] = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="outbox-worker", daemon=True)
+
+    def start(self) -> "OutboxWorker":
+        if not self._thread.is_alive():
+            self._thread.start()
+            logging.info("Outbox worker started")
+        return self
+
+    def wake(self) -> None:
+        """Drain the outbox now instead of waiting for the next poll."""
+        self._wake.set()
+
+    def stop(self, timeout: float | None = 30.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+            logging.info("Outbox worker stopped")
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                while self.drain_once() and not self._stop.is_set():
+                    pass
+            except Exception as exc:
+                logging.error("Error draining notification outbox: %s", exc, exc_info=True)
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def drain_once(self) -> int:
+        """Send one batch of due rows and return how many deliveries were recorded.
+
+        The drain waits at most ``send_timeout`` for the whole batch. Rows
+        still in flight after that stay pending and are settled later.
+        """
+        session = self.session_factory()
+        try:
+            if self.settings.mode == "digest":
+                futures = self._send_digests(session)
+            else:
+                futures = self._send_batch(session)
+            if futures:
+                wait(futures, timeout=self.send_timeout)
+            sent = self._settle(session)
+            session.commit()
+            return sent
+        finally:
+            session.close()
+
+    def _ready(self, query):
+        """Restrict ``query`` to pending rows that are due and not in flight."""
+        query = query.filter(
+            NotificationOutbox.status == "pending",
+            or_(
+                NotificationOutbox.available_at.is_(None),
+                NotificationOutbox.available_at <= datetime.utcnow(),
+            ),
+        )
+        if self._in_flight:
+            query = query.filter(NotificationOutbox.idempotency_key.notin_(list(self._in_flight)))
+        return query
+
+    def _track(self, key: str, futures: list[Future]) -> None:
+        self._in_flight[key] = futures
+        for fut in futures:
+            # a late result wakes the worker so it is recorded promptly
+            fut.add_done_callback(lambda _: self._wake.set())
+
+    def _send_batch(self, session) -> list[Future]:
+        rows = (
+            self._ready(session.query(NotificationOutbox))
+            .order_by(NotificationOutbox.id)
+            .limit(self.batch_size)
+            .all()
+        )
+        if not rows:
+            return []
+        logging.debug("Sending %d outbox notifications", len(rows))
+        futures = []
+        for row in rows:
+            fut = self.notifier.send_listing(row.chat_id, row.text, json.loads(row.photos or "[]"))
+            self._track(row.idempotency_key, [fut])
+            futures.append(fut)
+        return futures
+
+    def _send_digests(self, session) -> list[Future]:
+        cutoff = datetime.utcnow() - timedelta(minutes=self.settings.digest_window_minutes)
+        due_chats = [
+            cid
+            for (cid,) in self._ready(session.query(NotificationOutbox.chat_id))
+            .group_by(NotificationOutbox.chat_id)
+            .having(func.min(NotificationOutbox.created_at) <= cutoff)
+        ]
+        sent: list[Future] = []
+        for cid in due_chats:
+            rows = (
+                self._ready(session.query(NotificationOutbox))
+                .filter(NotificationOutbox.chat_id == cid)
+                .order_by(NotificationOutbox.id)
+                .all()
+            )
+            messages = digest_messages(
+                self._digest_entries(session, rows),
+                order=self.settings.order_for(cid),
+                top_n=self.settings.digest_top_photos,
+            )
+            logging.debug("Sending digest of %d listings to %s", len(rows), cid)
+            # a row depends only on the messages announcing its own listing,
+            # so a retry re-sends just the listings that were not delivered
+            by_listing: dict[int, list[Future]] = {}
+            for text, photos, listing_ids in messages:
+                fut = self.notifier.send_listing(cid, text, photos)
+                sent.append(fut)
+                for listing_id in listing_ids:
+                    by_listing.setdefault(listing_id, []).append(fut)
+            for row in rows:
+                self._track(row.idempotency_key, by_listing.get(row.listing_id, []))
+        return sent
+
+    def _settle(self, session) -> int:
+        """Record the result of every row whose messages have all finished."""
+        done = [key for key, futures in self._in_flight.items() if all(f.done() for f in futures)]
+        if not done:
+            return 0
+        sent = 0
+        for row in session.query(NotificationOutbox).filter(NotificationOutbox.idempotency_key.in_(done)):
+            if self._record_result(row, _error(self._in_flight[row.idempotency_key])):
+                sent += 1
+        for key in done:
+            del self._in_flight[key]
+        return sent
+
+    def _digest_entries(self, session, rows) -> list[DigestEntry]:
+        ids = {row.listing_id for row in rows}
+        listings = {l.id: l for l in session.query(Listing).filter(Listing.id.in_(ids))}
+        commutes: dict[int, dict[str, int | None]] = {}
+        for c in session.query(CommuteTime).filter(CommuteTime.listing_id.in_(ids)):
+            commutes.setdefault(c.listing_id, {})[c.destination] = c.minutes
+        entries = []
+        for row in rows:
+            listing = listings.get(row.listing_id)
+            entries.append(
+                DigestEntry(
+                    listing_id=row.listing_id,
+                    title=listing.title if listing else "",
+                    price=listing.price if listing else None,
+                    url=listing.url if listing else "",
+                    text=row.text,
+                    photos=json.loads(row.photos or "[]"),
+                    commutes=commutes.get(row.listing_id, {}),
+                    created_at=row.created_at,
+                )
+            )
+        return entries
+
+    def _record_result(self, row: NotificationOutbox, error: str | None) -> bool:
+        row.attempts = (row.attempts or 0) + 1
+        if error is None:
+            row.status = "sent"
+            row.sent_at = datetime.utcnow()
+            row.last_error = None
+            OUTBOX_RESULTS.inc(result="sent")
+            if row.created_at:
+                DELIVERY_SECONDS.observe((row.sent_at - row.created_at).total_seconds())
+            return True
+        OUTBOX_RESULTS.inc(result="failed" if row.attempts >= self.max_attempts else "retry")
+        row.last_error = error
+        logging.warning(
+            "Notification %s failed (attempt %d): %s",
+            row.idempotency_key,
+            row.attempts,
+            error,
+        )
+        if row.attempts >= self.max_attempts:
+            row.status = "failed"
+        else:
+            delay = min(self.retry_backoff * 2 ** (row.attempts - 1), self.max_backoff)
+            row.available_at = datetime.utcnow() + timedelta(seconds=delay)
+        return False
+
+
+def _error(futures: list[Future]) -> str | None:
+    """Error message of the first failed future, or ``None`` when all succeeded."""
+    for fut in futures:
+        exc = fut.exception()
+        if exc is not None:
+            return str(exc) or exc.__class__.__name__
+    return None
+
+
+_worker: OutboxWorker | None = None
+_worker_lock = threading.Lock()
+
+
+def start_outbox_worker(notifier: TelegramNotifier, **kwargs) -> OutboxWorker:
+    """Start the process-wide outbox worker if it is not running yet."""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = OutboxWorker(notifier, **kwargs).start()
+        return _worker
+
+
+def wake_outbox_worker() -> None:
+    """Ask the running outbox worker, if any, to drain immediately."""
+    if _worker is not None:
+        _worker.wake()
+
+
+def stop_outbox_worker(timeout: float | None = 30.0) -> None:
+    global _worker
+    with _worker_lock:
+        worker, _worker = _worker, None
+    if worker is not None:
+        worker.stop(timeout)
@@ -1,8 +1,30 @@
 from typing import Iterable
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
 import asyncio
+import html
 import logging
+import os
+import threading
 from pathlib import Path
 from telegram import Bot, InputMediaPhoto
+from telegram.error import BadRequest, NetworkError, RetryAfter
+from telegram.request import HTTPXRequest
+
+from .. import metrics
+
+SEND_SECONDS = metrics.histogram(
+    "otodombot_telegram_send_seconds", "Latency of one Telegram API send", ("kind",)
+)
+MESSAGES = metrics.counter(
+    "otodombot_telegram_messages_total", "Telegram send attempts by result", ("result",)
+)
+
+
+def _api_url() -> str:
+    # TELEGRAM_API_URL points the bot at a stand-in server (benchmarks)
+    return os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
 
 
 def notify(token: str, chat_id: str | Iterable[str], messages: Iterable[str]):
@@ -11,7 +33,7 @@ def notify(token: str, chat_id: str | Iterable[str], messages: Iterable[str]):
     chat_ids = [chat_id] if isinstance(chat_id, str) else list(chat_id)
 
     async def _send():
-        bot = Bot(token=token)
+        bot = Bot(token=token, base_url=_api_url())
         for cid in chat_ids:
             for msg in messages:
                 logging.debug("Sending message to %s", cid)
@@ -20,6 +42,24 @@ def notify(token: str, chat_id: str | Iterable[str], messages: Iterable[str]):
     asyncio.run(_send())
 
 
+def _build_media(text: str, photos: list[str]):
+    """Return ``(media, files)`` for a media group with ``text`` as caption."""
+    media = []
+    files = []
+    for idx, item in enumerate(photos):
+        if Path(item).exists():
+            f = open(item, "rb")
+            files.append(f)
+            photo_input = f
+        else:
+            photo_input = item
+        if idx == 0:
+            media.append(InputMediaPhoto(photo_input, caption=text, parse_mode="HTML"))
+        else:
+            media.append(InputMediaPhoto(photo_input))
+    return media, files
+
+
 def notify_listing(
     token: str,
     chat_id: str | Iterable[str],
@@ -31,23 +71,11 @@ def notify_listing(
     chat_ids = [chat_id] if isinstance(chat_id, str) else list(chat_id)
 
     async def _send():
-        bot = Bot(token=token)
+        bot = Bot(token=token, base_url=_api_url())
         if photos:
             photo_list = list(photos)[:10]
             for cid in chat_ids:
-                media = []
-                files = []
-                for idx, item in enumerate(photo_list):
-                    if Path(item).exists():
-                        f = open(item, "rb")
-                        files.append(f)
-                        photo_input = f
-                    else:
-                        photo_input = item
-                    if idx == 0:
-                        media.append(InputMediaPhoto(photo_input, caption=text, parse_mode="HTML"))
-                    else:
-                        media.append(InputMediaPhoto(photo_input))
+                media, files = _build_media(text, photo_list)
                 await bot.send_media_group(chat_id=cid, media=media)
                 logging.debug("Sent media group to %s", cid)
                 for f in files:
@@ -58,3 +86,337 @@ def notify_listing(
                 await bot.send_message(chat_id=cid, text=text, parse_mode="HTML")
 
     asyncio.run(_send())
+
+
+MAX_MESSAGE_LENGTH = 4096
+DIGEST_ORDERS = ("commute", "price", "newest")
+
+
+@dataclass
+class DigestEntry:
+    """A listing waiting to be announced as part of a digest."""
+
+    listing_id: int
+    title: str
+    price: int | None
+    url: str
+    text: str
+    photos: list[str] = field(default_factory=list)
+    commutes: dict[str, int | None] = field(default_factory=dict)
+    created_at: datetime | None = None
+
+
+def rank_entries(entries: Iterable[DigestEntry], order: str = "commute") -> list[DigestEntry]:
+    """Return entries sorted best first by ``order`` (see ``DIGEST_ORDERS``)."""
+    entries = list(entries)
+    if order == "price":
+        return sorted(entries, key=lambda e: (e.price is None, e.price or 0))
+    if order == "newest":
+        return sorted(entries, key=lambda e: e.created_at or datetime.min, reverse=True)
+    if order != "commute":
+        logging.warning("Unknown digest order %s, using commute", order)
+
+    def total_commute(entry: DigestEntry) -> float:
+        if not entry.commutes:
+            return float("inf")
+        values = entry.commutes.values()
+        if any(v is None for v in values):
+            return float("inf")
+        return float(sum(values))
+
+    return sorted(entries, key=lambda e: (total_commute(e), e.price or 0))
+
+
+def _digest_line(idx: int, entry: DigestEntry) -> str:
+    parts = [f'{idx}. <a href="{html.escape(entry.url)}">{html.escape(entry.title or "Listing")}</a>']
+    if entry.price is not None:
+        parts.append(f"💰 {entry.price}")
+    commutes = [f"{m} min" for m in entry.commutes.values() if m is not None]
+    if commutes:
+        parts.append("🚍 " + " / ".join(commutes))
+    return " — ".join(parts)
+
+
+def digest_messages(
+    entries: Iterable[DigestEntry],
+    order: str = "commute",
+    top_n: int = 3,
+    max_length: int = MAX_MESSAGE_LENGTH,
+) -> list[tuple[str, list[str], list[int]]]:
+    """Like :func:`build_digest`, with the listing IDs each message announces."""
+    ranked = rank_entries(entries, order)
+    if not ranked:
+        return []
+    messages: list[tuple[str, list[str], list[int]]] = []
+    header = f"<b>🏠 {len(ranked)} new listings</b>"
+    chunk = header
+    chunk_ids: list[int] = []
+    for idx, entry in enumerate(ranked, start=1):
+        line = _digest_line(idx, entry)
+        if len(chunk) + len(line) + 1 > max_length:
+            messages.append((chunk, [], chunk_ids))
+            chunk = line
+            chunk_ids = []
+        else:
+            chunk += "\n" + line
+        chunk_ids.append(entry.listing_id)
+    messages.append((chunk, [], chunk_ids))
+    for entry in ranked[:max(top_n, 0)]:
+        messages.append((entry.text, entry.photos, [entry.listing_id]))
+    return messages
+
+
+def build_digest(
+    entries: Iterable[DigestEntry],
+    order: str = "commute",
+    top_n: int = 3,
+    max_length: int = MAX_MESSAGE_LENGTH,
+) -> list[tuple[str, list[str]]]:
+    """Coalesce ``entries`` into ``(text, photos)`` messages.
+
+    A ranked summary of all listings comes first, split to fit Telegram's
+    message size limit. Only the best ``top_n`` listings are then sent in
+    full with their photos.
+    """
+    return [(text, photos) for text, photos, _ in digest_messages(entries, order, top_n, max_length)]
+
+
+@dataclass
+class _Outgoing:
+    chat_id: str
+    text: str
+    photos: list[str] = field(default_factory=list)
+    future: Future = field(default_factory=Future)
+
+
+class TelegramNotifier:
+    """Long-lived Telegram sender running its own event loop in a thread.
+
+    Messages are put on an in-process queue and delivered by a single
+    :class:`telegram.Bot` sharing one HTTP connection pool. Different chats
+    are served concurrently while messages to the same chat keep their order.
+    Telegram flood limits are respected with a minimum interval per chat and
+    a global rate limit; ``RetryAfter`` replies pause sending and the message
+    is retried instead of being dropped.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        global_rate: float = 25.0,
+        per_chat_interval: float = 1.0,
+        pool_size: int = 8,
+        max_retries: int = 5,
+        bot: Bot | None = None,
+    ):
+        self._bot = bot or Bot(
+            token=token,
+            base_url=_api_url(),
+            request=HTTPXRequest(connection_pool_size=pool_size),
+        )
+        self.global_interval = 1.0 / global_rate if global_rate > 0 else 0.0
+        self.per_chat_interval = per_chat_interval
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._run, name="telegram-notifier", daemon=True
+        )
+        self._ready = threading.Event()
+        self._queue: asyncio.Queue | None = None
+        # guards starting, enqueueing and closing across caller threads
+        self._state_lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        # state below is only touched from the notifier loop
+        self._chat_locks: dict[str, asyncio.Lock] = {}
+        self._chat_last_sent: dict[str, float] = {}
+        self._global_lock: asyncio.Lock | None = None
+        self._global_next = 0.0
+        self._paused_until = 0.0
+        self._slots: asyncio.Semaphore | None = None
+        self._pending: set[asyncio.Task] = set()
+
+    def start(self) -> "TelegramNotifier":
+        """Start the sender thread once; a closed notifier cannot be restarted."""
+        with self._state_lock:
+            if self._closed:
+                raise RuntimeError("Notifier is closed")
+            if not self._started:
+                self._started = True
+                self._thread.start()
+                self._ready.wait()
+                logging.info("Telegram notifier started")
+        return self
+
+    def send_listing(self, chat_id: str, text: str, photos: Iterable[str] | None = None) -> Future:
+        """Queue a message (with optional photos) for one chat and return its future."""
+        self.start()
+        item = _Outgoing(chat_id=str(chat_id), text=text, photos=list(photos or [])[:10])
+        with self._state_lock:
+            # checked again so nothing is queued behind close()'s stop marker
+            if self._closed:
+                raise RuntimeError("Notifier is closed")
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+        return item.future
+
+    def notify_listing(
+        self,
+        chat_id: str | Iterable[str],
+        text: str,
+        photos: Iterable[str] | None = None,
+    ) -> list[Future]:
+        """Queue a listing notification for every chat ID without waiting for delivery."""
+        chat_ids = [chat_id] if isinstance(chat_id, str) else list(chat_id)
+        photo_list = list(photos or [])
+        futures = []
+        for cid in chat_ids:
+            fut = self.send_listing(cid, text, photo_list)
+            fut.add_done_callback(_log_failure)
+            futures.append(fut)
+        return futures
+
+    def close(self, timeout: float | None = 30.0) -> None:
+        """Deliver everything still queued and stop the event loop."""
+        with self._state_lock:
+            if self._closed:
+                return
+            self._closed = True
+            if not self._started:
+                return
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, None)
+        self._thread.join(timeout)
+        logging.info("Telegram notifier stopped")
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._main())
+        finally:
+            self._loop.close()
+
+    async def _main(self) -> None:
+        self._queue = asyncio.Queue()
+        self._global_lock = asyncio.Lock()
+        self._slots = asyncio.Semaphore(self.pool_size)
+        try:
+            await self._bot.initialize()
+        except Exception as exc:
+            logging.error("Failed to initialize Telegram bot: %s", exc)
+        self._ready.set()
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is None:
+                    break
+                task = asyncio.create_task(self._deliver(item))
+                self._pending.add(task)
+                task.add_done_callback(self._pending.discard)
+            if self._pending:
+                await asyncio.gather(*self._pending, return_exceptions=True)
+        finally:
+            await self._bot.shutdown()
+
+    async def _wait_turn(self, chat_id: str) -> None:
+        loop = asyncio.get_running_loop()
+        last = self._chat_last_sent.get(chat_id)
+        if last is not None:
+            delay = last + self.per_chat_interval - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        async with self._global_lock:
+            now = loop.time()
+            start = max(now, self._global_next, self._paused_until)
+            self._global_next = start + self.global_interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def _deliver(self, item: _Outgoing) -> None:
+        lock = self._chat_locks.setdefault(item.chat_id, asyncio.Lock())
+        async with lock:
+            failures = 0
+            while True:
+                await self._wait_turn(item.chat_id)
+                try:
+                    async with self._slots:
+                        result = await self._send(item)
+                except RetryAfter as exc:
+                    delay = exc.retry_after
+                    if isinstance(delay, timedelta):
+                        delay = delay.total_seconds()
+                    MESSAGES.inc(result="retry_after")
+                    logging.warning(
+                        "Telegram flood limit hit for %s, retrying in %s s", item.chat_id, delay
+                    )
+                    loop = asyncio.get_running_loop()
+                    self._paused_until = max(self._paused_until, loop.time() + float(delay))
+                    continue
+                except BadRequest as exc:
+                    MESSAGES.inc(result="failed")
+                    item.future.set_exception(exc)
+                    return
+                except NetworkError as exc:
+                    failures += 1
+                    if failures > self.max_retries:
+                        MESSAGES.inc(result="failed")
+                        item.future.set_exception(exc)
+                        return
+                    MESSAGES.inc(result="network_retry")
+                    logging.warning(
+                        "Telegram send to %s failed (%s), retry %d", item.chat_id, exc, failures
+                    )
+                    await asyncio.sleep(min(2 ** failures, 60))
+                    continue
+                except Exception as exc:
+                    MESSAGES.inc(result="failed")
+                    item.future.set_exception(exc)
+                    return
+                finally:
+                    self._chat_last_sent[item.chat_id] = asyncio.get_running_loop().time()
+                MESSAGES.inc(result="sent")
+                item.future.set_result(result)
+                return
+
+    async def _send(self, item: _Outgoing):
+        if item.photos:
+            media, files = _build_media(item.text, item.photos)
+            try:
+                with metrics.timed(SEND_SECONDS, kind="media_group"):
+                    result = await self._bot.send_media_group(chat_id=item.chat_id, media=media)
+            finally:
+                for f in files:
+                    f.close()
+            logging.debug("Sent media group to %s", item.chat_id)
+            return result
+        logging.debug("Sending listing to %s", item.chat_id)
+        with metrics.timed(SEND_SECONDS, kind="message"):
+            return await self._bot.send_message(chat_id=item.chat_id, text=item.text, parse_mode="HTML")
+
+
+def _log_failure(fut: Future) -> None:
+    exc = fut.exception()
+    if exc is not None:
+        logging.error("Failed to deliver Telegram notification: %s", exc)
+
+
+_notifiers: dict[str, TelegramNotifier] = {}
+_notifiers_lock = threading.Lock()
+
+
+def get_notifier(token: str) -> TelegramNotifier:
+    """Return the process-wide notifier for ``token``, starting it on first use."""
+    with _notifiers_lock:
+        notifier = _notifiers.get(token)
+        if notifier is None:
+            notifier = TelegramNotifier(token).start()
+            _notifiers[token] = notifier
+        return notifier
+
+
+def shutdown_notifiers(timeout: float | None = 30.0) -> None:
+    """Flush and stop all notifiers created by :func:`get_notifier`."""
+    with _notifiers_lock:
+        notifiers = list(_notifiers.values())
+        _notifiers.clear()
+    for notifier in notifiers:
+        notifier.close(timeout)
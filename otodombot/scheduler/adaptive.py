@@ -0,0 +1,199 @@
+from datetime import datetime, timedelta
+from typing import Callable
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import logging
+import threading
+import time
+
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from ..config import ScheduleSettings
+from ..db.database import SessionLocal
+from ..db.models import SearchRun
+
+
+def is_night(hour: int, start: int, end: int) -> bool:
+    """Return True if ``hour`` falls in the [start, end) window, wrapping midnight."""
+    if start == end:
+        return False
+    if start < end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+def update_arrival_rate(
+    previous: float | None,
+    new_listings: int,
+    elapsed_hours: float,
+    alpha: float,
+) -> float:
+    """Blend the new-listings-per-hour seen in this run into the EWMA."""
+    sample = new_listings / max(elapsed_hours, 1 / 60)
+    if previous is None:
+        return sample
+    return alpha * sample + (1 - alpha) * previous
+
+
+def choose_interval(
+    rate_per_hour: float | None,
+    base_minutes: float,
+    hour: int,
+    settings: ScheduleSettings,
+) -> float:
+    """Pick the minutes until the next run of a search.
+
+    The interval aims to find ``target_new_per_run`` listings per run at
+    the observed arrival rate, is stretched by ``night_factor`` at night
+    and clamped to the configured bounds. Without a rate yet the search's
+    own ``interval_minutes`` is used.
+    """
+    if rate_per_hour is None:
+        interval = base_minutes
+    elif rate_per_hour <= 0:
+        interval = settings.max_interval_minutes
+    else:
+        interval = settings.target_new_per_run / rate_per_hour * 60
+    if is_night(hour, settings.night_start, settings.night_end):
+        interval *= settings.night_factor
+    return float(min(max(interval, settings.min_interval_minutes), settings.max_interval_minutes))
+
+
+def summarize_stats(stats: list[dict]) -> tuple[int, int]:
+    """Return (listings discovered, new listings) from pipeline stage stats."""
+    by_name = {s["name"]: s for s in stats or []}
+    seen = by_name.get("discover", {}).get("emitted", 0)
+    if "notify" in by_name:
+        new = by_name["notify"].get("processed", 0)
+    else:
+        # with the shared job queue the run only queues URLs it has not seen
+        new = by_name.get("enqueue", {}).get("emitted", 0)
+    return seen, new
+
+
+class AdaptiveScheduler:
+    """Runs each named search on its own self-tuning schedule.
+
+    After every run the next one is booked as a one-off job, so the
+    interval can change from run to run. A per-search lock (plus
+    ``max_instances=1``) keeps two runs of the same search from
+    overlapping. Every run is stored in the ``search_runs`` table.
+    """
+
+    def __init__(
+        self,
+        run_search: Callable[[str], list[dict]],
+        config,
+        session_factory=SessionLocal,
+        scheduler: BackgroundScheduler | None = None,
+    ):
+        self.run_search = run_search
+        self.config = config
+        self.session_factory = session_factory
+        self.scheduler = scheduler or BackgroundScheduler(timezone="UTC")
+        self._locks = {p.name: threading.Lock() for p in config.searches}
+        try:
+            self._zone = ZoneInfo(config.schedule.timezone)
+        except (ZoneInfoNotFoundError, ValueError):
+            logging.warning("Unknown timezone %s, using UTC", config.schedule.timezone)
+            self._zone = ZoneInfo("UTC")
+
+    def start(self) -> None:
+        for profile in self.config.searches:
+            self._book(profile.name, 0)
+        self.scheduler.start()
+        logging.info("Adaptive scheduler started for %d searches", len(self.config.searches))
+
+    def shutdown(self) -> None:
+        self.scheduler.shutdown(wait=False)
+
+    def _book(self, name: str, minutes: float) -> None:
+        self.scheduler.add_job(
+            self.run,
+            "date",
+            run_date=datetime.utcnow() + timedelta(minutes=minutes),
+            args=[name],
+            id=f"search:{name}",
+            replace_existing=True,
+            max_instances=1,
+            misfire_grace_time=None,
+        )
+
+    def _last_run(self, session, name: str) -> SearchRun | None:
+        return (
+            session.query(SearchRun)
+            .filter(SearchRun.search == name, SearchRun.error.is_(None), SearchRun.finished_at.isnot(None))
+            .order_by(SearchRun.started_at.desc())
+            .first()
+        )
+
+    def run(self, name: str) -> SearchRun | None:
+        """Run search ``name`` once, record it and book the next run."""
+        profile = self.config.get_search(name)
+        lock = self._locks.setdefault(name, threading.Lock())
+        if profile is None:
+            logging.error("Unknown search %s", name)
+            return None
+        if not lock.acquire(blocking=False):
+            logging.warning("Search %s is still running; skipping overlapping run", name)
+            return None
+        try:
+            started_at = datetime.utcnow()
+            start = time.monotonic()
+            error = None
+            seen = new = 0
+            try:
+                seen, new = summarize_stats(self.run_search(name))
+            except Exception as exc:
+                logging.error("Search %s failed: %s", name, exc, exc_info=True)
+                error = str(exc)[:500]
+            duration = time.monotonic() - start
+            settings = self.config.schedule
+            # without a recorded run the next one still gets booked
+            interval = profile.interval_minutes
+            rate = None
+            record = None
+            try:
+                session = self.session_factory()
+                try:
+                    last = self._last_run(session, name)
+                    rate = last.arrival_rate if last else None
+                    if error is None and last is not None:
+                        elapsed = (started_at - last.started_at).total_seconds() / 3600
+                        rate = update_arrival_rate(rate, new, elapsed, settings.ewma_alpha)
+                    hour = datetime.now(self._zone).hour
+                    interval = choose_interval(rate, profile.interval_minutes, hour, settings)
+                    record = SearchRun(
+                        search=name,
+                        started_at=started_at,
+                        finished_at=datetime.utcnow(),
+                        duration_seconds=round(duration, 3),
+                        seen_listings=seen,
+                        new_listings=new,
+                        arrival_rate=rate,
+                        next_interval_minutes=round(interval, 2),
+                        error=error,
+                    )
+                    session.add(record)
+                    session.commit()
+                    session.refresh(record)
+                    session.expunge(record)
+                finally:
+                    session.close()
+            except Exception as exc:
+                logging.error("Could not record run of search %s: %s", name, exc, exc_info=True)
+                interval = profile.interval_minutes
+                record = None
+            finally:
+                self._book(name, interval)
+            logging.info(
+                "Search %s took %.1fs, %d new of %d; rate %s/h, next run in %.0f min",
+                name,
+                duration,
+                new,
+                seen,
+                f"{rate:.2f}" if rate is not None else "n/a",
+                interval,
+            )
+            return record
+        finally:
+            lock.release()
@@ -0,0 +1,163 @@
+from datetime import datetime, timedelta
+import json
+import logging
+import zlib
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from ..db.database import SessionLocal
+from ..db.models import ScrapeRun, ScrapeRunUrl
+
+# order in which a URL passes the checkpointed stages
+STATES = ("pending", "fetched", "parsed", "enriched", "notified")
+# "done": stored without an announcement; "skipped": dropped by a stage
+TERMINAL_STATES = ("notified", "done", "skipped", "failed")
+STATE_RANK = {state: rank for rank, state in enumerate(STATES)}
+STATE_RANK.update({state: len(STATES) - 1 for state in TERMINAL_STATES})
+
+
+class RunCheckpoint:
+    """Persistent record of one scrape run and the progress of its URLs.
+
+    :meth:`open` resumes the newest unfinished run of a search, or starts a
+    new one. Stages report progress with :meth:`advance`; fetched HTML is
+    kept (compressed) until enrichment no longer needs it, so a resumed
+    URL continues from the stage after the last one it completed.
+    """
+
+    def __init__(self, run_id: int, search: str, sorts_done: list[str], session_factory=SessionLocal):
+        self.run_id = run_id
+        self.search = search
+        self.sorts_done = set(sorts_done)
+        self.session_factory = session_factory
+        self.resumed = False
+
+    @classmethod
+    def open(cls, search: str, session_factory=SessionLocal, max_age_hours: float = 24.0) -> "RunCheckpoint":
+        session = session_factory()
+        try:
+            cutoff = datetime.utcnow() - timedelta(hours=max_age_hours)
+            stale = session.execute(
+                update(ScrapeRun)
+                .where(ScrapeRun.search == search, ScrapeRun.status == "running", ScrapeRun.started_at < cutoff)
+                .values(status="abandoned", finished_at=datetime.utcnow())
+            )
+            if stale.rowcount:
+                logging.info("Abandoned %d stale runs of search %s", stale.rowcount, search)
+            run = (
+                session.query(ScrapeRun)
+                .filter_by(search=search, status="running")
+                .order_by(ScrapeRun.id.desc())
+                .first()
+            )
+            resumed = run is not None
+            if run is None:
+                run = ScrapeRun(search=search, status="running", sorts_done="[]", started_at=datetime.utcnow())
+                session.add(run)
+            session.commit()
+            checkpoint = cls(run.id, search, json.loads(run.sorts_done or "[]"), session_factory)
+            checkpoint.resumed = resumed
+        finally:
+            session.close()
+        if resumed:
+            logging.info("Resuming run %d of search %s", checkpoint.run_id, search)
+        return checkpoint
+
+    def known_urls(self) -> set[str]:
+        session = self.session_factory()
+        try:
+            return {
+                url for (url,) in session.query(ScrapeRunUrl.url).filter_by(run_id=self.run_id)
+            }
+        finally:
+            session.close()
+
+    def unfinished(self) -> list[dict]:
+        """Return the state, payload and HTML of URLs not yet in a terminal state."""
+        session = self.session_factory()
+        try:
+            rows = (
+                session.query(ScrapeRunUrl)
+                .filter(ScrapeRunUrl.run_id == self.run_id, ScrapeRunUrl.state.notin_(TERMINAL_STATES))
+                .order_by(ScrapeRunUrl.id)
+                .all()
+            )
+            return [
+                {
+                    "url": row.url,
+                    "state": row.state,
+                    "payload": json.loads(row.payload or "{}"),
+                    "html": zlib.decompress(row.html).decode("utf-8") if row.html else None,
+                }
+                for row in rows
+            ]
+        finally:
+            session.close()
+
+    def record_url(self, url: str) -> bool:
+        """Add a discovered URL as pending; False if the run already has it."""
+        session = self.session_factory()
+        try:
+            session.add(ScrapeRunUrl(run_id=self.run_id, url=url, state="pending", updated_at=datetime.utcnow()))
+            session.commit()
+            return True
+        except IntegrityError:
+            session.rollback()
+            return False
+        finally:
+            session.close()
+
+    def mark_sort_done(self, sort: str) -> None:
+        self.sorts_done.add(sort)
+        session = self.session_factory()
+        try:
+            session.execute(
+                update(ScrapeRun)
+                .where(ScrapeRun.id == self.run_id)
+                .values(sorts_done=json.dumps(sorted(self.sorts_done)))
+            )
+            session.commit()
+        finally:
+            session.close()
+
+    def advance(
+        self,
+        url: str,
+        state: str,
+        payload: dict | None = None,
+        html: str | None = None,
+        error: str | None = None,
+    ) -> None:
+        """Record that ``url`` reached ``state``."""
+        values = {"state": state, "updated_at": datetime.utcnow()}
+        if payload is not None:
+            values["payload"] = json.dumps(payload, default=str)
+        if html is not None:
+            values["html"] = zlib.compress(html.encode("utf-8"), 6)
+        elif STATE_RANK[state] >= STATE_RANK["enriched"]:
+            values["html"] = None
+        if error is not None:
+            values["error"] = error[:500]
+        session = self.session_factory()
+        try:
+            session.execute(
+                update(ScrapeRunUrl)
+                .where(ScrapeRunUrl.run_id == self.run_id, ScrapeRunUrl.url == url)
+                .values(**values)
+            )
+            session.commit()
+        finally:
+            session.close()
+
+    def finish(self) -> None:
+        session = self.session_factory()
+        try:
+            session.execute(
+                update(ScrapeRun)
+                .where(ScrapeRun.id == self.run_id)
+                .values(status="finished", finished_at=datetime.utcnow())
+            )
+            session.commit()
+        finally:
+            session.close()
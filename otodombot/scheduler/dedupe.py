@@ -0,0 +1,53 @@
+import threading
+import time
+import urllib.parse
+
+
+def canonical_listing_url(url: str) -> str:
+    """Strip query strings, fragments and trailing slashes from a listing URL."""
+    parts = urllib.parse.urlsplit(url.strip())
+    path = parts.path.rstrip("/") or "/"
+    return urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, "", ""))
+
+
+class ClaimRegistry:
+    """Process-wide record of which search claimed a listing URL.
+
+    Searches running concurrently share one registry, so a listing found
+    by several of them is fetched and enriched only by the first. Claims
+    expire after ``ttl`` seconds; from then on the database's
+    ``reparse_after_days`` check decides whether to look at it again.
+    """
+
+    def __init__(self, ttl: float = 3600.0):
+        self.ttl = ttl
+        self._claims: dict[str, tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def claim(self, url: str, owner: str) -> bool:
+        """Claim ``url`` for ``owner``; False if another search holds it."""
+        key = canonical_listing_url(url)
+        now = time.monotonic()
+        with self._lock:
+            current = self._claims.get(key)
+            if current and current[0] != owner and now - current[1] < self.ttl:
+                return False
+            self._claims[key] = (owner, now)
+            if len(self._claims) > 10000:
+                self._claims = {k: v for k, v in self._claims.items() if now - v[1] < self.ttl}
+            return True
+
+    def owner(self, url: str) -> str | None:
+        with self._lock:
+            current = self._claims.get(canonical_listing_url(url))
+        if current and time.monotonic() - current[1] < self.ttl:
+            return current[0]
+        return None
+
+    def release(self, url: str, owner: str | None = None) -> None:
+        """Drop the claim on ``url``; with ``owner`` only if that search holds it."""
+        key = canonical_listing_url(url)
+        with self._lock:
+            current = self._claims.get(key)
+            if current and (owner is None or current[0] == owner):
+                del self._claims[key]
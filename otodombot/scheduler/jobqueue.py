@@ -0,0 +1,257 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from ..db.database import SessionLocal
+from ..db.models import Job
+
+ACTIVE_STATUSES = ("pending", "leased")
+
+
+def default_owner() -> str:
+    """Identifier for this process, unique across hosts."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+@dataclass
+class ClaimedJob:
+    id: int
+    kind: str
+    key: str
+    payload: dict
+    attempts: int
+
+
+def enqueue_job(session, kind: str, key: str, payload: dict | None = None, max_attempts: int = 3) -> bool:
+    """Queue a job unless one with ``key`` is already pending or leased.
+
+    Finished jobs with the same key are reset to pending. The session is
+    committed; a concurrent insert of the same key counts as already queued.
+    """
+    now = datetime.utcnow()
+    data = json.dumps(payload or {})
+    job = session.query(Job).filter_by(key=key).first()
+    if job is not None:
+        if job.status in ACTIVE_STATUSES:
+            return False
+        job.status = "pending"
+        job.payload = data
+        job.attempts = 0
+        job.max_attempts = max_attempts
+        job.available_at = now
+        job.lease_owner = None
+        job.lease_expires_at = None
+        job.last_error = None
+        job.updated_at = now
+    else:
+        session.add(
+            Job(
+                kind=kind,
+                key=key,
+                payload=data,
+                max_attempts=max_attempts,
+                available_at=now,
+                created_at=now,
+                updated_at=now,
+            )
+        )
+    try:
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        return False
+    return True
+
+
+class JobQueue:
+    """Lease-based job queue stored in the ``jobs`` table.
+
+    Jobs are claimed with a conditional UPDATE that only succeeds while the
+    job is still claimable, so two workers racing for the same row cannot
+    both win, on SQLite as well as on a networked database. A claimed job
+    stays invisible until its lease expires; :meth:`start_heartbeat`
+    keeps extending the leases of jobs this process is still working on.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        owner: str | None = None,
+        lease_seconds: float = 300.0,
+        retry_delay: float = 60.0,
+    ):
+        self.session_factory = session_factory
+        self.owner = owner or default_owner()
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+        self._tracked: set[int] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat: threading.Thread | None = None
+
+    def _claimable(self, now: datetime):
+        return and_(
+            Job.attempts < Job.max_attempts,
+            or_(
+                and_(Job.status == "pending", Job.available_at <= now),
+                and_(Job.status == "leased", Job.lease_expires_at < now),
+            ),
+        )
+
+    def claim(self, kinds: list[str], limit: int = 1) -> list[ClaimedJob]:
+        """Lease up to ``limit`` jobs of the given kinds for this worker."""
+        now = datetime.utcnow()
+        session = self.session_factory()
+        claimed: list[ClaimedJob] = []
+        try:
+            # leases that expired on their last allowed attempt are dead
+            session.execute(
+                update(Job)
+                .where(
+                    Job.status == "leased",
+                    Job.lease_expires_at < now,
+                    Job.attempts >= Job.max_attempts,
+                )
+                .values(status="failed", last_error="lease expired", updated_at=now)
+            )
+            session.commit()
+            candidates = session.execute(
+                select(Job.id)
+                .where(Job.kind.in_(kinds), self._claimable(now))
+                .order_by(Job.available_at, Job.id)
+                .limit(limit * 3)
+            ).scalars().all()
+            for job_id in candidates:
+                if len(claimed) >= limit:
+                    break
+                result = session.execute(
+                    update(Job)
+                    .where(Job.id == job_id, self._claimable(now))
+                    .values(
+                        status="leased",
+                        lease_owner=self.owner,
+                        lease_expires_at=now + timedelta(seconds=self.lease_seconds),
+                        heartbeat_at=now,
+                        attempts=Job.attempts + 1,
+                        updated_at=now,
+                    )
+                )
+                session.commit()
+                if result.rowcount != 1:
+                    continue
+                job = session.get(Job, job_id)
+                claimed.append(
+                    ClaimedJob(job.id, job.kind, job.key, json.loads(job.payload or "{}"), job.attempts)
+                )
+                self.track(job.id)
+        finally:
+            session.close()
+        return claimed
+
+    def _owned(self, job_id: int):
+        return and_(Job.id == job_id, Job.status == "leased", Job.lease_owner == self.owner)
+
+    def complete(self, job_id: int) -> bool:
+        """Mark a leased job done; False if the lease was lost meanwhile."""
+        self.untrack(job_id)
+        now = datetime.utcnow()
+        session = self.session_factory()
+        try:
+            result = session.execute(
+                update(Job)
+                .where(self._owned(job_id))
+                .values(status="done", lease_expires_at=None, updated_at=now)
+            )
+            session.commit()
+        finally:
+            session.close()
+        if result.rowcount != 1:
+            logging.warning("Lease on job %s was lost before it completed", job_id)
+            return False
+        return True
+
+    def fail(self, job_id: int, error: str) -> None:
+        """Release a job after an error; it is retried after ``retry_delay``
+        seconds, or marked failed once it used up its attempts."""
+        self.untrack(job_id)
+        now = datetime.utcnow()
+        session = self.session_factory()
+        try:
+            job = session.get(Job, job_id)
+            if job is None or job.lease_owner != self.owner or job.status != "leased":
+                return
+            exhausted = job.attempts >= job.max_attempts
+            session.execute(
+                update(Job)
+                .where(self._owned(job_id))
+                .values(
+                    status="failed" if exhausted else "pending",
+                    last_error=str(error)[:500],
+                    lease_expires_at=None,
+                    available_at=now + timedelta(seconds=self.retry_delay * job.attempts),
+                    updated_at=now,
+                )
+            )
+            session.commit()
+        finally:
+            session.close()
+
+    def track(self, job_id: int) -> None:
+        with self._lock:
+            self._tracked.add(job_id)
+
+    def untrack(self, job_id: int) -> None:
+        with self._lock:
+            self._tracked.discard(job_id)
+
+    def heartbeat(self) -> int:
+        """Extend the leases of all tracked jobs; return how many were renewed."""
+        with self._lock:
+            ids = list(self._tracked)
+        if not ids:
+            return 0
+        now = datetime.utcnow()
+        session = self.session_factory()
+        try:
+            result = session.execute(
+                update(Job)
+                .where(Job.id.in_(ids), Job.status == "leased", Job.lease_owner == self.owner)
+                .values(
+                    lease_expires_at=now + timedelta(seconds=self.lease_seconds),
+                    heartbeat_at=now,
+                )
+            )
+            session.commit()
+        finally:
+            session.close()
+        if result.rowcount != len(ids):
+            logging.warning("Renewed %d of %d job leases", result.rowcount, len(ids))
+        return result.rowcount
+
+    def start_heartbeat(self) -> None:
+        if self._heartbeat is not None:
+            return
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._beat, name="job-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def stop_heartbeat(self) -> None:
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+
+    def _beat(self) -> None:
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                self.heartbeat()
+            except Exception as exc:
+                logging.error("Job heartbeat failed: %s", exc)
@@ -0,0 +1,230 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable
+import inspect
+import logging
+import queue
+import threading
+import time
+
+from .. import metrics
+
+_DONE = object()
+
+STAGE_SECONDS = metrics.histogram(
+    "otodombot_stage_seconds", "Time a pipeline stage spent on one item", ("pipeline", "stage")
+)
+STAGE_ITEMS = metrics.counter(
+    "otodombot_stage_items_total", "Items handled by a pipeline stage", ("pipeline", "stage", "outcome")
+)
+QUEUE_DEPTH = metrics.gauge(
+    "otodombot_stage_queue_depth", "Items waiting in front of a pipeline stage", ("pipeline", "stage")
+)
+
+
+@dataclass
+class StageStats:
+    """Counters for one pipeline stage."""
+
+    name: str
+    workers: int
+    queue_size: int
+    processed: int = 0
+    emitted: int = 0
+    dropped: int = 0
+    errors: int = 0
+    busy_seconds: float = 0.0
+    # time spent waiting for room in the next stage's queue
+    blocked_seconds: float = 0.0
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    def as_dict(self) -> dict:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            "name": self.name,
+            "workers": self.workers,
+            "processed": self.processed,
+            "emitted": self.emitted,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "queue_depth": self.queue_depth,
+            "queue_size": self.queue_size,
+            "max_queue_depth": self.max_queue_depth,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "blocked_seconds": round(self.blocked_seconds, 3),
+            "throughput_per_min": round(self.processed / elapsed * 60, 2),
+            "utilization": round(self.busy_seconds / (elapsed * self.workers), 3),
+        }
+
+
+class Stage:
+    """A named step run by ``workers`` threads reading from a bounded queue.
+
+    ``func`` receives one item and returns ``None`` to drop it, a single
+    item to pass downstream, or a generator yielding any number of items.
+    Downstream puts block while the next queue is full, so a slow stage
+    throttles the ones feeding it.
+    """
+
+    def __init__(self, name: str, func: Callable[[Any], Any], workers: int = 1, queue_size: int = 10):
+        self.name = name
+        self.func = func
+        self.workers = max(int(workers), 1)
+        self.queue_size = max(int(queue_size), 1)
+
+
+class Pipeline:
+    """Runs items through a chain of :class:`Stage` objects concurrently."""
+
+    def __init__(self, stages: list[Stage], name: str = "pipeline", report_interval: float = 30.0):
+        if not stages:
+            raise ValueError("Pipeline needs at least one stage")
+        self.name = name
+        self.stages = stages
+        self.report_interval = report_interval
+        self.queues: list[queue.Queue] = []
+        self.stats: list[StageStats] = []
+        self._lock = threading.Lock()
+        self._finished_workers: list[int] = []
+
+    def snapshot(self) -> list[dict]:
+        """Return per-stage counters, queue depths and utilization."""
+        with self._lock:
+            for st, q in zip(self.stats, self.queues):
+                st.queue_depth = q.qsize()
+            return [st.as_dict() for st in self.stats]
+
+    def bottleneck(self) -> str | None:
+        """Name of the stage with the highest worker utilization."""
+        snap = self.snapshot()
+        if not snap:
+            return None
+        return max(snap, key=lambda s: s["utilization"])["name"]
+
+    def run(self, items: Iterable) -> list[dict]:
+        """Feed ``items`` into the first stage and block until all stages drain."""
+        self.queues = [queue.Queue(maxsize=s.queue_size) for s in self.stages]
+        self.stats = [StageStats(s.name, s.workers, s.queue_size) for s in self.stages]
+        self._finished_workers = [0] * len(self.stages)
+        threads = []
+        for idx, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                t = threading.Thread(
+                    target=self._work, args=(idx,), name=f"{self.name}-{stage.name}-{n}", daemon=True
+                )
+                t.start()
+                threads.append(t)
+        stop_reporting = threading.Event()
+        reporter = threading.Thread(
+            target=self._report, args=(stop_reporting,), name=f"{self.name}-metrics", daemon=True
+        )
+        reporter.start()
+        try:
+            for item in items:
+                self._put(0, item)
+        finally:
+            for _ in range(self.stages[0].workers):
+                self.queues[0].put(_DONE)
+            for t in threads:
+                t.join()
+            stop_reporting.set()
+            reporter.join()
+        self.log_summary()
+        return self.snapshot()
+
+    def log_summary(self) -> None:
+        for s in self.snapshot():
+            logging.info(
+                "Stage %-8s in=%d out=%d dropped=%d errors=%d max_queue=%d/%d busy=%.1fs blocked=%.1fs "
+                "util=%.0f%% %.1f/min",
+                s["name"],
+                s["processed"],
+                s["emitted"],
+                s["dropped"],
+                s["errors"],
+                s["max_queue_depth"],
+                s["queue_size"],
+                s["busy_seconds"],
+                s["blocked_seconds"],
+                s["utilization"] * 100,
+                s["throughput_per_min"],
+            )
+        logging.info("Pipeline %s bottleneck: %s", self.name, self.bottleneck())
+
+    def _report(self, stop: threading.Event) -> None:
+        while not stop.wait(self.report_interval):
+            depths = ", ".join(f"{s['name']}={s['queue_depth']}" for s in self.snapshot())
+            logging.info("Pipeline %s queues: %s; bottleneck %s", self.name, depths, self.bottleneck())
+
+    def _put(self, idx: int, item) -> None:
+        q = self.queues[idx]
+        q.put(item)
+        depth = q.qsize()
+        QUEUE_DEPTH.set(depth, pipeline=self.name, stage=self.stages[idx].name)
+        st = self.stats[idx]
+        if depth > st.max_queue_depth:
+            with self._lock:
+                st.max_queue_depth = max(st.max_queue_depth, depth)
+
+    def _call(self, stage: Stage, item, trace):
+        start = time.perf_counter()
+        if trace is None:
+            result = stage.func(item)
+        else:
+            with trace.activate():
+                result = stage.func(item)
+            trace.add(stage.name, "stage", start, time.perf_counter())
+        return result
+
+    def _work(self, idx: int) -> None:
+        stage = self.stages[idx]
+        st = self.stats[idx]
+        last = idx == len(self.stages) - 1
+        while True:
+            item = self.queues[idx].get()
+            if item is _DONE:
+                break
+            QUEUE_DEPTH.set(self.queues[idx].qsize(), pipeline=self.name, stage=stage.name)
+            # items may carry a metrics.Trace; spans timed inside the stage land in it
+            trace = getattr(item, "trace", None)
+            start = time.monotonic()
+            # busy time excludes waiting on a full downstream queue, so a
+            # stage throttled by a slow successor does not look saturated
+            blocked = 0.0
+            emitted = 0
+            outcome = "ok"
+            try:
+                result = self._call(stage, item, trace)
+                outputs = result if inspect.isgenerator(result) else ([] if result is None else [result])
+                for out in outputs:
+                    emitted += 1
+                    if not last:
+                        put_start = time.monotonic()
+                        self._put(idx + 1, out)
+                        blocked += time.monotonic() - put_start
+            except Exception as exc:
+                logging.error("Stage %s failed on %r: %s", stage.name, item, exc, exc_info=True)
+                outcome = "error"
+                with self._lock:
+                    st.errors += 1
+            finally:
+                busy = time.monotonic() - start - blocked
+                if outcome == "ok" and emitted == 0:
+                    outcome = "dropped"
+                STAGE_ITEMS.inc(pipeline=self.name, stage=stage.name, outcome=outcome)
+                if not inspect.isgeneratorfunction(stage.func):
+                    STAGE_SECONDS.observe(busy, pipeline=self.name, stage=stage.name)
+                with self._lock:
+                    st.processed += 1
+                    st.emitted += emitted
+                    if emitted == 0:
+                        st.dropped += 1
+                    st.busy_seconds += busy
+                    st.blocked_seconds += blocked
+        with self._lock:
+            self._finished_workers[idx] += 1
+            all_done = self._finished_workers[idx] == stage.workers
+        if all_done and not last:
+            for _ in range(self.stages[idx + 1].workers):
+                self.queues[idx + 1].put(_DONE)
@@ -1,19 +1,39 @@
+from dataclasses import dataclass, field, fields
 from datetime import datetime, timedelta, time
 import logging
 import os
 import json
-from apscheduler.schedulers.background import BackgroundScheduler
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from .. import metrics
 from ..scraper.crawler import OtodomCrawler
-from ..config import load_config
+from ..config import PipelineSettings, load_config
 from ..db.database import SessionLocal
 from ..db.models import Listing, CommuteTime
+from ..db.search import index_listings
 from ..evaluation.location import evaluate_location
 from ..evaluation.chatgpt import rate_listing, extract_address
-from ..notifications.telegram_bot import notify_listing
+from ..evaluation.scoring import update_scores
+from ..notifications.outbox import enqueue_notification, wake_outbox_worker
+from .adaptive import AdaptiveScheduler
+from .checkpoint import STATE_RANK, RunCheckpoint
+from .dedupe import ClaimRegistry, canonical_listing_url
+from .jobqueue import JobQueue, enqueue_job
+from .pipeline import Pipeline, Stage
+
+PARSE_SECONDS = metrics.histogram(
+    "otodombot_parse_seconds",
+    "Time spent extracting one field from a listing page",
+    ("field",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+LISTINGS = metrics.counter(
+    "otodombot_listings_total", "Listings handled by the scrape pipeline", ("search", "outcome")
+)
+SCORING_SECONDS = metrics.histogram("otodombot_scoring_seconds", "Time to rescore all listings")
 
 
 def next_commute_datetime(day_name: str, time_str: str) -> datetime:
@@ -37,7 +57,7 @@ def format_route(route: dict) -> str:
     parts: list[str] = []
     walk = route.get("walk")
     if walk is not None:
-        parts.append(f"\ud83d\udeB6 {walk} min")
+        parts.append(f"\U0001F6B6 {walk} min")
     transport = route.get("transport")
     if transport:
         parts.append(" -> ".join(transport))
@@ -47,200 +67,751 @@ def format_route(route: dict) -> str:
     return " ".join(parts)
 
 
-def process_single_listing(url, crawler, session, config, openai_key, google_key, telegram_token, telegram_chat_ids):
-    try:
-        logging.info("Processing listing %s", url)
-        html = crawler.fetch_listing_details(url)
-        price = crawler.parse_price(html)
-        if price is None:
-            logging.info("Skipping %s due to missing price", url)
-            return
-        external_id = crawler.parse_listing_id(html)
-        floor = crawler.parse_floor(html)
-        if floor and config.search.ignore_floors and floor.lower() in config.search.ignore_floors:
-            logging.info("Skipping %s due to floor %s", url, floor)
-            return
-        is_new = False
-        title = crawler.parse_title(html)
-        description = crawler.parse_description(html)
-        address = ''
-        photos = crawler.parse_photos(html)
-        if openai_key:
-            address = extract_address(
-                description=description,
-                page_address=address,
-                html=html,
-                api_key=openai_key,
-            )
+@dataclass
+class ListingJob:
+    """State of one listing URL as it moves through the scrape pipeline."""
+
+    url: str
+    search: str = "default"
+    html: str | None = None
+    external_id: str | None = None
+    title: str | None = None
+    description: str | None = None
+    floor: str | None = None
+    price: int | None = None
+    area: float | None = None
+    build_year: int | None = None
+    photos: list[str] = field(default_factory=list)
+    address: str = ""
+    info: dict | None = None
+    notes: str | None = None
+    message: str | None = None
+    listing_id: int | None = None
+    is_new: bool = False
+    queue_job_id: int | None = None
+    state: str = "pending"
+    trace: metrics.Trace | None = field(default=None, repr=False, compare=False)
+
+
+def job_payload(job: ListingJob) -> dict:
+    """Fields of ``job`` worth keeping in a run checkpoint."""
+    skip = ("url", "html", "queue_job_id", "state", "trace")
+    return {f.name: getattr(job, f.name) for f in fields(job) if f.name not in skip}
+
+
+def job_from_checkpoint(entry: dict) -> ListingJob:
+    """Rebuild a job saved by a run checkpoint."""
+    known = {f.name for f in fields(ListingJob)} - {"url", "state", "html", "trace"}
+    data = {k: v for k, v in entry["payload"].items() if k in known}
+    return ListingJob(url=entry["url"], state=entry["state"], html=entry["html"], **data)
+
+
+def passes_thresholds(info: dict, config) -> bool:
+    """Return True if every configured commute is within its threshold."""
+    for poi in config.commute.pois:
+        limit = config.commute.thresholds.get(poi)
+        minutes = info.get(poi)
+        if limit is not None and (minutes is None or minutes > limit):
+            return False
+    return True
+
+
+def format_listing_message(job: ListingJob, config) -> str:
+    """Build the Telegram HTML message for a new listing."""
+    text_lines = [f"<b>{job.title or ''}</b>"]
+    text_lines.append(f"<b>💰 Price:</b> {job.price if job.price is not None else ''}")
+    text_lines.append(f"<b>💰 Floor:</b> {job.floor or ''}")
+    if job.address:
+        text_lines.append(f"<b>📍 Address:</b> {job.address}")
+    if job.notes:
+        text_lines.append(f"<b>🤖 AI summary:</b>\n{job.notes[:400]}")
+    info = job.info or {}
+    for poi in config.commute.pois:
+        minutes = info.get(poi)
+        if minutes is not None:
+            text_lines.append(f"<b>🚍 {poi}:</b> {minutes} min")
+            routes = info.get(f"{poi}_routes")
+            if routes:
+                for r in routes:
+                    text_lines.append("\u2022 " + format_route(r))
+    text_lines.append(job.url)
+    return "\n".join(text_lines)
+
+
+class ScrapeStages:
+    """Stage functions of the scrape pipeline.
+
+    Stages run on their own worker threads, so each one that touches the
+    database opens a short-lived session instead of sharing one.
+    """
+
+    def __init__(
+        self,
+        config,
+        crawler,
+        openai_key=None,
+        google_key=None,
+        telegram_token=None,
+        telegram_chat_ids=None,
+        session_factory=SessionLocal,
+        search_name: str = "default",
+        registry: ClaimRegistry | None = None,
+    ):
+        self.config = config
+        self.crawler = crawler
+        self.openai_key = openai_key
+        self.google_key = google_key
+        self.telegram_token = telegram_token
+        self.telegram_chat_ids = telegram_chat_ids
+        self.session_factory = session_factory
+        self.search_name = search_name
+        self.registry = registry or ClaimRegistry()
+        self._seen: set[str] = set()
+        self._seen_lock = threading.Lock()
+
+    def _recent_cutoff(self) -> datetime:
+        return datetime.utcnow() - timedelta(days=self.config.reparse_after_days)
+
+    def _find_listing(self, session, url, external_id=None):
         listing = session.query(Listing).filter_by(url=url).first()
         if not listing and external_id:
             listing = session.query(Listing).filter_by(external_id=external_id).first()
-        recent_cutoff = datetime.utcnow() - timedelta(days=config.reparse_after_days)
-        if listing and listing.last_parsed and listing.last_parsed > recent_cutoff:
-            logging.info("Skipping %s - already parsed recently", url)
+        return listing
+
+    def _parsed_recently(self, url: str) -> bool:
+        session = self.session_factory()
+        try:
+            last_parsed = session.query(Listing.last_parsed).filter_by(url=url).scalar()
+        finally:
+            session.close()
+        return last_parsed is not None and last_parsed > self._recent_cutoff()
+
+    def discover(self, sort):
+        """Yield listing URLs for one sort mode that are not fresh in the DB.
+
+        URLs stream in page by page while the crawler is still paging, so
+        the first listings are fetched while later search pages load. URLs
+        already claimed by another search in the shared registry are
+        skipped so every listing is fetched and enriched once.
+        """
+        logging.info("Search %s: fetching listings using sort %s", self.search_name, sort)
+        profile = self.config.get_search(self.search_name)
+        max_pages = profile.max_pages if profile else self.config.max_pages
+        # a session per lookup: this generator is suspended whenever the
+        # fetch queue is full and must not hold a read transaction meanwhile
+        for url in self.crawler.iter_listings(max_pages=max_pages, sort_by=sort):
+            url = canonical_listing_url(url)
+            with self._seen_lock:
+                if url in self._seen:
+                    continue
+                self._seen.add(url)
+            if not self.registry.claim(url, self.search_name):
+                logging.debug(
+                    "Skipping %s - already handled by search %s", url, self.registry.owner(url)
+                )
+                continue
+            if self._parsed_recently(url):
+                logging.info("Skipping %s - already parsed recently", url)
+                continue
+            yield self._new_job(url)
+
+    def _new_job(self, url: str) -> ListingJob:
+        job = ListingJob(url=url, search=self.search_name)
+        if self.config.metrics.trace_dir:
+            job.trace = metrics.Trace(url)
+        return job
+
+    def _dump_trace(self, job: ListingJob) -> None:
+        if job.trace is None or not self.config.metrics.trace_dir:
             return
-        if listing:
-            if external_id and listing.external_id != external_id:
-                setattr(listing, 'external_id', external_id)
-            setattr(listing, 'title', title)
-            setattr(listing, 'description', description)
-            setattr(listing, 'location', address)
-            setattr(listing, 'floor', floor)
-            setattr(listing, 'price', price)
-            setattr(listing, 'last_parsed', datetime.utcnow())
-            session.commit()
-            logging.info("Updated listing %s", url)
-        else:
-            summary_lines = [
-                f"Title: {title}",
-                f"Price: {price}",
-            ]
-            if address:
-                summary_lines.append(f"Address: {address}")
-            if description:
-                summary_lines.append("Description:\n" + description[:4000])
-            summary = "\n".join(summary_lines)
-            listing = Listing(
-                url=url,
-                external_id=external_id,
-                title=title,
-                description=description,
-                location=address,
-                floor=floor,
-                price=price,
-                notes="",
-                is_good=True,
+        try:
+            path = job.trace.dump(self.config.metrics.trace_dir)
+            logging.debug("Saved trace of %s to %s", job.url, path)
+        except OSError as exc:
+            logging.warning("Could not save trace of %s: %s", job.url, exc)
+
+    def _parse_field(self, name: str, parser, html):
+        with metrics.timed(PARSE_SECONDS, span=f"parse {name}", category="parse", field=name):
+            return parser(html)
+
+    def fetch(self, job: ListingJob):
+        logging.info("Processing listing %s", job.url)
+        job.html = self.crawler.fetch_listing_details(job.url)
+        return job
+
+    def _release(self, job: ListingJob) -> None:
+        """Give up this search's claim on a listing only its own filters dropped,
+        so other searches can take it."""
+        self.registry.release(job.url, job.search)
+
+    def parse(self, job: ListingJob):
+        crawler = self.crawler
+        html = job.html
+        job.price = self._parse_field("price", crawler.parse_price, html)
+        if job.price is None:
+            logging.info("Skipping %s due to missing price", job.url)
+            LISTINGS.inc(search=job.search, outcome="no_price")
+            return None
+        job.external_id = self._parse_field("listing_id", crawler.parse_listing_id, html)
+        job.floor = self._parse_field("floor", crawler.parse_floor, html)
+        profile = self.config.get_search(job.search)
+        ignore = (profile.search if profile else self.config.search).ignore_floors
+        if job.floor and ignore and job.floor.lower() in ignore:
+            logging.info("Skipping %s due to floor %s", job.url, job.floor)
+            LISTINGS.inc(search=job.search, outcome="ignored_floor")
+            self._release(job)
+            return None
+        job.area = self._parse_field("area", crawler.parse_area, html)
+        job.build_year = self._parse_field("build_year", crawler.parse_build_year, html)
+        job.title = self._parse_field("title", crawler.parse_title, html)
+        job.description = self._parse_field("description", crawler.parse_description, html)
+        job.photos = self._parse_field("photos", crawler.parse_photos, html)
+        return job
+
+    def enrich(self, job: ListingJob):
+        """Resolve the address, commutes and AI summary; the slow network calls."""
+        session = self.session_factory()
+        try:
+            listing = self._find_listing(session, job.url, job.external_id)
+            if listing and listing.last_parsed and listing.last_parsed > self._recent_cutoff():
+                logging.info("Skipping %s - already parsed recently", job.url)
+                LISTINGS.inc(search=job.search, outcome="recent")
+                return None
+            job.is_new = listing is None
+            job.notes = listing.notes if listing else None
+        finally:
+            session.close()
+        if self.openai_key:
+            job.address = extract_address(
+                description=job.description,
+                page_address=job.address,
+                html=job.html,
+                api_key=self.openai_key,
             )
-            session.add(listing)
-            session.commit()
-            setattr(listing, 'last_parsed', datetime.utcnow())
+        job.html = None
+        if not (self.google_key and job.address):
+            return job
+        depart = next_commute_datetime(self.config.commute.day, self.config.commute.time)
+        job.info = evaluate_location(job.address, self.config.commute.pois, depart, self.google_key)
+        if not (job.is_new and self.telegram_token and self.telegram_chat_ids):
+            return job
+        if not passes_thresholds(job.info, self.config):
+            return job
+        if self.openai_key and not job.notes:
+            summary_lines = [f"Title: {job.title or ''}", f"Price: {job.price}"]
+            if job.address:
+                summary_lines.append(f"Address: {job.address}")
+            if job.description:
+                summary_lines.append("Description:\n" + str(job.description)[:4000])
+            job.notes = rate_listing("\n".join(summary_lines), api_key=self.openai_key)
+        job.message = format_listing_message(job, self.config)
+        return job
+
+    def persist(self, job: ListingJob):
+        """Write the listing, commutes and outbox rows in one transaction."""
+        price_per_m2 = round(job.price / job.area, 2) if job.price and job.area else None
+        session = self.session_factory()
+        try:
+            listing = self._find_listing(session, job.url, job.external_id)
+            if listing:
+                # another worker may have created it since enrich looked
+                job.is_new = False
+                job.message = None
+                if job.external_id and listing.external_id != job.external_id:
+                    listing.external_id = job.external_id
+                listing.title = job.title
+                listing.description = job.description
+                listing.location = job.address
+                listing.floor = job.floor
+                listing.price = job.price
+                listing.area = job.area
+                listing.build_year = job.build_year
+                listing.price_per_m2 = price_per_m2
+                listing.last_parsed = datetime.utcnow()
+            else:
+                listing = Listing(
+                    url=job.url,
+                    external_id=job.external_id,
+                    title=job.title,
+                    description=job.description,
+                    location=job.address,
+                    floor=job.floor,
+                    price=job.price,
+                    area=job.area,
+                    build_year=job.build_year,
+                    price_per_m2=price_per_m2,
+                    notes=job.notes or "",
+                    # is_good is decided by update_listing_scores
+                    last_parsed=datetime.utcnow(),
+                )
+                session.add(listing)
+            session.flush()
+            job.listing_id = listing.id
+            if job.info is not None:
+                self._write_commutes(session, listing, job.info)
+            if job.message:
+                listing.notes = job.notes or ""
+                enqueue_notification(
+                    session,
+                    listing_id=listing.id,
+                    chat_ids=self.telegram_chat_ids,
+                    text=job.message,
+                    photos=job.photos[:3],
+                )
+            index_listings(session, [listing])
             session.commit()
-            logging.info("Added new listing %s", url)
-            is_new = True
-        if listing and google_key and address:
-            depart = next_commute_datetime(config.commute.day, config.commute.time)
-            info = evaluate_location(address, config.commute.pois, depart, google_key)
-            lat_val = info.get("lat")
-            lng_val = info.get("lng")
-            if lat_val is not None:
-                setattr(listing, 'lat', float(lat_val))
-            if lng_val is not None:
-                setattr(listing, 'lng', float(lng_val))
-            session.query(CommuteTime).filter_by(listing_id=listing.id).delete()
-            for poi in config.commute.pois:
-                session.add(
-                    CommuteTime(
-                        listing_id=listing.id,
-                        destination=poi,
-                        minutes=info.get(poi),
-                        details=json.dumps(info.get(f"{poi}_routes")),
-                    )
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        if job.is_new:
+            return job
+        logging.info("Updated listing %s", job.url)
+        LISTINGS.inc(search=job.search, outcome="updated")
+        self._dump_trace(job)
+        return None
+
+    def _write_commutes(self, session, listing: Listing, info: dict) -> None:
+        lat_val = info.get("lat")
+        lng_val = info.get("lng")
+        if lat_val is not None:
+            listing.lat = float(lat_val)
+        if lng_val is not None:
+            listing.lng = float(lng_val)
+        session.query(CommuteTime).filter_by(listing_id=listing.id).delete()
+        for poi in self.config.commute.pois:
+            session.add(
+                CommuteTime(
+                    listing_id=listing.id,
+                    destination=poi,
+                    minutes=info.get(poi),
+                    details=json.dumps(info.get(f"{poi}_routes")),
                 )
+            )
+
+    def enqueue(self, job: ListingJob):
+        """Hand a discovered URL to the shared job queue instead of processing it."""
+        session = self.session_factory()
+        try:
+            queued = enqueue_job(
+                session,
+                "listing",
+                f"listing:{job.url}",
+                {"url": job.url, "search": job.search},
+                max_attempts=self.config.queue.max_attempts,
+            )
+        finally:
+            session.close()
+        return job if queued else None
+
+    def refresh_commutes(self, job: ListingJob):
+        """Recompute coordinates and commutes of an already stored listing."""
+        if not self.google_key:
+            raise RuntimeError("GOOGLE_API_KEY is required to refresh commutes")
+        session = self.session_factory()
+        try:
+            listing = session.get(Listing, job.listing_id)
+            location = listing.location if listing else None
+        finally:
+            session.close()
+        if not location:
+            return None
+        # the Google calls run outside any transaction so writers are not held up
+        depart = next_commute_datetime(self.config.commute.day, self.config.commute.time)
+        info = evaluate_location(location, self.config.commute.pois, depart, self.google_key)
+        session = self.session_factory()
+        try:
+            listing = session.get(Listing, job.listing_id)
+            if listing is None:
+                return None
+            self._write_commutes(session, listing, info)
             session.commit()
-            if is_new and telegram_token and telegram_chat_ids:
-                thresholds = config.commute.thresholds
-                ok = True
-                if thresholds:
-                    for poi in config.commute.pois:
-                        limit = thresholds.get(poi)
-                        minutes = info.get(poi)
-                        if limit is not None and (minutes is None or minutes > limit):
-                            ok = False
-                            break
-                notes_val = getattr(listing, "notes", None)
-                location_val = getattr(listing, "location", None)
-                description_val = getattr(listing, "description", None)
-                if ok:
-                    if openai_key and (not notes_val or notes_val == ""):
-                        summary_lines = [
-                            f"Title: {getattr(listing, 'title', '')}",
-                            f"Price: {getattr(listing, 'price', '')}",
-                        ]
-                        if location_val:
-                            summary_lines.append(f"Address: {location_val}")
-                        if description_val:
-                            summary_lines.append(
-                                "Description:\n" + str(description_val)[:4000]
-                            )
-                        summary = "\n".join(summary_lines)
-                        setattr(listing, 'notes', rate_listing(summary, api_key=openai_key))
-                        session.commit()
-                        notes_val = getattr(listing, "notes", None)
-                    text_lines = [f"<b>{getattr(listing, 'title', '')}</b>"]
-                    text_lines.append(f"<b>💰 Price:</b> {getattr(listing, 'price', '')}")
-                    text_lines.append(f"<b>💰 Floor:</b> {getattr(listing, 'floor', '')}")
-                    if location_val:
-                        text_lines.append(f"<b>📍 Address:</b> {location_val}")
-                    if notes_val:
-                        text_lines.append(f"<b>🤖 AI summary:</b>\n{notes_val[:400]}")
-                    for poi in config.commute.pois:
-                        minutes = info.get(poi)
-                        if minutes is not None:
-                            text_lines.append(f"<b>🚍 {poi}:</b> {minutes} min")
-                            routes = info.get(f"{poi}_routes")
-                            if routes:
-                                for r in routes:
-                                    text_lines.append("\u2022 " + format_route(r))
-                    text_lines.append(str(getattr(listing, 'url', '')))
-                    notify_listing(
-                        token=telegram_token,  
-                        chat_id=telegram_chat_ids,
-                        text="\n".join(text_lines),
-                        photos=photos[:3],
-                    )
-    except Exception as e:
-        logging.error(f"Error processing listing {url}: {e}", exc_info=True)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        return job
 
+    def notify(self, job: ListingJob):
+        logging.info("Added new listing %s", job.url)
+        LISTINGS.inc(search=job.search, outcome="new")
+        if job.message:
+            wake_outbox_worker()
+        self._dump_trace(job)
+        return job
 
-def process_listings():
+
+def _processing_stages(stages: ScrapeStages, settings: PipelineSettings, wrap=None) -> list[Stage]:
+    wrap = wrap or (lambda name, func: func)
+    size = settings.queue_size
+    return [
+        Stage("fetch", wrap("fetch", stages.fetch), workers=settings.fetch_workers, queue_size=size),
+        Stage("parse", wrap("parse", stages.parse), workers=settings.parse_workers, queue_size=size),
+        Stage("enrich", wrap("enrich", stages.enrich), workers=settings.enrich_workers, queue_size=size),
+        Stage("persist", wrap("persist", stages.persist), workers=settings.persist_workers, queue_size=size),
+        Stage("notify", wrap("notify", stages.notify), workers=settings.notify_workers, queue_size=size),
+    ]
+
+
+# checkpoint state a URL reaches when the stage succeeds; persist is
+# idempotent and simply runs again on resume
+_STAGE_STATES = {"fetch": "fetched", "parse": "parsed", "enrich": "enriched", "persist": None, "notify": "notified"}
+
+
+def _checkpointed(checkpoint: RunCheckpoint):
+    """Stage wrapper that records progress and skips stages already done."""
+
+    def wrap(name, func):
+        state = _STAGE_STATES[name]
+
+        def run(job: ListingJob):
+            if state and STATE_RANK[job.state] >= STATE_RANK[state]:
+                return job
+            try:
+                result = func(job)
+            except Exception as exc:
+                checkpoint.advance(job.url, "failed", error=str(exc))
+                raise
+            if result is None:
+                checkpoint.advance(job.url, "done" if name == "persist" else "skipped")
+            elif state:
+                job.state = state
+                checkpoint.advance(
+                    job.url,
+                    state,
+                    payload=job_payload(job),
+                    html=job.html if state == "fetched" else None,
+                )
+            return result
+
+        return run
+
+    return wrap
+
+
+def _checkpointed_discover(stages: ScrapeStages, checkpoint: RunCheckpoint):
+    def run(item):
+        if isinstance(item, ListingJob):
+            # resumed from the checkpoint; already discovered
+            yield item
+            return
+        if item in checkpoint.sorts_done:
+            return
+        for job in stages.discover(item):
+            if checkpoint.record_url(job.url):
+                yield job
+        checkpoint.mark_sort_done(item)
+
+    return run
+
+
+def checkpoint_items(stages: ScrapeStages, checkpoint: RunCheckpoint, sorts: list[str]) -> list:
+    """Pipeline input for a possibly resumed run: unfinished listings first,
+    then the sort modes whose discovery has not completed."""
+    stages._seen.update(checkpoint.known_urls())
+    resumed = [job_from_checkpoint(entry) for entry in checkpoint.unfinished()]
+    if resumed:
+        logging.info("Search %s: resuming %d unfinished listings", checkpoint.search, len(resumed))
+    return resumed + [sort for sort in sorts if sort not in checkpoint.sorts_done]
+
+
+def build_pipeline(
+    stages: ScrapeStages,
+    settings: PipelineSettings,
+    queue_mode: bool = False,
+    checkpoint: RunCheckpoint | None = None,
+) -> Pipeline:
+    """Wire the scrape stages together with bounded queues.
+
+    With ``queue_mode`` the run only discovers URLs and puts them on the
+    shared job queue; :class:`QueueWorker` processes do the rest. With a
+    ``checkpoint`` every stage records its progress so the run can be
+    resumed; the pipeline then also accepts resumed :class:`ListingJob`
+    items next to sort names.
+    """
+    discover_func = _checkpointed_discover(stages, checkpoint) if checkpoint else stages.discover
+    discover = Stage("discover", discover_func, workers=1, queue_size=settings.queue_size)
+    if queue_mode:
+        rest = [Stage("enqueue", stages.enqueue, workers=1, queue_size=settings.queue_size)]
+    else:
+        rest = _processing_stages(stages, settings, _checkpointed(checkpoint) if checkpoint else None)
+    return Pipeline([discover] + rest, name="scrape", report_interval=settings.report_interval)
+
+
+def telegram_chat_ids_from_env() -> list[str] | None:
+    chat_id_env = os.getenv("TELEGRAM_CHAT_ID")
+    if not chat_id_env:
+        return None
+    parts = (
+        chat_id_env.replace(";", ",")
+        .replace(" ", ",")
+        .split(",")
+    )
+    return [p for p in (part.strip() for part in parts) if p]
+
+
+last_run_stats: dict[str, list[dict]] = {}
+
+_scoring_lock = threading.Lock()
+# set by every caller; the scorer holding the lock keeps passing while it is set
+_scoring_requested = threading.Event()
+
+
+def _score_listings(config, session_factory) -> int:
+    session = session_factory()
+    try:
+        with metrics.timed(SCORING_SECONDS):
+            return update_scores(session, config.scoring, config.commute.pois)
+    except Exception as exc:
+        session.rollback()
+        logging.error("Scoring listings failed: %s", exc, exc_info=True)
+        return 0
+    finally:
+        session.close()
+
+
+def update_listing_scores(config=None, session_factory=SessionLocal) -> int:
+    """Rescore listings after a run.
+
+    A call made while another search is scoring does not wait; it asks
+    that scorer for one more pass, so listings committed after the
+    running pass loaded its columns are still scored.
+    """
+    config = config or load_config()
+    _scoring_requested.set()
+    written = 0
+    while _scoring_lock.acquire(blocking=False):
+        try:
+            while _scoring_requested.is_set():
+                _scoring_requested.clear()
+                written += _score_listings(config, session_factory)
+        finally:
+            _scoring_lock.release()
+        # a request that arrived after the last pass but before the release
+        if not _scoring_requested.is_set():
+            break
+    return written
+
+
+_shared_lock = threading.Lock()
+_browser_limiter: threading.BoundedSemaphore | None = None
+_registry = ClaimRegistry()
+
+
+def _get_browser_limiter(size: int) -> threading.BoundedSemaphore:
+    global _browser_limiter
+    with _shared_lock:
+        if _browser_limiter is None:
+            _browser_limiter = threading.BoundedSemaphore(size)
+        return _browser_limiter
+
+
+def process_search(name: str, config=None) -> list[dict]:
+    """Run one named search through the staged pipeline and return its stats.
+
+    All searches share one browser limiter and one claim registry, so they
+    can run at the same time without exceeding ``max_browsers`` or
+    fetching the same listing twice.
+    """
+    config = config or load_config()
+    profile = config.get_search(name)
+    if profile is None:
+        logging.error("Unknown search %s", name)
+        return []
+    logging.info("Starting search %s", name)
+    crawler = OtodomCrawler(
+        profile.search,
+        headless=config.headless,
+        base_url=profile.base_url,
+        limiter=_get_browser_limiter(config.max_browsers),
+    )
+    stages = ScrapeStages(
+        config,
+        crawler,
+        openai_key=os.getenv("OPENAI_API_KEY"),
+        google_key=os.getenv("GOOGLE_API_KEY"),
+        telegram_token=os.getenv("TELEGRAM_TOKEN"),
+        telegram_chat_ids=telegram_chat_ids_from_env(),
+        search_name=name,
+        registry=_registry,
+    )
+    queue_mode = config.queue.mode == "db"
+    items: list = list(profile.search.sorts)
+    checkpoint = None
+    if not queue_mode:
+        # the job queue already survives restarts; local runs need a checkpoint
+        checkpoint = RunCheckpoint.open(name)
+        items = checkpoint_items(stages, checkpoint, items)
+    pipeline = build_pipeline(stages, config.pipeline, queue_mode=queue_mode, checkpoint=checkpoint)
+    pipeline.name = f"scrape:{name}"
+    stats = pipeline.run(items)
+    if checkpoint:
+        checkpoint.finish()
+    # with the job queue this scores what the workers have stored so far
+    update_listing_scores(config)
+    last_run_stats[name] = stats
+    return stats
+
+
+def process_listings() -> dict[str, list[dict]]:
+    """Run every configured search concurrently and wait for all of them."""
     logging.info("Starting listings processing")
     config = load_config()
+    threads = [
+        threading.Thread(target=process_search, args=(p.name, config), name=f"search-{p.name}")
+        for p in config.searches
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return dict(last_run_stats)
+
+
+class QueueWorker:
+    """Processes listing and enrichment jobs leased from the shared job queue.
+
+    Several processes, possibly on different hosts, can run a worker
+    against the same database. Each leased job is completed when its
+    listing leaves the pipeline, released for a retry when a stage
+    raises, and kept leased by heartbeats while it is in flight.
+    """
+
+    def __init__(self, config, stages: ScrapeStages, queue: JobQueue):
+        self.config = config
+        self.stages = stages
+        self.queue = queue
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self.pipelines: dict[str, Pipeline] = {}
+
+    def _tracked(self, name, func):
+        final = name in ("notify", "refresh")
+
+        def run(job: ListingJob):
+            try:
+                result = func(job)
+            except Exception as exc:
+                self.queue.fail(job.queue_job_id, str(exc))
+                raise
+            if result is None or final:
+                self.queue.complete(job.queue_job_id)
+            return result
+
+        return run
+
+    def _claimed(self, kind: str):
+        settings = self.config.queue
+        while not self._stop.is_set():
+            claimed = self.queue.claim([kind], limit=settings.batch_size)
+            if not claimed:
+                self._stop.wait(settings.poll_interval)
+                continue
+            for c in claimed:
+                job = ListingJob(
+                    url=c.payload.get("url", ""),
+                    search=c.payload.get("search", "default"),
+                    listing_id=c.payload.get("listing_id"),
+                    queue_job_id=c.id,
+                )
+                if self.config.metrics.trace_dir:
+                    job.trace = metrics.Trace(job.url)
+                yield job
+
+    def start(self) -> None:
+        settings = self.config.pipeline
+        self.pipelines = {
+            "listing": Pipeline(
+                _processing_stages(self.stages, settings, self._tracked),
+                name="worker",
+                report_interval=settings.report_interval,
+            ),
+            "enrich": Pipeline(
+                [
+                    Stage(
+                        "refresh",
+                        self._tracked("refresh", self.stages.refresh_commutes),
+                        workers=settings.enrich_workers,
+                        queue_size=settings.queue_size,
+                    )
+                ],
+                name="worker-enrich",
+                report_interval=settings.report_interval,
+            ),
+        }
+        self.queue.start_heartbeat()
+        for kind, pipeline in self.pipelines.items():
+            t = threading.Thread(
+                target=pipeline.run, args=(self._claimed(kind),), name=f"queue-{kind}", daemon=True
+            )
+            t.start()
+            self._threads.append(t)
+        logging.info("Queue worker %s started", self.queue.owner)
+
+    def stop(self) -> None:
+        """Stop claiming, finish in-flight jobs and stop heartbeats."""
+        self._stop.set()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        self.queue.stop_heartbeat()
+
+
+def start_queue_worker(config=None) -> QueueWorker:
+    config = config or load_config()
     crawler = OtodomCrawler(
-        config.search, headless=config.headless, base_url=config.base_url
+        config.search,
+        headless=config.headless,
+        base_url=config.base_url,
+        limiter=_get_browser_limiter(config.max_browsers),
     )
-    openai_key = os.getenv("OPENAI_API_KEY")
-    google_key = os.getenv("GOOGLE_API_KEY")
-    telegram_token = os.getenv("TELEGRAM_TOKEN")
-    chat_id_env = os.getenv("TELEGRAM_CHAT_ID")
-    telegram_chat_ids: list[str] | None = None
-    if chat_id_env:
-        parts = (
-            chat_id_env.replace(";", ",")
-            .replace(" ", ",")
-            .split(",")
-        )
-        telegram_chat_ids = [p for p in (part.strip() for part in parts) if p]
-    session = SessionLocal()
-    fetched: list[str] = []
-    for sort in config.search.sorts:
-        logging.info("Fetching listings using sort %s", sort)
-        fetched.extend(crawler.fetch_listings(max_pages=config.max_pages, sort_by=sort))
-    links = fetched
-    links = list(dict.fromkeys(links))
-    logging.info("Processing %d links", len(links))
-    recent_cutoff = datetime.utcnow() - timedelta(days=config.reparse_after_days)
-    for url in links:
-        listing = session.query(Listing).filter_by(url=url).first()
-        if listing and listing.last_parsed and listing.last_parsed > recent_cutoff:
-            logging.info("Skipping %s - already parsed recently", url)
-            continue
-        process_single_listing(
-            url,
-            crawler,
-            session,
-            config,
-            openai_key,
-            google_key,
-            telegram_token,
-            telegram_chat_ids,
-        )
-    session.close()
-
-
-def start_scheduler():
-    scheduler = BackgroundScheduler(timezone="UTC")
-    scheduler.add_job(
-        process_listings, "interval", hours=1, next_run_time=datetime.utcnow()
+    stages = ScrapeStages(
+        config,
+        crawler,
+        openai_key=os.getenv("OPENAI_API_KEY"),
+        google_key=os.getenv("GOOGLE_API_KEY"),
+        telegram_token=os.getenv("TELEGRAM_TOKEN"),
+        telegram_chat_ids=telegram_chat_ids_from_env(),
+        registry=_registry,
     )
+    queue = JobQueue(
+        lease_seconds=config.queue.lease_seconds,
+        retry_delay=config.queue.retry_delay_seconds,
+    )
+    worker = QueueWorker(config, stages, queue)
+    worker.start()
+    return worker
+
+
+def enqueue_commute_refresh(config=None) -> int:
+    """Queue an ``enrich`` job for every listing missing a configured commute."""
+    config = config or load_config()
+    pois = config.commute.pois
+    session = SessionLocal()
+    queued = 0
+    try:
+        for listing in session.query(Listing).filter(Listing.location.isnot(None), Listing.location != ""):
+            known = {c.destination for c in listing.commutes if c.minutes is not None}
+            if listing.lat is not None and all(poi in known for poi in pois):
+                continue
+            if enqueue_job(
+                session,
+                "enrich",
+                f"enrich:{listing.id}",
+                {"listing_id": listing.id, "url": listing.url},
+                max_attempts=config.queue.max_attempts,
+            ):
+                queued += 1
+    finally:
+        session.close()
+    logging.info("Queued %d commute refresh jobs", queued)
+    return queued
+
+
+def start_scheduler() -> AdaptiveScheduler:
+    scheduler = AdaptiveScheduler(process_search, load_config())
     scheduler.start()
     logging.info("Scheduler started")
+    return scheduler
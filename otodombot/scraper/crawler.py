@@ -1,10 +1,126 @@
-from typing import List, Optional
+from collections import Counter
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
 import logging
 import re
+import unicodedata
 import urllib.parse
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
 
-from ..config import SearchConditions
+from .. import metrics
+from ..config import SearchConditions, floor_filter
+
+CRAWLER_SECONDS = metrics.histogram(
+    "otodombot_crawler_seconds",
+    "Browser time per crawler step",
+    ("step",),
+)
+CRAWLER_ERRORS = metrics.counter(
+    "otodombot_crawler_errors_total", "Failed crawler page loads", ("step",)
+)
+FETCHES_SAVED = metrics.counter(
+    "otodombot_fetches_saved_total",
+    "Listing detail fetches skipped because the search card failed a filter",
+    ("filter",),
+)
+
+# JS run on every search results page: links, visible text and address of each card
+CARD_SCRIPT = """articles => articles.map(a => ({
+    links: Array.from(a.querySelectorAll('a'), el => el.href),
+    text: a.innerText || '',
+    address: (a.querySelector('[data-testid="advert-card-address"]') || {}).innerText || null,
+}))"""
+
+
+@dataclass
+class SearchCard:
+    """A listing as shown on a search results page; ``None`` where the card lacks a value."""
+
+    url: str
+    price: Optional[int] = None
+    area: Optional[float] = None
+    price_per_m2: Optional[int] = None
+    rooms: Optional[int] = None
+    # otodom ``floors`` value, e.g. ``"GROUND"``
+    floor: Optional[str] = None
+    address: Optional[str] = None
+
+
+def _number(text: str) -> float:
+    return float(re.sub(r"[\s\u00a0]", "", text).replace(",", "."))
+
+
+def parse_search_card(url: str, text: str, address: str | None = None) -> SearchCard:
+    """Read price, area, rooms and floor from the visible text of a search card."""
+    card = SearchCard(url=url, address=address.strip() if address else None)
+    m = re.search(r"(\d[\d \u00a0]*(?:[.,]\d+)?)\s*zł(?!\s*/)", text)
+    if m:
+        card.price = int(_number(m.group(1)))
+    m = re.search(r"(\d[\d \u00a0]*(?:[.,]\d+)?)\s*zł\s*/\s*m", text)
+    if m:
+        card.price_per_m2 = int(_number(m.group(1)))
+    m = re.search(r"(?<![\d/])(\d+(?:[.,]\d+)?)\s*m²", text)
+    if m:
+        card.area = _number(m.group(1))
+    m = re.search(r"(\d+)\s*(?:pok[oó]j|pokoi)", text, re.IGNORECASE)
+    if m:
+        card.rooms = int(m.group(1))
+    lowered = text.lower()
+    m = re.search(r"(\d+)\s*piętro|piętro:?\s*(\d+)", lowered)
+    if m:
+        card.floor = floor_filter(int(m.group(1) or m.group(2)))
+    else:
+        for name in ("parter", "suterena", "poddasze"):
+            if re.search(rf"\b{name}\b", lowered):
+                card.floor = floor_filter(name)
+                break
+    return card
+
+
+def _fold(value: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", value.lower().replace("ł", "l"))
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def card_filter(card: SearchCard, search: SearchConditions) -> Optional[str]:
+    """Return the name of the first search filter the card fails, or ``None``.
+
+    Values missing from the card pass, so only listings that certainly
+    miss the search are dropped before their detail page is fetched.
+    """
+    if card.price is not None:
+        if (search.min_price and card.price < search.min_price) or (
+            search.max_price and card.price > search.max_price
+        ):
+            return "price"
+    if card.area is not None:
+        if (search.min_area and card.area < search.min_area) or (
+            search.max_area and card.area > search.max_area
+        ):
+            return "area"
+    price_per_m2 = card.price_per_m2
+    if price_per_m2 is None and card.price is not None and card.area:
+        price_per_m2 = card.price / card.area
+    if price_per_m2 is not None:
+        if (search.min_price_per_m2 and price_per_m2 < search.min_price_per_m2) or (
+            search.max_price_per_m2 and price_per_m2 > search.max_price_per_m2
+        ):
+            return "price_per_m2"
+    if card.rooms is not None and search.rooms:
+        if card.rooms not in search.rooms and not (card.rooms >= 5 and max(search.rooms) >= 5):
+            return "rooms"
+    if card.floor is not None:
+        if search.floors and card.floor not in search.floors:
+            return "floors"
+        if card.floor in search.ignored_floor_filters():
+            return "ignore_floors"
+    if card.address and search.districts:
+        # "ul. Puławska, Stary Mokotów, Mokotów, Warszawa, mazowieckie"
+        parts = {_fold(part).strip() for part in card.address.split(",")}
+        if not any(_fold(district).strip() in parts for district in search.districts):
+            return "districts"
+    return None
 
 
 class OtodomCrawler:
@@ -25,12 +141,18 @@ class OtodomCrawler:
         headless: bool = True,
         wait_timeout: int = 30000,
         base_url: str | None = None,
+        limiter=None,
     ):
         self.search = search or SearchConditions()
         self.headless = headless
         # Maximum time to wait for page elements to load, in milliseconds.
         self.wait_timeout = wait_timeout
         self.base_url = base_url or self.DEFAULT_BASE_URL
+        # Shared semaphore capping how many browsers run at once across
+        # all crawlers in the process.
+        self.limiter = limiter if limiter is not None else nullcontext()
+        # listings dropped on their search card, by failing filter
+        self.fetches_saved: Counter[str] = Counter()
 
     def accept_cookies(self, page) -> None:
         """Attempt to accept cookie banners if present."""
@@ -51,6 +173,8 @@ class OtodomCrawler:
 
     def build_url(self, sort_by: str = "DEFAULT", page=1) -> str:
         params: list[str] = []
+        if self.search.min_price:
+            params.append(f"priceMin={self.search.min_price}")
         if self.search.max_price:
             params.append(f"priceMax={self.search.max_price}")
         if self.search.rooms:
@@ -71,9 +195,20 @@ class OtodomCrawler:
             params.append(f"roomsNumber={rooms_param}")
         if self.search.min_area:
             params.append(f"areaMin={self.search.min_area}")
+        if self.search.max_area:
+            params.append(f"areaMax={self.search.max_area}")
+        if self.search.min_price_per_m2:
+            params.append(f"pricePerMeterMin={self.search.min_price_per_m2}")
+        if self.search.max_price_per_m2:
+            params.append(f"pricePerMeterMax={self.search.max_price_per_m2}")
+        floors = self.search.floor_filters()
+        if floors:
+            params.append("floors=" + urllib.parse.quote(f"[{','.join(floors)}]"))
         sort = sort_by.upper() if sort_by else "DEFAULT"
         if self.search.build_year_min:
             params.append(f"buildYearMin={self.search.build_year_min}")
+        if self.search.build_year_max:
+            params.append(f"buildYearMax={self.search.build_year_max}")
         if sort == "LATEST":
             params.append("by=LATEST&direction=DESC")
         else:
@@ -84,78 +219,130 @@ class OtodomCrawler:
         logging.debug("Built search URL: %s", url)
         return url
 
+    def _search_page_cards(self, url: str) -> List[SearchCard]:
+        """Load one search results page and return its listing cards in page order.
+
+        Every page gets its own short browser session, so the browser slot
+        is free while the caller works on the links.
+        """
+        with self.limiter, sync_playwright() as p:
+            with metrics.timed(CRAWLER_SECONDS, "browser_launch", step="browser_launch"):
+                browser = p.firefox.launch(headless=self.headless)
+                context = browser.new_context(
+                    ignore_https_errors=True,
+                    user_agent=self.USER_AGENT,
+                    locale="pl-PL",
+                )
+                page = context.new_page()
+            try:
+                with metrics.timed(CRAWLER_SECONDS, "search_page_load", step="search_page_load"):
+                    page.goto(url, wait_until="domcontentloaded")
+            except Exception:
+                CRAWLER_ERRORS.inc(step="search_page_load")
+                raise
+            self.accept_cookies(page)
+            try:
+                page.evaluate("window.scrollTo(0, document.body.scrollHeight/2)")
+                page.wait_for_timeout(500)
+            except Exception as exc:
+                logging.debug("Error scrolling listing page: %s", exc)
+            try:
+                page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+                page.wait_for_timeout(500)
+            except Exception as exc:
+                logging.debug("Error scrolling listing page: %s", exc)
+            try:
+                logging.debug("Waiting for listings to load on %s", url)
+                page.wait_for_selector(
+                    "article a",
+                    timeout=self.wait_timeout,
+                )
+            except PlaywrightTimeoutError:
+                logging.warning(
+                    "Timeout waiting for listings on %s; proceeding anyway",
+                    url,
+                )
+            articles = page.eval_on_selector_all("article", CARD_SCRIPT)
+            context.close()
+            browser.close()
+        cards = []
+        for article in articles:
+            links = article["links"]
+            if not links:
+                continue
+            url = next((link for link in links if "/oferta/" in link), links[0])
+            cards.append(parse_search_card(url, article["text"], article["address"]))
+        return cards
+
+    def iter_listings(self, max_pages: int = 3, sort_by: str = "DEFAULT") -> Iterator[str]:
+        """Yield listing URLs as soon as each search results page is parsed.
+
+        Links are deduplicated across pages while crawling, and paging stops
+        early at the first page without links. Cards failing a search filter
+        the site did not apply are dropped here, before any detail fetch,
+        and counted per filter in ``fetches_saved``.
+        """
+        seen: set[str] = set()
+        saved: Counter[str] = Counter()
+        for page_num in range(1, max_pages + 1):
+            current_url = self.build_url(sort_by=sort_by, page=page_num)
+            logging.info("Fetching listings from %s", current_url)
+            cards = self._search_page_cards(current_url)
+            if not cards:
+                logging.info("No listings on page %s; stopping", page_num)
+                break
+            new_links = []
+            for card in cards:
+                if card.url in seen:
+                    continue
+                seen.add(card.url)
+                reason = card_filter(card, self.search)
+                if reason:
+                    logging.debug("Skipping %s - search card fails %s", card.url, reason)
+                    saved[reason] += 1
+                    self.fetches_saved[reason] += 1
+                    FETCHES_SAVED.inc(filter=reason)
+                    continue
+                new_links.append(card.url)
+            logging.info("Found %d new links on page %s", len(new_links), page_num)
+            yield from new_links
+        logging.info("Fetched %d listing links", len(seen) - sum(saved.values()))
+        if saved:
+            logging.info("Search card filters saved %d fetches: %s", sum(saved.values()), dict(saved))
+
     def fetch_listings(self, max_pages: int = 3, sort_by: str = "DEFAULT") -> List[str]:
         """Fetch listing URLs from otodom following pagination.
 
         Parameters
         ----------
         max_pages : int, optional
-            Number of result pages to crawl in a single session. Defaults
-            to ``3`` so that multiple pages are processed without the
-            caller needing to pass an argument.
+            Number of result pages to crawl. Defaults to ``3`` so that
+            multiple pages are processed without the caller needing to
+            pass an argument.
         sort_by : str, optional
             Sorting to use for fetching listings. Supported values are
             ``"DEFAULT"`` and ``"LATEST"``. Defaults to ``"DEFAULT"``.
         """
-        all_links: list[str] = []
-        with sync_playwright() as p:
-            browser = p.firefox.launch(headless=self.headless)
-            context = browser.new_context(
-                ignore_https_errors=True,
-                user_agent=self.USER_AGENT,
-                locale="pl-PL",
-            )
-            page = context.new_page()
-            for page_num in range(1, max_pages + 1):
-                current_url = self.build_url(sort_by=sort_by, page=page_num)
-                logging.info("Fetching listings from %s", current_url)
-                page.goto(current_url, wait_until="domcontentloaded")
-                self.accept_cookies(page)
-                try:
-                    page.evaluate("window.scrollTo(0, document.body.scrollHeight/2)")
-                    page.wait_for_timeout(500)
-                except Exception as exc:
-                    logging.debug("Error scrolling listing page: %s", exc)
-                try:
-                    page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                    page.wait_for_timeout(500)
-                except Exception as exc:
-                    logging.debug("Error scrolling listing page: %s", exc)
-                try:
-                    logging.debug("Waiting for listings to load on %s", current_url)
-                    page.wait_for_selector(
-                        "article a",
-                        timeout=self.wait_timeout,
-                    )
-                except PlaywrightTimeoutError:
-                    logging.warning(
-                        "Timeout waiting for listings on %s; proceeding anyway",
-                        current_url,
-                    )
-                links = page.eval_on_selector_all(
-                    "article a",
-                    "elements => elements.map(el => el.href)",
-                )
-                links = list(set(links)) # remove duplicates
-                logging.info("Found %d links on page %s", len(links), page_num)
-                all_links.extend(links)
-            context.close()
-            browser.close()
-        logging.info("Fetched %d listing links", len(all_links))
-        return all_links
+        return list(self.iter_listings(max_pages=max_pages, sort_by=sort_by))
 
     def fetch_listing_details(self, url: str) -> str:
         """Placeholder for fetching a single listing page."""
         logging.debug("Fetching details for %s", url)
-        with sync_playwright() as p:
-            browser = p.firefox.launch(headless=self.headless)
-            context = browser.new_context(
-                ignore_https_errors=True,
-                user_agent=self.USER_AGENT,
-                locale="pl-PL",
-            )
-            page = context.new_page()
-            page.goto(url, wait_until="domcontentloaded")
+        with self.limiter, sync_playwright() as p:
+            with metrics.timed(CRAWLER_SECONDS, "browser_launch", step="browser_launch"):
+                browser = p.firefox.launch(headless=self.headless)
+                context = browser.new_context(
+                    ignore_https_errors=True,
+                    user_agent=self.USER_AGENT,
+                    locale="pl-PL",
+                )
+                page = context.new_page()
+            try:
+                with metrics.timed(CRAWLER_SECONDS, "listing_page_load", step="listing_page_load"):
+                    page.goto(url, wait_until="domcontentloaded")
+            except Exception:
+                CRAWLER_ERRORS.inc(step="listing_page_load")
+                raise
             self.accept_cookies(page)
             try:
                 logging.debug("Waiting for listing page %s to load", url)
@@ -248,22 +435,49 @@ class OtodomCrawler:
                     return text
         return ""
 
-    def parse_floor(self, html: str) -> Optional[str]:
-        """Extract floor information from the listing HTML."""
+    def _detail_value(self, html: str, label: str) -> Optional[str]:
+        """Return the value next to ``label`` in the listing details table."""
         from bs4 import BeautifulSoup
 
         soup = BeautifulSoup(html, "html.parser")
         for p in soup.find_all("p"):
             text = p.get_text(strip=True).lower()
-            if text.startswith("piętro"):
+            if text.startswith(label):
                 next_p = p.find_next_sibling("p")
                 if next_p:
-                    floor_text = next_p.get_text(strip=True)
-                    if floor_text:
-                        logging.debug("Parsed floor: %s", floor_text)
-                        return floor_text
+                    value = next_p.get_text(strip=True)
+                    if value:
+                        return value
         return None
 
+    def parse_floor(self, html: str) -> Optional[str]:
+        """Extract floor information from the listing HTML."""
+        floor_text = self._detail_value(html, "piętro")
+        if floor_text:
+            logging.debug("Parsed floor: %s", floor_text)
+        return floor_text
+
+    def parse_area(self, html: str) -> Optional[float]:
+        """Extract the usable area in m² from the listing HTML."""
+        m = re.search(r'"Area"\s*:\s*"?(\d+(?:[.,]\d+)?)', html)
+        raw = m.group(1) if m else self._detail_value(html, "powierzchnia")
+        m = re.search(r"\d+(?:[.,]\d+)?", raw.replace("\xa0", "").replace(" ", "")) if raw else None
+        if not m:
+            return None
+        area = float(m.group(0).replace(",", "."))
+        logging.debug("Parsed area: %s", area)
+        return area if area > 0 else None
+
+    def parse_build_year(self, html: str) -> Optional[int]:
+        """Extract the year the building was completed."""
+        m = re.search(r'"Build_year"\s*:\s*"?(\d{4})', html)
+        raw = m.group(1) if m else self._detail_value(html, "rok budowy")
+        m = re.search(r"\b(1[89]\d{2}|20\d{2})\b", raw) if raw else None
+        if not m:
+            return None
+        logging.debug("Parsed build year: %s", m.group(1))
+        return int(m.group(1))
+
     def parse_photos(self, html: str) -> List[str]:
         """Extract photo URLs from HTML."""
         urls: list[str] = []
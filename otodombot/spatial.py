@@ -0,0 +1,118 @@
+from dataclasses import dataclass, field
+from math import floor
+from typing import Iterable
+
+
+@dataclass
+class MapPoint:
+    id: int
+    lat: float
+    lng: float
+    price: int | None = None
+    commutes: dict[str, int | None] = field(default_factory=dict)
+
+
+def cluster_cell_size(zoom: int, cell_px: int = 60) -> float:
+    """Return the cluster cell size in degrees for a web map zoom level."""
+    return 360.0 / (2 ** max(zoom, 0)) * cell_px / 256.0
+
+
+class GridIndex:
+    """In-memory uniform grid over listing coordinates.
+
+    Points are bucketed into square cells of ``cell_size`` degrees so a
+    bounding box query only visits the cells it overlaps. The index is
+    immutable; build a new one when the data changes.
+    """
+
+    def __init__(self, points: Iterable[MapPoint], cell_size: float = 0.01):
+        self.cell_size = cell_size
+        self.cells: dict[tuple[int, int], list[MapPoint]] = {}
+        self.size = 0
+        for point in points:
+            self.cells.setdefault(self._cell(point.lat, point.lng), []).append(point)
+            self.size += 1
+
+    def _cell(self, lat: float, lng: float) -> tuple[int, int]:
+        return floor(lat / self.cell_size), floor(lng / self.cell_size)
+
+    def query(self, south: float, west: float, north: float, east: float) -> list[MapPoint]:
+        """Return points inside the bounding box."""
+        min_row, min_col = self._cell(south, west)
+        max_row, max_col = self._cell(north, east)
+        if (max_row - min_row + 1) * (max_col - min_col + 1) > len(self.cells):
+            candidates = (
+                p
+                for (row, col), pts in self.cells.items()
+                if min_row <= row <= max_row and min_col <= col <= max_col
+                for p in pts
+            )
+        else:
+            candidates = (
+                p
+                for row in range(min_row, max_row + 1)
+                for col in range(min_col, max_col + 1)
+                for p in self.cells.get((row, col), ())
+            )
+        return [p for p in candidates if south <= p.lat <= north and west <= p.lng <= east]
+
+    def clusters(
+        self,
+        south: float,
+        west: float,
+        north: float,
+        east: float,
+        zoom: int,
+        cell_px: int = 60,
+    ) -> list[dict]:
+        """Aggregate points in the bounding box into clusters for ``zoom``.
+
+        Cluster cells are anchored to a global grid so clusters stay stable
+        while the map is panned. Each cluster reports its centroid, count,
+        minimum price and the best commute per destination; single-point
+        clusters also carry the listing ``id``.
+        """
+        size = cluster_cell_size(zoom, cell_px)
+        groups: dict[tuple[int, int], dict] = {}
+        for p in self.query(south, west, north, east):
+            key = (floor(p.lat / size), floor(p.lng / size))
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {
+                    "count": 0,
+                    "lat_sum": 0.0,
+                    "lng_sum": 0.0,
+                    "min_price": None,
+                    "best_commute": {},
+                    "bounds": [p.lat, p.lng, p.lat, p.lng],
+                    "id": p.id,
+                }
+            group["count"] += 1
+            group["lat_sum"] += p.lat
+            group["lng_sum"] += p.lng
+            if p.price is not None and (group["min_price"] is None or p.price < group["min_price"]):
+                group["min_price"] = p.price
+            best = group["best_commute"]
+            for dest, minutes in p.commutes.items():
+                if minutes is not None and (best.get(dest) is None or minutes < best[dest]):
+                    best[dest] = minutes
+            bounds = group["bounds"]
+            bounds[0] = min(bounds[0], p.lat)
+            bounds[1] = min(bounds[1], p.lng)
+            bounds[2] = max(bounds[2], p.lat)
+            bounds[3] = max(bounds[3], p.lng)
+        result = []
+        for group in groups.values():
+            count = group["count"]
+            result.append(
+                {
+                    "lat": group["lat_sum"] / count,
+                    "lng": group["lng_sum"] / count,
+                    "count": count,
+                    "min_price": group["min_price"],
+                    "best_commute": group["best_commute"],
+                    "bounds": group["bounds"],
+                    "id": group["id"] if count == 1 else None,
+                }
+            )
+        return result
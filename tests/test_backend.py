@@ -0,0 +1,186 @@
+import asyncio
+import csv
+import io
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from otodombot import backend
+from otodombot.db.database import init_db
+from otodombot.db.models import CommuteTime, Listing
+from otodombot.db.search import ensure_search_index
+
+
+@pytest.fixture
+def session_factory(monkeypatch):
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    init_db(engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(backend, "SessionLocal", factory)
+    monkeypatch.setattr(backend, "_spatial_index", None)
+    session = factory()
+    for idx in range(1, 6):
+        listing = Listing(
+            url=f"https://example.com/{idx}",
+            title=f"Flat {idx}",
+            floor="parter/4" if idx == 1 else f"{idx - 1}/4",
+            price=idx * 100,
+            lat=52.0 + idx / 100 if idx != 5 else None,
+            lng=21.0 + idx / 100 if idx != 5 else None,
+            is_good=idx % 2 == 1,
+        )
+        session.add(listing)
+        session.flush()
+        session.add(CommuteTime(listing_id=listing.id, destination="Office", minutes=idx * 10))
+        session.add(CommuteTime(listing_id=listing.id, destination="Station", minutes=5))
+    session.commit()
+    session.close()
+    return factory
+
+
+@pytest.fixture
+def client(session_factory):
+    return TestClient(backend.app)
+
+
+def test_listings_skip_missing_coordinates_and_include_commutes(client):
+    data = client.get("/listings").json()
+    assert [l["id"] for l in data] == [1, 2, 3, 4]
+    assert data[0]["commutes"] == {"Office": 10, "Station": 5}
+
+
+def test_listings_filters(client):
+    params = {"min_price": 200, "max_commute": "Office:30", "is_good": "true"}
+    assert [l["id"] for l in client.get("/listings", params=params).json()] == [3]
+    assert [l["id"] for l in client.get("/listings", params={"floor": ["0", "3"]}).json()] == [1, 4]
+    assert [l["id"] for l in client.get("/listings", params={"floor": ["parter", "1/4"]}).json()] == [1, 2]
+    assert client.get("/listings", params={"floor": "attic"}).status_code == 400
+    assert client.get("/listings", params={"max_commute": "Office"}).status_code == 400
+
+
+def test_listings_keyset_pagination(client):
+    first = client.get("/listings", params={"limit": 3})
+    assert [l["id"] for l in first.json()] == [1, 2, 3]
+    cursor = first.headers["X-Next-Cursor"]
+    second = client.get("/listings", params={"limit": 3, "after_id": cursor})
+    assert [l["id"] for l in second.json()] == [4]
+    assert "X-Next-Cursor" not in second.headers
+
+
+def test_listings_conditional_requests(client, session_factory):
+    first = client.get("/listings")
+    etag = first.headers["ETag"]
+    assert client.get("/listings", headers={"If-None-Match": etag}).status_code == 304
+    last_modified = first.headers["Last-Modified"]
+    assert client.get("/listings", headers={"If-Modified-Since": last_modified}).status_code == 304
+
+    session = session_factory()
+    session.get(Listing, 1).price = 50
+    session.commit()
+    assert client.get("/listings", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_listing_changes_since_version(client, session_factory):
+    version = int(client.get("/listings").headers["X-Data-Version"])
+    assert client.get("/listings/changes", params={"since": version}).json()["upserted"] == []
+
+    session = session_factory()
+    session.get(Listing, 2).price = 250
+    session.delete(session.get(Listing, 3))
+    session.commit()
+    changes = client.get("/listings/changes", params={"since": version}).json()
+    assert changes["version"] > version
+    assert [l["id"] for l in changes["upserted"]] == [2]
+    assert changes["upserted"][0]["price"] == 250
+    assert changes["removed"] == [3]
+
+
+def test_listings_stored_before_versioning_appear_in_changes(monkeypatch):
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE listings (id INTEGER PRIMARY KEY, url VARCHAR, lat FLOAT, lng FLOAT)"))
+        conn.execute(text("INSERT INTO listings VALUES (7, 'https://example.com/old', 52.2, 21.0)"))
+    init_db(engine)
+    monkeypatch.setattr(backend, "SessionLocal", sessionmaker(bind=engine))
+    changes = TestClient(backend.app).get("/listings/changes", params={"since": 0}).json()
+    assert [l["id"] for l in changes["upserted"]] == [7]
+    assert changes["version"] >= 1
+
+
+def test_init_db_parses_storeys_of_existing_listings():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE listings (id INTEGER PRIMARY KEY, url VARCHAR, floor VARCHAR)"))
+        conn.execute(text("INSERT INTO listings VALUES (1, 'u1', '3/6'), (2, 'u2', 'parter'), (3, 'u3', 'poddasze')"))
+    init_db(engine)
+    session = sessionmaker(bind=engine)()
+    assert [l.storey for l in session.query(Listing).order_by(Listing.id)] == [3, 0, None]
+    listing = session.get(Listing, 3)
+    listing.floor = "4/4"
+    assert listing.storey == 4
+
+
+def test_listing_clusters(client):
+    bbox = "20.9,51.9,21.2,52.2"
+    clusters = client.get("/listings/clusters", params={"bbox": bbox, "zoom": 5}).json()
+    assert [c["count"] for c in clusters] == [4]
+    assert clusters[0]["min_price"] == 100
+    assert clusters[0]["best_commute"] == {"Office": 10, "Station": 5}
+    for bad in ("x", "20,52,inf,53", "20,52,nan,53", "20,52,21"):
+        assert client.get("/listings/clusters", params={"bbox": bad, "zoom": 5}).status_code == 400
+
+
+def test_export_ndjson_streams_all_listings(client):
+    response = client.get("/export")
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["id"] for r in rows] == [1, 2, 3, 4, 5]
+    assert rows[4]["lat"] is None
+    assert rows[0]["commutes"] == {"Office": 10, "Station": 5}
+    assert "description" not in rows[0]
+
+
+def test_export_csv_has_commute_columns(client):
+    response = client.get("/export", params={"format": "csv", "include_description": "true"})
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0][-3:] == ["description", "commute:Office", "commute:Station"]
+    assert len(rows) == 6
+    assert rows[1][-2:] == ["10", "5"]
+
+
+def test_search_endpoint(client, session_factory):
+    ensure_search_index(session_factory.kw["bind"])
+    results = client.get("/search", params={"q": "flat 3"}).json()
+    assert results[0]["id"] == 3
+
+
+def test_listing_events_push_changes_with_resumable_ids(session_factory):
+    version = int(TestClient(backend.app).get("/listings").headers["X-Data-Version"])
+    session = session_factory()
+    session.get(Listing, 4).price = 999
+    session.commit()
+
+    async def connected():
+        return False
+
+    async def first_event():
+        events = backend.listing_events(version, connected, poll_interval=0)
+        assert (await events.__anext__()).startswith("retry:")
+        event = await events.__anext__()
+        await events.aclose()
+        return event
+
+    event = asyncio.run(first_event())
+    lines = event.strip().split("\n")
+    assert lines[0] == f"id: {version + 1}"
+    assert lines[1] == "event: changes"
+    payload = json.loads(lines[2][len("data: "):])
+    assert [l["id"] for l in payload["upserted"]] == [4]
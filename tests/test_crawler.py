@@ -1,5 +1,9 @@
+import urllib.parse
+
 import pytest
-from otodombot.scraper.crawler import OtodomCrawler
+from otodombot.config import SearchConditions, load_config
+from otodombot.scraper import crawler as crawler_module
+from otodombot.scraper.crawler import OtodomCrawler, SearchCard, card_filter, parse_search_card
 
 
 def test_parse_floor_basic():
@@ -23,3 +27,113 @@ def test_parse_floor_with_span():
     html = '<div><p>Piętro:</p><p><span>1</span>/4</p></div>'
     crawler = OtodomCrawler()
     assert crawler.parse_floor(html) == '1/4'
+
+
+def test_parse_area_and_build_year():
+    crawler = OtodomCrawler()
+    html = "<div><p>Powierzchnia:</p><p>61,5 m²</p><p>Rok budowy:</p><p>1998</p></div>"
+    assert crawler.parse_area(html) == 61.5
+    assert crawler.parse_build_year(html) == 1998
+    assert crawler.parse_area('{"Area":"48.3","Build_year":"2012"}') == 48.3
+    assert crawler.parse_build_year('{"Area":"48.3","Build_year":"2012"}') == 2012
+    assert crawler.parse_area("<p>brak</p>") is None
+
+
+def test_iter_listings_streams_pages_and_dedupes(monkeypatch):
+    pages = {
+        1: ["https://otodom.pl/a", "https://otodom.pl/b", "https://otodom.pl/a"],
+        2: ["https://otodom.pl/b", "https://otodom.pl/c"],
+        3: [],
+        4: ["https://otodom.pl/never"],
+    }
+    loaded = []
+
+    def cards(url):
+        page = int(url.rsplit("page=", 1)[1])
+        loaded.append(page)
+        return [SearchCard(url=link) for link in pages[page]]
+
+    crawler = OtodomCrawler()
+    monkeypatch.setattr(crawler, "_search_page_cards", cards)
+    urls = crawler.iter_listings(max_pages=4)
+    assert next(urls) == "https://otodom.pl/a"
+    assert loaded == [1]
+    assert list(urls) == ["https://otodom.pl/b", "https://otodom.pl/c"]
+    assert loaded == [1, 2, 3]
+
+
+def test_build_url_pushes_filters_to_otodom():
+    search = SearchConditions(
+        min_price=500000,
+        max_price=900000,
+        max_area=70,
+        min_price_per_m2=12000,
+        max_price_per_m2=18000,
+        build_year_max=2010,
+        ignore_floors=["parter", "3/6"],
+    )
+    query = urllib.parse.parse_qs(urllib.parse.urlsplit(OtodomCrawler(search).build_url()).query)
+    assert query["priceMin"] == ["500000"] and query["priceMax"] == ["900000"]
+    assert query["areaMax"] == ["70"] and query["buildYearMax"] == ["2010"]
+    assert query["pricePerMeterMin"] == ["12000"] and query["pricePerMeterMax"] == ["18000"]
+    floors = query["floors"][0].strip("[]").split(",")
+    assert "GROUND" not in floors and floors[:2] == ["CELLAR", "FIRST"]
+
+    search = SearchConditions(floors=["FIRST", "SECOND"], ignore_floors=["parter"])
+    assert "floors=%5BFIRST%2CSECOND%5D" in OtodomCrawler(search).build_url()
+
+
+def test_parse_search_card():
+    text = (
+        "Mieszkanie 3-pokojowe, Mokotów 2\n1 250 000 zł\n20\u00a0833 zł/m²\n"
+        "Liczba pokoi\n3 pokoje\nPowierzchnia\n60,5 m²\nPiętro\n4 piętro"
+    )
+    card = parse_search_card("https://otodom.pl/a", text, "Puławska, Mokotów, Warszawa")
+    assert (card.price, card.price_per_m2, card.area, card.rooms, card.floor) == (
+        1250000, 20833, 60.5, 3, "FOURTH"
+    )
+    assert parse_search_card("u", "Zapytaj o cenę\nparter").floor == "GROUND"
+    assert parse_search_card("u", "Zapytaj o cenę").price is None
+
+
+def test_card_filter_names_the_failing_filter():
+    search = SearchConditions(
+        max_price=800000, max_area=70, max_price_per_m2=15000, rooms=[2, 3],
+        ignore_floors=["parter"], districts=["Mokotów", "Wola"],
+    )
+    ok = SearchCard(url="u", price=700000, area=50, rooms=2, floor="FIRST", address="Wola, Warszawa")
+    assert card_filter(ok, search) is None
+    assert card_filter(SearchCard(url="u"), search) is None
+    assert card_filter(SearchCard(url="u", price=900000), search) == "price"
+    assert card_filter(SearchCard(url="u", area=75.5), search) == "area"
+    assert card_filter(SearchCard(url="u", price=780000, area=50), search) == "price_per_m2"
+    assert card_filter(SearchCard(url="u", rooms=4), search) == "rooms"
+    assert card_filter(SearchCard(url="u", floor="GROUND"), search) == "ignore_floors"
+    assert card_filter(SearchCard(url="u", address="ul. Mokotowska, Śródmieście"), search) == "districts"
+    assert card_filter(SearchCard(url="u", address="Stary Mokotów, Mokotow, Warszawa"), search) is None
+
+
+def test_iter_listings_counts_fetches_saved_per_filter(monkeypatch):
+    page = [
+        SearchCard(url="https://otodom.pl/a", price=500000),
+        SearchCard(url="https://otodom.pl/b", price=950000),
+        SearchCard(url="https://otodom.pl/c", floor="GROUND"),
+        SearchCard(url="https://otodom.pl/b", price=950000),
+    ]
+    crawler = OtodomCrawler(SearchConditions(max_price=900000, floors=["FIRST"]))
+    monkeypatch.setattr(crawler, "_search_page_cards", lambda url: page)
+    before = crawler_module.FETCHES_SAVED.value(filter="price")
+    assert list(crawler.iter_listings(max_pages=1)) == ["https://otodom.pl/a"]
+    assert crawler.fetches_saved == {"price": 1, "floors": 1}
+    assert crawler_module.FETCHES_SAVED.value(filter="price") == before + 1
+
+
+def test_load_config_search_filters(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text('{"search": {"floors": [0, 2, 12, "poddasze"], "districts": "Wola", "max_area": 80}}')
+    search = load_config(path).search
+    assert search.floors == ["GROUND", "SECOND", "ABOVE_TENTH", "GARRET"]
+    assert search.districts == ["Wola"] and search.max_area == 80
+    path.write_text('{"search": {"floors": ["mezzanine"]}}')
+    with pytest.raises(ValueError):
+        load_config(path)
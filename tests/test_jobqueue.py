@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta
+import threading
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from otodombot.config import Config, PipelineSettings, QueueSettings
+from otodombot.db.database import init_db, make_engine
+from otodombot.db.models import Job, Listing
+from otodombot.scheduler import tasks
+from otodombot.scheduler.jobqueue import JobQueue, enqueue_job
+
+
+def make_session_factory(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'otodom.db'}")
+    init_db(engine)
+    return sessionmaker(bind=engine)
+
+
+def test_enqueue_skips_active_and_requeues_finished(tmp_path):
+    Session = make_session_factory(tmp_path)
+    session = Session()
+    assert enqueue_job(session, "listing", "listing:a", {"url": "a"})
+    assert not enqueue_job(session, "listing", "listing:a", {"url": "a"})
+    session.query(Job).update({"status": "done"})
+    session.commit()
+    assert enqueue_job(session, "listing", "listing:a", {"url": "a"})
+    assert session.query(Job).one().status == "pending"
+
+
+def test_concurrent_workers_never_claim_the_same_job(tmp_path):
+    Session = make_session_factory(tmp_path)
+    session = Session()
+    for i in range(40):
+        enqueue_job(session, "listing", f"listing:{i}", {"url": str(i)})
+    claimed: dict[str, list[int]] = {}
+
+    def work(owner):
+        queue = JobQueue(Session, owner=owner)
+        mine = claimed.setdefault(owner, [])
+        while batch := queue.claim(["listing"], limit=3):
+            mine.extend(job.id for job in batch)
+
+    threads = [threading.Thread(target=work, args=(f"w{i}",)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    ids = [job_id for mine in claimed.values() for job_id in mine]
+    assert len(ids) == 40
+    assert len(set(ids)) == 40
+
+
+def test_expired_lease_becomes_visible_again(tmp_path):
+    Session = make_session_factory(tmp_path)
+    enqueue_job(Session(), "listing", "listing:a")
+    first = JobQueue(Session, owner="first", lease_seconds=0.2)
+    second = JobQueue(Session, owner="second", lease_seconds=60)
+
+    (job,) = first.claim(["listing"])
+    assert second.claim(["listing"]) == []
+    assert first.heartbeat() == 1
+    time.sleep(0.3)
+    (again,) = second.claim(["listing"])
+    assert again.id == job.id and again.attempts == 2
+    assert not first.complete(job.id)
+    assert second.complete(job.id)
+
+
+def test_failed_jobs_retry_until_attempts_run_out(tmp_path):
+    Session = make_session_factory(tmp_path)
+    enqueue_job(Session(), "listing", "listing:a", max_attempts=2)
+    queue = JobQueue(Session, owner="w", retry_delay=0)
+
+    (job,) = queue.claim(["listing"])
+    queue.fail(job.id, "timeout")
+    (job,) = queue.claim(["listing"])
+    queue.fail(job.id, "timeout")
+    assert queue.claim(["listing"]) == []
+    row = Session().get(Job, job.id)
+    assert (row.status, row.attempts, row.last_error) == ("failed", 2, "timeout")
+
+
+class PageCrawler:
+    def fetch_listing_details(self, url):
+        if url.endswith("broken"):
+            raise RuntimeError("page did not load")
+        return url
+
+    def parse_price(self, html):
+        return 450000
+
+    def parse_listing_id(self, html):
+        return abs(hash(html)) % 10**6
+
+    def parse_floor(self, html):
+        return "3"
+
+    def parse_area(self, html):
+        return 50.0
+
+    def parse_build_year(self, html):
+        return 2005
+
+    def parse_title(self, html):
+        return "Flat " + html[-1]
+
+    def parse_description(self, html):
+        return ""
+
+    def parse_photos(self, html):
+        return []
+
+
+def test_queue_worker_processes_and_completes_jobs(tmp_path):
+    Session = make_session_factory(tmp_path)
+    session = Session()
+    for url in ("https://otodom.pl/a", "https://otodom.pl/b", "https://otodom.pl/broken"):
+        enqueue_job(session, "listing", f"listing:{url}", {"url": url, "search": "default"}, max_attempts=1)
+    config = Config(
+        queue=QueueSettings(mode="db", poll_interval=0.05, max_attempts=1),
+        pipeline=PipelineSettings(report_interval=60),
+    )
+    stages = tasks.ScrapeStages(config, PageCrawler(), session_factory=Session)
+    worker = tasks.QueueWorker(config, stages, JobQueue(Session, owner="w"))
+    worker.start()
+    deadline = datetime.utcnow() + timedelta(seconds=5)
+    while session.query(Job).filter(Job.status.in_(["pending", "leased"])).count():
+        assert datetime.utcnow() < deadline
+        time.sleep(0.05)
+        session.rollback()
+    worker.stop()
+
+    statuses = {job.key: job.status for job in session.query(Job)}
+    assert statuses == {
+        "listing:https://otodom.pl/a": "done",
+        "listing:https://otodom.pl/b": "done",
+        "listing:https://otodom.pl/broken": "failed",
+    }
+    assert sorted(listing.title for listing in session.query(Listing)) == ["Flat a", "Flat b"]
@@ -0,0 +1,168 @@
+import json
+import urllib.request
+
+from fastapi.testclient import TestClient
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from otodombot import backend, metrics
+from otodombot.config import Config, MetricsSettings, PipelineSettings
+from otodombot.db.database import QUERY_SECONDS, init_db, make_engine
+from otodombot.scheduler import tasks
+from otodombot.scheduler.pipeline import Pipeline, Stage
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = metrics.Registry()
+    hist = registry.histogram("demo_seconds", "Demo", ("step",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        hist.observe(value, step="load")
+    text = registry.render()
+    assert '# TYPE demo_seconds histogram' in text
+    assert 'demo_seconds_bucket{step="load",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{step="load",le="1.0"} 3' in text
+    assert 'demo_seconds_bucket{step="load",le="+Inf"} 4' in text
+    assert 'demo_seconds_count{step="load"} 4' in text
+
+
+def test_registry_returns_existing_metric_and_checks_labels():
+    registry = metrics.Registry()
+    counter = registry.counter("demo_total", "Demo", ("result",))
+    assert registry.counter("demo_total", "Demo", ("result",)) is counter
+    counter.inc(result='say "hi"')
+    assert 'demo_total{result="say \\"hi\\""} 1' in registry.render()
+    try:
+        registry.gauge("demo_total", "Demo")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("re-registering with another type must fail")
+
+
+def test_trace_records_spans_from_pipeline_stages(tmp_path):
+    class Item:
+        def __init__(self):
+            self.trace = metrics.Trace("https://otodom.pl/pl/oferta/flat-ID1")
+
+    hist = metrics.Registry().histogram("inner_seconds", "Inner")
+
+    def step(item):
+        with metrics.timed(hist, span="inner", category="test"):
+            pass
+        return item
+
+    item = Item()
+    Pipeline([Stage("one", step), Stage("two", step)], name="trace-test").run([item])
+
+    data = item.trace.to_json()
+    spans = [e for e in data["traceEvents"] if e["ph"] == "X"]
+    assert [e["name"] for e in spans if e["cat"] == "stage"] == ["one", "two"]
+    assert sum(e["name"] == "inner" for e in spans) == 2
+    assert any(e["ph"] == "M" for e in data["traceEvents"])
+    path = item.trace.dump(tmp_path)
+    assert path.name.endswith("flat-ID1.json")
+    assert json.loads(path.read_text())["otherData"]["listing"].endswith("ID1")
+
+
+class PageCrawler:
+    def iter_listings(self, max_pages, sort_by):
+        return ["https://otodom.pl/pl/oferta/a", "https://otodom.pl/pl/oferta/b"]
+
+    def fetch_listing_details(self, url):
+        return url
+
+    def parse_price(self, html):
+        return 100 if html.endswith("a") else None
+
+    def parse_listing_id(self, html):
+        return html[-1]
+
+    def parse_floor(self, html):
+        return "1"
+
+    def parse_area(self, html):
+        return 50.0
+
+    def parse_build_year(self, html):
+        return 2005
+
+    def parse_title(self, html):
+        return "Flat"
+
+    def parse_description(self, html):
+        return ""
+
+    def parse_photos(self, html):
+        return []
+
+
+def test_scrape_run_counts_outcomes_and_dumps_traces(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'otodom.db'}")
+    init_db(engine)
+    trace_dir = tmp_path / "traces"
+    config = Config(
+        pipeline=PipelineSettings(report_interval=60),
+        metrics=MetricsSettings(trace_dir=str(trace_dir)),
+    )
+    stages = tasks.ScrapeStages(
+        config, PageCrawler(), session_factory=sessionmaker(bind=engine), search_name="metrics-test"
+    )
+    before = tasks.PARSE_SECONDS.count(field="price")
+    tasks.build_pipeline(stages, config.pipeline).run(["DEFAULT"])
+
+    assert tasks.LISTINGS.value(search="metrics-test", outcome="new") == 1
+    assert tasks.LISTINGS.value(search="metrics-test", outcome="no_price") == 1
+    assert tasks.PARSE_SECONDS.count(field="price") == before + 2
+    (dump,) = trace_dir.glob("*.json")
+    stages_seen = {e["name"] for e in json.loads(dump.read_text())["traceEvents"] if e.get("cat") == "stage"}
+    assert {"fetch", "parse", "enrich", "persist"} <= stages_seen
+
+
+def test_failing_statements_leave_no_timer_state_on_the_connection():
+    engine = make_engine("sqlite://")
+    with engine.connect() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY)"))
+        conn.execute(text("INSERT INTO t VALUES (1)"))
+        for _ in range(5):
+            with pytest.raises(IntegrityError):
+                conn.execute(text("INSERT INTO t VALUES (1)"))
+        before = QUERY_SECONDS.count(operation="SELECT")
+        conn.execute(text("SELECT id FROM t"))
+        assert QUERY_SECONDS.count(operation="SELECT") == before + 1
+        assert not conn.info
+
+
+def test_backend_exposes_metrics():
+    client = TestClient(backend.app)
+    client.get("/metrics")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'otodombot_http_request_seconds_count{method="GET",route="/metrics",status="200"}' in response.text
+
+
+def test_metrics_http_server_serves_registry():
+    server = metrics.start_http_server(0, host="127.0.0.1")
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            body = response.read().decode()
+        assert "# TYPE otodombot_stage_seconds histogram" in body
+    finally:
+        server.shutdown()
+
+
+def test_second_process_on_a_taken_metrics_port_keeps_running(caplog):
+    from otodombot.main import parse_args, start_metrics_server
+
+    server = metrics.start_http_server(0, host="127.0.0.1")
+    try:
+        port = server.server_address[1]
+        assert start_metrics_server(port) is None
+        assert "cannot listen" in caplog.text
+    finally:
+        server.shutdown()
+    assert start_metrics_server(0) is None
+    assert parse_args(["--role", "worker", "--metrics-port", "9101"]).metrics_port == 9101
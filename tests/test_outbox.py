@@ -0,0 +1,173 @@
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from otodombot.config import NotificationSettings
+from otodombot.db.models import Base, Listing, NotificationOutbox
+from otodombot.notifications.outbox import OutboxWorker, enqueue_notification
+
+
+class FakeNotifier:
+    def __init__(self, fail_chats=(), fail_texts=()):
+        self.sent = []
+        self.fail_chats = set(fail_chats)
+        self.fail_texts = set(fail_texts)
+
+    def send_listing(self, chat_id, text, photos=None):
+        fut = Future()
+        if chat_id in self.fail_chats or text in self.fail_texts:
+            fut.set_exception(RuntimeError("boom"))
+        else:
+            self.sent.append((chat_id, text, photos))
+            fut.set_result(None)
+        return fut
+
+
+def make_session_factory():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+
+def add_listing(session, chat_ids):
+    listing = Listing(url="https://example.com/1", title="Flat", price=1)
+    session.add(listing)
+    session.flush()
+    enqueue_notification(session, listing.id, chat_ids, "text", ["photo.jpg"])
+    session.commit()
+    return listing
+
+
+def test_enqueue_is_idempotent_per_listing_and_chat():
+    Session = make_session_factory()
+    session = Session()
+    listing = add_listing(session, ["1", "2"])
+    assert enqueue_notification(session, listing.id, ["1", "2", "3"], "text") == 1
+    session.commit()
+    assert session.query(NotificationOutbox).count() == 3
+
+
+def test_drain_marks_rows_sent_and_retries_failures():
+    Session = make_session_factory()
+    session = Session()
+    add_listing(session, ["1", "2"])
+    notifier = FakeNotifier(fail_chats={"2"})
+    worker = OutboxWorker(notifier, session_factory=Session, max_attempts=2, retry_backoff=0)
+
+    assert worker.drain_once() == 1
+    assert notifier.sent == [("1", "text", ["photo.jpg"])]
+    assert worker.drain_once() == 0
+    statuses = {r.chat_id: r.status for r in Session().query(NotificationOutbox)}
+    assert statuses == {"1": "sent", "2": "failed"}
+
+
+def test_digest_mode_waits_for_window_then_coalesces():
+    Session = make_session_factory()
+    session = Session()
+    for idx, price in enumerate([300, 100, 200]):
+        listing = Listing(url=f"https://example.com/{idx}", title=f"Flat {idx}", price=price)
+        session.add(listing)
+        session.flush()
+        enqueue_notification(session, listing.id, ["1"], f"full {idx}", [f"{idx}.jpg"])
+    session.commit()
+    notifier = FakeNotifier()
+    settings = NotificationSettings(mode="digest", digest_window_minutes=10, digest_top_photos=1, digest_order="price")
+    worker = OutboxWorker(notifier, session_factory=Session, settings=settings)
+
+    assert worker.drain_once() == 0
+    session.query(NotificationOutbox).update(
+        {NotificationOutbox.created_at: datetime.utcnow() - timedelta(minutes=11)}
+    )
+    session.commit()
+    assert worker.drain_once() == 3
+    assert len(notifier.sent) == 2
+    summary, top = notifier.sent
+    assert "3 new listings" in summary[1]
+    assert summary[1].index("Flat 1") < summary[1].index("Flat 2") < summary[1].index("Flat 0")
+    assert top == ("1", "full 1", ["1.jpg"])
+
+
+def test_digest_retries_only_rows_whose_messages_failed():
+    Session = make_session_factory()
+    session = Session()
+    for idx, price in enumerate([300, 100, 200]):
+        listing = Listing(url=f"https://example.com/{idx}", title=f"Flat {idx}", price=price)
+        session.add(listing)
+        session.flush()
+        enqueue_notification(session, listing.id, ["1"], f"full {idx}", [f"{idx}.jpg"])
+    session.query(NotificationOutbox).update(
+        {NotificationOutbox.created_at: datetime.utcnow() - timedelta(minutes=11)}
+    )
+    session.commit()
+    notifier = FakeNotifier(fail_texts={"full 1"})
+    settings = NotificationSettings(mode="digest", digest_window_minutes=10, digest_top_photos=1, digest_order="price")
+    worker = OutboxWorker(notifier, session_factory=Session, settings=settings, retry_backoff=0)
+
+    assert worker.drain_once() == 2
+    statuses = {r.text: r.status for r in Session().query(NotificationOutbox)}
+    assert statuses == {"full 0": "sent", "full 1": "pending", "full 2": "sent"}
+
+    notifier.fail_texts.clear()
+    notifier.sent.clear()
+    assert worker.drain_once() == 1
+    summary, top = notifier.sent
+    assert "1 new listings" in summary[1] and "Flat 0" not in summary[1]
+    assert top == ("1", "full 1", ["1.jpg"])
+
+
+class HangingNotifier:
+    """Holds every message, like a notifier waiting out Telegram flood limits."""
+
+    def __init__(self):
+        self.futures = []
+
+    def send_listing(self, chat_id, text, photos=None):
+        fut = Future()
+        self.futures.append(fut)
+        return fut
+
+
+def test_rows_in_flight_are_not_resent_and_the_batch_is_waited_for_once():
+    Session = make_session_factory()
+    session = Session()
+    add_listing(session, ["1", "2"])
+    notifier = HangingNotifier()
+    worker = OutboxWorker(notifier, session_factory=Session, send_timeout=0.2)
+
+    started = time.monotonic()
+    assert worker.drain_once() == 0
+    # one bounded wait for the whole batch, not one per row
+    assert time.monotonic() - started < 0.4
+    assert worker.drain_once() == 0
+    assert len(notifier.futures) == 2
+    rows = Session().query(NotificationOutbox).all()
+    assert {(r.status, r.attempts) for r in rows} == {("pending", 0)}
+
+    notifier.futures[0].set_result(None)
+    notifier.futures[1].set_exception(RuntimeError("boom"))
+    assert worker.drain_once() == 1
+    assert len(notifier.futures) == 2
+    statuses = {r.chat_id: (r.status, r.attempts) for r in Session().query(NotificationOutbox)}
+    assert statuses == {"1": ("sent", 1), "2": ("pending", 1)}
+
+
+def test_failed_rows_back_off_before_the_next_attempt():
+    Session = make_session_factory()
+    session = Session()
+    add_listing(session, ["1"])
+    notifier = FakeNotifier(fail_chats={"1"})
+    worker = OutboxWorker(notifier, session_factory=Session, retry_backoff=60)
+
+    assert worker.drain_once() == 0
+    notifier.fail_chats.clear()
+    assert worker.drain_once() == 0
+    assert notifier.sent == []
+    row = Session().query(NotificationOutbox).one()
+    assert row.available_at > datetime.utcnow() + timedelta(seconds=50)
+
+    session.query(NotificationOutbox).update({NotificationOutbox.available_at: datetime.utcnow()})
+    session.commit()
+    assert worker.drain_once() == 1
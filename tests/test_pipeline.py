@@ -0,0 +1,430 @@
+import json
+import threading
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from otodombot.config import (
+    CommuteSettings,
+    Config,
+    PipelineSettings,
+    SearchConditions,
+    SearchProfile,
+    load_config,
+)
+from otodombot.db.database import init_db
+from otodombot.db.models import CommuteTime, Listing, NotificationOutbox, ScrapeRun, ScrapeRunUrl
+from otodombot.scheduler import tasks
+from otodombot.scheduler.checkpoint import RunCheckpoint
+from otodombot.scheduler.dedupe import ClaimRegistry
+from otodombot.scheduler.pipeline import Pipeline, Stage
+
+
+def test_pipeline_runs_stages_and_counts():
+    seen = []
+
+    def split(n):
+        for i in range(n):
+            yield i
+
+    def drop_odd(i):
+        if i % 2:
+            return None
+        if i == 4:
+            raise ValueError("bad item")
+        return i
+
+    pipeline = Pipeline(
+        [
+            Stage("split", split),
+            Stage("filter", drop_odd, workers=3, queue_size=2),
+            Stage("collect", seen.append),
+        ]
+    )
+    stats = {s["name"]: s for s in pipeline.run([3, 5])}
+
+    assert sorted(seen) == [0, 0, 2, 2]
+    assert stats["split"]["processed"] == 2
+    assert stats["split"]["emitted"] == 8
+    assert stats["filter"]["processed"] == 8
+    assert stats["filter"]["errors"] == 1
+    assert stats["filter"]["emitted"] == 4
+    assert stats["collect"]["processed"] == 4
+    assert stats["filter"]["max_queue_depth"] <= 2
+
+
+def test_bounded_queue_applies_back_pressure():
+    release = threading.Event()
+    produced = []
+
+    def source(n):
+        for i in range(n):
+            produced.append(i)
+            yield i
+
+    def slow(i):
+        release.wait()
+        return i
+
+    pipeline = Pipeline([Stage("source", source), Stage("slow", slow, queue_size=1)])
+    runner = threading.Thread(target=pipeline.run, args=([50],))
+    runner.start()
+    time.sleep(0.2)
+    # one item in the slow worker, one queued, one blocked in put
+    assert len(produced) <= 3
+    release.set()
+    runner.join(timeout=5)
+    assert len(produced) == 50
+
+
+def test_time_blocked_on_a_full_queue_is_not_busy_time():
+    def src(n):
+        yield from range(n)
+
+    def fast(i):
+        time.sleep(0.01)
+        return i
+
+    def slow(i):
+        time.sleep(0.1)
+        return i
+
+    pipeline = Pipeline(
+        [Stage("src", src), Stage("fast", fast, queue_size=1), Stage("slow", slow, queue_size=1)]
+    )
+    stats = {s["name"]: s for s in pipeline.run([10])}
+
+    assert stats["slow"]["utilization"] > 0.8
+    assert stats["fast"]["utilization"] < 0.3
+    assert stats["fast"]["blocked_seconds"] > 0.5
+    assert pipeline.bottleneck() == "slow"
+
+
+class FakeCrawler:
+    pages = {
+        "https://otodom.pl/a": {"price": 500000, "id": 1, "floor": "2", "title": "Flat A"},
+        "https://otodom.pl/b": {"price": 600000, "id": 2, "floor": "parter", "title": "Flat B"},
+        "https://otodom.pl/c": {"price": None, "id": 3, "floor": "1", "title": "Flat C"},
+    }
+
+    def iter_listings(self, max_pages=3, sort_by="DEFAULT"):
+        return list(self.pages)
+
+    def fetch_listing_details(self, url):
+        return url
+
+    def parse_price(self, html):
+        return self.pages[html]["price"]
+
+    def parse_listing_id(self, html):
+        return self.pages[html]["id"]
+
+    def parse_floor(self, html):
+        return self.pages[html]["floor"]
+
+    def parse_area(self, html):
+        return 50.0
+
+    def parse_build_year(self, html):
+        return 2005
+
+    def parse_title(self, html):
+        return self.pages[html]["title"]
+
+    def parse_description(self, html):
+        return "Nice flat"
+
+    def parse_photos(self, html):
+        return ["p1.jpg", "p2.jpg", "p3.jpg", "p4.jpg"]
+
+
+def test_scrape_pipeline_persists_and_enqueues(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'otodom.db'}")
+    init_db(engine)
+    Session = sessionmaker(bind=engine)
+    monkeypatch.setattr(tasks, "extract_address", lambda **kwargs: "Marszałkowska 1")
+    monkeypatch.setattr(
+        tasks,
+        "evaluate_location",
+        lambda address, pois, depart, key: {"lat": 52.2, "lng": 21.0, "Office": 25},
+    )
+    monkeypatch.setattr(tasks, "rate_listing", lambda summary, api_key: "Looks good")
+    woken = []
+    monkeypatch.setattr(tasks, "wake_outbox_worker", lambda: woken.append(True))
+
+    config = Config(commute=CommuteSettings(pois=["Office"], thresholds={"Office": 30}))
+    config.search.ignore_floors = ["parter"]
+    stages = tasks.ScrapeStages(
+        config,
+        FakeCrawler(),
+        openai_key="k",
+        google_key="g",
+        telegram_token="t",
+        telegram_chat_ids=["1", "2"],
+        session_factory=Session,
+    )
+    pipeline = tasks.build_pipeline(stages, PipelineSettings(fetch_workers=2, enrich_workers=2))
+    stats = {s["name"]: s for s in pipeline.run(["DEFAULT", "LATEST"])}
+
+    assert stats["discover"]["emitted"] == 3
+    assert stats["parse"]["dropped"] == 2
+    assert stats["notify"]["processed"] == 1
+    assert woken == [True]
+
+    session = Session()
+    listing = session.query(Listing).one()
+    assert (listing.title, listing.location, listing.notes) == ("Flat A", "Marszałkowska 1", "Looks good")
+    assert session.query(CommuteTime).one().minutes == 25
+    rows = session.query(NotificationOutbox).all()
+    assert sorted(r.chat_id for r in rows) == ["1", "2"]
+    assert "Flat A" in rows[0].text and "Office" in rows[0].text
+
+    # a second run skips the listing parsed moments ago
+    stats = {s["name"]: s for s in tasks.build_pipeline(stages, PipelineSettings()).run(["DEFAULT"])}
+    assert stats["discover"]["emitted"] == 0
+
+
+def test_network_calls_run_outside_database_sessions(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'otodom.db'}")
+    init_db(engine)
+    Session = sessionmaker(bind=engine)
+    # sessions open per thread; other stages hold their own meanwhile
+    open_sessions = []
+
+    def tracked_session():
+        session = Session()
+        entry = (threading.get_ident(), session)
+        open_sessions.append(entry)
+        close = session.close
+
+        def tracked_close():
+            open_sessions.remove(entry)
+            close()
+
+        session.close = tracked_close
+        return session
+
+    def network(result):
+        def call(*args, **kwargs):
+            assert [s for thread, s in open_sessions if thread == threading.get_ident()] == []
+            return result
+
+        return call
+
+    monkeypatch.setattr(tasks, "extract_address", network("Marszałkowska 1"))
+    monkeypatch.setattr(tasks, "evaluate_location", network({"lat": 52.2, "lng": 21.0, "Office": 25}))
+    monkeypatch.setattr(tasks, "rate_listing", network("Looks good"))
+    monkeypatch.setattr(tasks, "wake_outbox_worker", lambda: None)
+    config = Config(commute=CommuteSettings(pois=["Office"]))
+    stages = tasks.ScrapeStages(
+        config,
+        FakeCrawler(),
+        openai_key="k",
+        google_key="g",
+        telegram_token="t",
+        telegram_chat_ids=["1"],
+        session_factory=tracked_session,
+    )
+    stats = {s["name"]: s for s in tasks.build_pipeline(stages, PipelineSettings()).run(["DEFAULT"])}
+    assert stats["enrich"]["errors"] == 0 and stats["notify"]["processed"] == 2
+
+    listing_id = Session().query(Listing.id).first()[0]
+    assert stages.refresh_commutes(tasks.ListingJob(url="", listing_id=listing_id)) is not None
+    assert open_sessions == []
+
+
+def test_ignore_floors_comes_from_each_search(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'otodom.db'}")
+    init_db(engine)
+    Session = sessionmaker(bind=engine)
+    config = Config(
+        searches=[
+            SearchProfile(name="no-ground", search=SearchConditions(ignore_floors=["parter"])),
+            SearchProfile(name="no-second", search=SearchConditions(ignore_floors=["2"])),
+        ]
+    )
+    floors = {}
+    for name in ("no-ground", "no-second"):
+        stages = tasks.ScrapeStages(config, FakeCrawler(), session_factory=Session, search_name=name)
+        parsed = [stages.parse(tasks.ListingJob(url=url, search=name, html=url)) for url in FakeCrawler.pages]
+        floors[name] = sorted(job.floor for job in parsed if job)
+    assert floors == {"no-ground": ["2"], "no-second": ["parter"]}
+
+
+def test_listing_dropped_by_one_search_is_left_to_the_others(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'otodom.db'}")
+    init_db(engine)
+    Session = sessionmaker(bind=engine)
+    config = Config(
+        searches=[
+            SearchProfile(name="no-ground", search=SearchConditions(ignore_floors=["parter"])),
+            SearchProfile(name="any-floor", search=SearchConditions()),
+        ]
+    )
+    registry = ClaimRegistry()
+    for name in ("no-ground", "any-floor"):
+        stages = tasks.ScrapeStages(
+            config, FakeCrawler(), session_factory=Session, search_name=name, registry=registry
+        )
+        tasks.build_pipeline(stages, PipelineSettings()).run(["DEFAULT"])
+
+    stored = {listing.url: listing.floor for listing in Session().query(Listing)}
+    assert stored == {"https://otodom.pl/a": "2", "https://otodom.pl/b": "parter"}
+    assert registry.owner("https://otodom.pl/a") == "no-ground"
+    assert registry.owner("https://otodom.pl/b") == "any-floor"
+    # a missing price drops the listing for every search, so the claim is kept
+    assert registry.owner("https://otodom.pl/c") == "no-ground"
+
+
+def test_concurrent_searches_share_claims(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'otodom.db'}")
+    init_db(engine)
+    Session = sessionmaker(bind=engine)
+    config = Config()
+    registry = ClaimRegistry()
+    fetched = []
+
+    class CountingCrawler(FakeCrawler):
+        def iter_listings(self, max_pages=3, sort_by="DEFAULT"):
+            return [url + "?utm=1" for url in self.pages]
+
+        def fetch_listing_details(self, url):
+            fetched.append(url)
+            return url
+
+    results = {}
+
+    def run(name):
+        stages = tasks.ScrapeStages(
+            config, CountingCrawler(), session_factory=Session, search_name=name, registry=registry
+        )
+        results[name] = tasks.build_pipeline(stages, PipelineSettings()).run(["DEFAULT"])
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in ("sale", "rent")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(fetched) == sorted(FakeCrawler.pages)
+    emitted = sum(stats[0]["emitted"] for stats in results.values())
+    assert emitted == 3
+
+
+def test_load_config_searches(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(
+        json.dumps(
+            {
+                "search": {"max_price": 900000},
+                "max_pages": 2,
+                "searches": [
+                    {"name": "warsaw", "interval_minutes": 30},
+                    {
+                        "name": "krakow",
+                        "base_url": "https://www.otodom.pl/pl/oferty/sprzedaz/mieszkanie/krakow",
+                        "search": {"rooms": 2, "sorts": ["LATEST"]},
+                        "max_pages": 4,
+                    },
+                ],
+            }
+        )
+    )
+    config = load_config(path)
+    warsaw, krakow = config.searches
+    assert (warsaw.name, warsaw.interval_minutes, warsaw.search.max_price, warsaw.max_pages) == (
+        "warsaw",
+        30,
+        900000,
+        2,
+    )
+    assert krakow.base_url.endswith("/krakow")
+    assert (krakow.search.rooms, krakow.search.sorts, krakow.max_pages) == ([2], ["LATEST"], 4)
+
+    path.write_text(json.dumps({"search": {"max_price": 1}}))
+    (default,) = load_config(path).searches
+    assert (default.name, default.search.max_price) == ("default", 1)
+
+
+def test_claim_registry_canonicalizes_and_expires():
+    registry = ClaimRegistry(ttl=0.05)
+    assert registry.claim("https://otodom.pl/a/?x=1#top", "sale")
+    assert registry.claim("https://otodom.pl/a", "sale")
+    assert not registry.claim("https://OTODOM.pl/a", "rent")
+    assert registry.owner("https://otodom.pl/a") == "sale"
+    time.sleep(0.06)
+    assert registry.claim("https://otodom.pl/a", "rent")
+
+
+def test_checkpointed_run_resumes_where_it_stopped(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'otodom.db'}")
+    init_db(engine)
+    Session = sessionmaker(bind=engine)
+    calls = []
+
+    class RecordingCrawler(FakeCrawler):
+        pages = {
+            "https://otodom.pl/a": {"price": 1, "id": 1, "floor": "1", "title": "A"},
+            "https://otodom.pl/b": {"price": 2, "id": 2, "floor": "1", "title": "B"},
+            "https://otodom.pl/c": {"price": 3, "id": 3, "floor": "1", "title": "C"},
+            "https://otodom.pl/d": {"price": 4, "id": 4, "floor": "1", "title": "D"},
+        }
+
+        def iter_listings(self, max_pages=3, sort_by="DEFAULT"):
+            calls.append(sort_by)
+            return ["https://otodom.pl/d"]
+
+        def fetch_listing_details(self, url):
+            calls.append(url)
+            return url
+
+    # a run that was interrupted after discovering DEFAULT
+    checkpoint = RunCheckpoint.open("default", session_factory=Session)
+    for url in ("https://otodom.pl/a", "https://otodom.pl/b", "https://otodom.pl/c"):
+        checkpoint.record_url(url)
+    checkpoint.mark_sort_done("DEFAULT")
+    checkpoint.advance("https://otodom.pl/a", "fetched", payload={}, html="https://otodom.pl/a")
+    checkpoint.advance(
+        "https://otodom.pl/b",
+        "enriched",
+        payload={"title": "B", "price": 2, "external_id": 2, "is_new": True},
+    )
+
+    resumed = RunCheckpoint.open("default", session_factory=Session)
+    assert resumed.resumed and resumed.run_id == checkpoint.run_id
+    stages = tasks.ScrapeStages(Config(), RecordingCrawler(), session_factory=Session)
+    items = tasks.checkpoint_items(stages, resumed, ["DEFAULT", "LATEST"])
+    tasks.build_pipeline(stages, PipelineSettings(), checkpoint=resumed).run(items)
+    resumed.finish()
+
+    # a was not fetched again, b went straight to persist, DEFAULT was not re-crawled
+    assert sorted(calls) == ["LATEST", "https://otodom.pl/c", "https://otodom.pl/d"]
+    session = Session()
+    assert sorted(listing.title for listing in session.query(Listing)) == ["A", "B", "C", "D"]
+    states = {row.url: row.state for row in session.query(ScrapeRunUrl)}
+    assert set(states.values()) == {"notified"}
+    assert session.get(ScrapeRun, resumed.run_id).status == "finished"
+    assert not RunCheckpoint.open("default", session_factory=Session).resumed
+
+
+def test_listings_are_fetched_while_discovery_is_still_paging(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'otodom.db'}")
+    init_db(engine)
+    first_fetched = threading.Event()
+
+    class SlowPagingCrawler(FakeCrawler):
+        def iter_listings(self, max_pages=3, sort_by="DEFAULT"):
+            yield "https://otodom.pl/a"
+            # the next search page only "loads" after the first listing was fetched
+            assert first_fetched.wait(5), "first listing was not fetched before paging finished"
+            yield "https://otodom.pl/b"
+
+        def fetch_listing_details(self, url):
+            first_fetched.set()
+            return url
+
+    stages = tasks.ScrapeStages(Config(), SlowPagingCrawler(), session_factory=sessionmaker(bind=engine))
+    stats = {s["name"]: s for s in tasks.build_pipeline(stages, PipelineSettings()).run(["DEFAULT"])}
+    assert stats["discover"]["errors"] == 0
+    assert stats["notify"]["processed"] == 2
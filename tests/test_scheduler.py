@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta
+import threading
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from otodombot.config import Config, ScheduleSettings, SearchProfile
+from otodombot.db.models import Base, SearchRun
+from otodombot.scheduler.adaptive import (
+    AdaptiveScheduler,
+    choose_interval,
+    is_night,
+    update_arrival_rate,
+)
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.jobs = {}
+
+    def add_job(self, func, trigger, run_date, args, id, **kwargs):
+        self.jobs[id] = run_date
+
+
+def stats(new, seen=10):
+    return [{"name": "discover", "emitted": seen}, {"name": "notify", "processed": new}]
+
+
+def make_scheduler(run_search):
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    config = Config(
+        searches=[SearchProfile(name="warsaw", interval_minutes=60)],
+        schedule=ScheduleSettings(night_start=0, night_end=0, timezone="UTC"),
+    )
+    return AdaptiveScheduler(run_search, config, session_factory=Session, scheduler=FakeScheduler()), Session
+
+
+def test_choose_interval_follows_rate_and_night():
+    settings = ScheduleSettings(min_interval_minutes=10, max_interval_minutes=240, target_new_per_run=2)
+    assert choose_interval(None, 60, 12, settings) == 60
+    assert choose_interval(4.0, 60, 12, settings) == 30
+    assert choose_interval(100.0, 60, 12, settings) == 10
+    assert choose_interval(0.0, 60, 12, settings) == 240
+    assert choose_interval(4.0, 60, 2, settings) == 90
+    assert is_night(23, 23, 6) and is_night(5, 23, 6) and not is_night(6, 23, 6)
+
+
+def test_update_arrival_rate_is_ewma():
+    assert update_arrival_rate(None, 6, 2.0, 0.5) == 3.0
+    assert update_arrival_rate(3.0, 2, 2.0, 0.5) == 2.0
+
+
+def test_run_records_history_and_reschedules():
+    results = iter([stats(5), stats(4)])
+    scheduler, Session = make_scheduler(lambda name: next(results))
+
+    first = scheduler.run("warsaw")
+    assert first.next_interval_minutes == 60
+    assert first.arrival_rate is None
+
+    session = Session()
+    session.query(SearchRun).update({"started_at": datetime.utcnow() - timedelta(hours=2)})
+    session.commit()
+
+    second = scheduler.run("warsaw")
+    assert second.new_listings == 4
+    assert round(second.arrival_rate, 1) == 2.0
+    assert second.next_interval_minutes == 60
+    assert session.query(SearchRun).count() == 2
+    assert "search:warsaw" in scheduler.scheduler.jobs
+
+
+def test_overlapping_run_is_skipped():
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow(name):
+        started.set()
+        release.wait()
+        return stats(0)
+
+    scheduler, Session = make_scheduler(slow)
+    runner = threading.Thread(target=scheduler.run, args=("warsaw",))
+    runner.start()
+    started.wait()
+    assert scheduler.run("warsaw") is None
+    release.set()
+    runner.join()
+    assert Session().query(SearchRun).count() == 1
+
+
+def test_next_run_is_booked_when_recording_fails():
+    scheduler, Session = make_scheduler(lambda name: stats(1))
+
+    def locked_commit():
+        raise RuntimeError("database is locked")
+
+    def locked_session():
+        session = Session()
+        session.commit = locked_commit
+        return session
+
+    scheduler.session_factory = locked_session
+    before = datetime.utcnow()
+    assert scheduler.run("warsaw") is None
+    booked = scheduler.scheduler.jobs["search:warsaw"]
+    assert timedelta(minutes=59) < booked - before < timedelta(minutes=61)
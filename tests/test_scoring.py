@@ -0,0 +1,160 @@
+import math
+import threading
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from otodombot import backend
+from otodombot.config import Config, ScoringSettings, load_config
+from otodombot.db.database import init_db
+from otodombot.db.models import CommuteTime, Listing
+from otodombot.db.versioning import current_version
+from otodombot.scheduler import tasks
+from otodombot.evaluation.scoring import (
+    cell_ids,
+    compute_scores,
+    floor_number,
+    load_columns,
+    percentile_ranks,
+    update_scores,
+)
+
+
+def test_percentile_ranks_within_groups_with_ties_and_gaps():
+    values = np.array([10.0, 20.0, 20.0, 30.0, np.nan, 5.0, 7.0, 1.0])
+    groups = np.array([0, 0, 0, 0, 0, 1, 1, 2])
+    ranks = percentile_ranks(values, groups)
+    assert ranks[:4].tolist() == [0.0, 0.5, 0.5, 1.0]
+    assert math.isnan(ranks[4])
+    assert ranks[5:].tolist() == [0.0, 1.0, 0.5]
+
+
+def test_cell_ids_and_floor_numbers():
+    lat = np.array([52.201, 52.209, 52.301, np.nan])
+    lng = np.array([21.001, 21.009, 21.001, 21.0])
+    cells = cell_ids(lat, lng, 0.02)
+    assert cells[0] == cells[1] != cells[2] and cells[3] == -1
+    assert [floor_number(v) for v in ("parter", "3/6", "> 10", "suterena")] == [0.0, 3.0, 10.0, -1.0]
+    assert math.isnan(floor_number(None))
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    init_db(engine)
+    return sessionmaker(bind=engine)
+
+
+def add_listing(session, idx, price, area, lat=52.2, lng=21.0, minutes=30, build_year=2000):
+    listing = Listing(
+        url=f"https://otodom.pl/{idx}",
+        price=price,
+        area=area,
+        price_per_m2=price / area,
+        build_year=build_year,
+        floor="2/5",
+        lat=lat,
+        lng=lng,
+    )
+    session.add(listing)
+    session.flush()
+    session.add(CommuteTime(listing_id=listing.id, destination="Office", minutes=minutes))
+    return listing
+
+
+def test_price_per_m2_is_ranked_against_the_same_cell(session_factory):
+    session = session_factory()
+    # a cheap district and an expensive one; each flat is compared with its own
+    for i in range(5):
+        add_listing(session, f"a{i}", price=400_000 + i * 20_000, area=50, lat=52.15, lng=20.95)
+        add_listing(session, f"b{i}", price=900_000 + i * 20_000, area=50, lat=52.25, lng=21.05)
+    session.commit()
+    settings = ScoringSettings(weights={"price_per_m2": 1.0}, min_comparables=3)
+    scores = compute_scores(load_columns(session, ["Office"]), settings)
+    assert scores.tolist() == pytest.approx([100, 100, 75, 75, 50, 50, 25, 25, 0, 0])
+
+
+def test_update_scores_writes_only_new_and_changed_rows(session_factory):
+    session = session_factory()
+    for i in range(6):
+        add_listing(session, i, price=500_000 + i * 10_000, area=50, minutes=20 + i)
+    session.commit()
+    settings = ScoringSettings()
+
+    assert update_scores(session, settings, ["Office"]) == 6
+    version, _ = current_version(session)
+    assert update_scores(session, settings, ["Office"]) == 0
+    best = session.query(Listing).order_by(Listing.score.desc()).first()
+    assert best.url == "https://otodom.pl/0" and best.is_good and best.version == version
+
+    # a middling newcomer shifts nobody by more than the tolerance, but
+    # lifts listing 2 from 58 to 60.8, across good_score
+    add_listing(session, "new", price=525_000, area=50, minutes=22)
+    session.commit()
+    settings.tolerance = 20
+    assert update_scores(session, settings, ["Office"]) == 2
+    assert session.query(Listing).filter(Listing.score.is_(None)).count() == 0
+    second = session.query(Listing).filter_by(url="https://otodom.pl/2").one()
+    assert second.score == pytest.approx(60.83) and second.is_good
+
+    # a new good_score rewrites the flags even though no score moved
+    settings.good_score = 80
+    assert update_scores(session, settings, ["Office"]) == 2
+    assert [l.url for l in session.query(Listing).filter(Listing.is_good)] == ["https://otodom.pl/0"]
+
+
+def test_scoring_requested_while_running_gets_another_pass(session_factory, monkeypatch):
+    passes = []
+    entered = threading.Event()
+    release = threading.Event()
+
+    def slow_update(session, settings, pois):
+        passes.append(threading.current_thread().name)
+        if len(passes) == 1:
+            entered.set()
+            release.wait()
+        return 1
+
+    monkeypatch.setattr(tasks, "update_scores", slow_update)
+    config = Config()
+    first = threading.Thread(
+        target=tasks.update_listing_scores, args=(config, session_factory), name="first"
+    )
+    first.start()
+    entered.wait()
+    # a second search finishes while the first is scoring: it does not block
+    assert tasks.update_listing_scores(config, session_factory) == 0
+    release.set()
+    first.join()
+    assert passes == ["first", "first"]
+
+
+def test_listings_sorted_by_score(session_factory, monkeypatch):
+    monkeypatch.setattr(backend, "SessionLocal", session_factory)
+    session = session_factory()
+    for i in range(4):
+        add_listing(session, i, price=800_000 - i * 100_000, area=50)
+    session.commit()
+    update_scores(session, ScoringSettings(weights={"price_per_m2": 1.0}), ["Office"])
+    client = TestClient(backend.app)
+
+    listings = client.get("/listings", params={"sort": "score", "limit": 2}).json()
+    assert [l["url"] for l in listings] == ["https://otodom.pl/3", "https://otodom.pl/2"]
+    assert listings[0]["score"] == 100 and listings[0]["price_per_m2"] == 10_000
+    assert client.get("/listings", params={"sort": "score", "after_id": 1}).status_code == 400
+
+
+def test_load_config_scoring_weights(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text('{"scoring": {"weights": {"price_per_m2": 2, "commute": 1, "floor": 0}, "cell_size": 0.05}}')
+    scoring = load_config(path).scoring
+    assert scoring.weights == {"price_per_m2": 2.0, "commute": 1.0}
+    assert scoring.cell_size == 0.05
+    path.write_text('{"scoring": {"weights": {"balcony": 1}}}')
+    with pytest.raises(ValueError):
+        load_config(path)
+
@@ -0,0 +1,43 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from otodombot.db.database import init_db
+from otodombot.db.models import Listing
+from otodombot.db.search import ensure_search_index, index_listings, search_listings
+
+
+def make_session():
+    engine = create_engine("sqlite://")
+    init_db(engine)
+    return sessionmaker(bind=engine)()
+
+
+def test_search_folds_polish_diacritics_and_ranks_titles_first():
+    session = make_session()
+    in_description = Listing(url="u1", title="Mieszkanie", description="Duży balkon i miejsce w garażu")
+    in_title = Listing(url="u2", title="Balkon na Żółkiewskiego", description="Słoneczne")
+    other = Listing(url="u3", title="Kawalerka", description="Bez udogodnień")
+    session.add_all([in_description, in_title, other])
+    index_listings(session, [in_description, in_title, other])
+    session.commit()
+
+    assert [r["id"] for r in search_listings(session, "balkon")] == [in_title.id, in_description.id]
+    assert [r["id"] for r in search_listings(session, "garaz")] == [in_description.id]
+    assert [r["id"] for r in search_listings(session, "zolkiewskiego")] == [in_title.id]
+    assert [r["id"] for r in search_listings(session, "BALKON garaż")] == [in_description.id]
+    assert search_listings(session, "!!!") == []
+
+
+def test_reindexing_replaces_previous_text_and_rebuild_fills_missing_rows():
+    session = make_session()
+    listing = Listing(url="u1", title="Stary tytuł")
+    session.add(listing)
+    index_listings(session, [listing])
+    listing.title = "Nowy tytuł"
+    index_listings(session, [listing])
+    session.add(Listing(url="u2", title="Nowy dom"))
+    session.commit()
+    assert [r["id"] for r in search_listings(session, "stary")] == []
+
+    ensure_search_index(session.get_bind())
+    assert len(search_listings(session, "nowy")) == 2
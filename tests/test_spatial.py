@@ -0,0 +1,32 @@
+from otodombot.spatial import GridIndex, MapPoint
+
+
+def make_index():
+    points = [
+        MapPoint(1, 52.20, 21.00, 500, {"Office": 30}),
+        MapPoint(2, 52.2001, 21.0001, 400, {"Office": 40}),
+        MapPoint(3, 52.30, 21.05, 900, {"Office": None}),
+        MapPoint(4, 50.00, 19.90, 300, {}),
+    ]
+    return GridIndex(points, cell_size=0.05)
+
+
+def test_query_returns_points_in_bbox():
+    index = make_index()
+    assert sorted(p.id for p in index.query(52.1, 20.9, 52.35, 21.2)) == [1, 2, 3]
+    assert [p.id for p in index.query(49, 19, 51, 20)] == [4]
+
+
+def test_clusters_aggregate_count_price_and_commute():
+    index = make_index()
+    clusters = index.clusters(52.1, 20.9, 52.35, 21.2, zoom=14)
+    by_count = sorted(clusters, key=lambda c: c["count"])
+    assert [c["count"] for c in by_count] == [1, 2]
+    single, pair = by_count
+    assert single["id"] == 3
+    assert pair["id"] is None
+    assert pair["min_price"] == 400
+    assert pair["best_commute"] == {"Office": 30}
+
+    city = index.clusters(52.1, 20.9, 52.35, 21.2, zoom=5)
+    assert [c["count"] for c in city] == [3]
@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+from telegram.error import RetryAfter
+
+from otodombot.notifications.telegram_bot import DigestEntry, TelegramNotifier, build_digest
+
+
+class FakeBot:
+    def __init__(self, flood_once=False):
+        self.sent = []
+        self.flood_once = flood_once
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        if self.flood_once:
+            self.flood_once = False
+            raise RetryAfter(0)
+        self.sent.append((chat_id, text))
+        return text
+
+    async def send_media_group(self, chat_id, media):
+        self.sent.append((chat_id, media[0].caption))
+        return media
+
+
+def test_notifier_fans_out_to_all_chats():
+    bot = FakeBot()
+    notifier = TelegramNotifier("token", per_chat_interval=0, bot=bot)
+    futures = notifier.notify_listing(["1", "2", "3"], "hello")
+    for fut in futures:
+        assert fut.result(timeout=5) == "hello"
+    notifier.close()
+    assert sorted(cid for cid, _ in bot.sent) == ["1", "2", "3"]
+
+
+def test_notifier_retries_after_flood_limit():
+    bot = FakeBot(flood_once=True)
+    notifier = TelegramNotifier("token", per_chat_interval=0, bot=bot)
+    notifier.send_listing("1", "first")
+    notifier.send_listing("1", "second")
+    notifier.close()
+    assert bot.sent == [("1", "first"), ("1", "second")]
+
+
+def test_concurrent_first_sends_start_the_notifier_once():
+    bot = FakeBot()
+    notifier = TelegramNotifier("token", per_chat_interval=0, global_rate=0, bot=bot)
+    barrier = threading.Barrier(8)
+    futures = []
+
+    def send(i):
+        barrier.wait()
+        futures.append(notifier.send_listing(str(i), "hello"))
+
+    threads = [threading.Thread(target=send, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert [fut.result(timeout=5) for fut in futures] == ["hello"] * 8
+    notifier.close()
+
+
+def test_sending_after_close_fails_clearly():
+    notifier = TelegramNotifier("token", per_chat_interval=0, bot=FakeBot())
+    notifier.send_listing("1", "hello").result(timeout=5)
+    notifier.close()
+    with pytest.raises(RuntimeError, match="closed"):
+        notifier.send_listing("1", "again")
+    with pytest.raises(RuntimeError, match="closed"):
+        notifier.start()
+
+
+def test_build_digest_splits_long_summaries():
+    entries = [
+        DigestEntry(listing_id=i, title=f"Flat {i}", price=i, url=f"https://e/{i}", text=f"t{i}", photos=["p"])
+        for i in range(50)
+    ]
+    messages = build_digest(entries, order="price", top_n=2, max_length=500)
+    summaries = [text for text, photos in messages if not photos]
+    assert len(summaries) > 1
+    assert all(len(text) <= 500 for text in summaries)
+    assert messages[-2:] == [("t0", ["p"]), ("t1", ["p"])]